@@ -1,5 +1,9 @@
+from bisect import bisect_left
 from copy import copy
+from math import floor
+from heapq import heapify, heappop, heappush, heapreplace
 from table_util import find_shares_1d
+from division_rules import divisor_table
 
 def apportion1d(v_votes, num_total_seats, prior_allocations, divisor_gen,
                 threshold=0, v_max_left=[]):
@@ -12,38 +16,200 @@ def apportion1d(v_votes, num_total_seats, prior_allocations, divisor_gen,
         - divisor_gen: A divisor generator function, e.g. Sainte-Lague.
     Outputs:
         - allocations vector
-        - a tuple containing current divisors, divisor generators, and the
+        - a tuple containing current divisors, the divisor table, and the
           smallest used divided vote value.
     """
     v_votes = threshold_elimination_1d(v_votes, threshold)
     N = len(v_votes)
-    divisor_gens = [divisor_gen() for x in range(N)]
-    divisors = []
-    for n in range(N):
-        for i in range(prior_allocations[n]+1):
-            x = next(divisor_gens[n])
-        divisors.append(x)
+    table = divisor_table(divisor_gen,
+                          max([num_total_seats]+prior_allocations)+1)
 
+    allocations, last_in, _ = jump_and_step(v_votes, num_total_seats,
+                                            prior_allocations, table,
+                                            v_max_left)
+    if (last_in and last_in[0] == 0) or sum(allocations) < num_total_seats:
+        num_allocated = sum(prior_allocations) + sum(
+            allocations[i] - prior_allocations[i] for i in range(N)
+            if v_votes[i] != 0)
+        raise ValueError(f"No valid recipient of seat nr. {num_allocated+1}")
+    min_used = last_in[0] if last_in else 1000000
+    divisors = [table[allocations[n]] for n in range(N)]
+
+    return allocations, (divisors, table, min_used)
+
+def jump_and_step(v_votes, num_total_seats, prior_allocations, table,
+                  v_max_left=None):
+    """
+    Apportion seats by a divisor method as handing them out one at a time
+    would, each to the largest divided vote (ties going to the lowest
+    index), but without going through the seats one by one: first jump to
+    the allocation of a divisor estimated from the vote totals, then step
+    to the right number of seats, and swap seats until no divided vote left
+    out is larger than one used. The work depends on the number of parties,
+    not on the number of seats.
+    Inputs:
+        - v_votes: Vector of votes to base the apportionment on.
+        - num_total_seats: Total number of seats to allocate.
+        - prior_allocations: Prior allocations to each party.
+        - table: The divisor table, holding at least num_total_seats+1
+          divisors.
+        - v_max_left: Maximum number of further seats each party may get
+          (optional).
+    Outputs:
+        - allocations vector; fewer seats are allocated only if the parties
+          reach their maximum
+        - (divided vote, index) of the last seat allocated, or None
+        - (divided vote, index) of the first seat not allocated, or None
+    """
+    N = len(v_votes)
     allocations = copy(prior_allocations)
-    v_max_left = copy(v_max_left) if v_max_left else [num_total_seats]*N
-
-    num_allocated = sum(prior_allocations)
-    min_used = 1000000
-    while num_allocated < num_total_seats:
-        divided_votes = [float(v_votes[i])/divisors[i]
-                         if v_max_left[i]>0 else 0
-                         for i in range(N)]
-        maxvote = max(divided_votes)
-        if maxvote == 0:
-            raise ValueError(f"No valid recipient of seat nr. {num_allocated+1}")
-        min_used = maxvote
-        maxparty = divided_votes.index(maxvote)
-        divisors[maxparty] = next(divisor_gens[maxparty])
-        allocations[maxparty] += 1
+    limits = [prior_allocations[i] + v_max_left[i] for i in range(N)] \
+        if v_max_left else [num_total_seats]*N
+    num_allocated = 0
+    num_left = max(num_total_seats - sum(prior_allocations), 0)
+
+    # The seats handed out are ordered by key (-divided vote, index); a
+    #  party's seats come in order of its divisors.
+    def next_key(i):
+        if v_max_left and allocations[i] >= limits[i]:
+            return None
+        return (-(v_votes[i]*1.0/table[allocations[i]]), i)
+    def last_key(i):
+        if allocations[i] <= prior_allocations[i]:
+            return None
+        return (-(v_votes[i]*1.0/table[allocations[i]-1]), i)
+
+    # Jump: give each party the seats whose divided votes exceed a common
+    #  divisor, estimated from the vote totals (a party gets about
+    #  votes/divisor - table[0] + 1/2 seats) and adjusted until the number of
+    #  seats is about right. Only worth it if there are several seats per
+    #  party.
+    jumped = False
+    if num_left > 4*N:
+        total_votes = sum(v_votes[i] for i in range(N)
+                          if limits[i] > prior_allocations[i])
+        divisor = total_votes/(num_total_seats + N*(table[0]-0.5))
+        for attempt in range(4 if divisor > 0 else 0):
+            jumped = True
+            for i in range(N):
+                allocations[i] = max(prior_allocations[i], min(limits[i],
+                    bisect_left(table, v_votes[i]/divisor, 0,
+                                num_total_seats)))
+            num_allocated = sum(allocations) - sum(prior_allocations)
+            if abs(num_allocated - num_left) <= N//2:
+                break
+            divisor *= max(num_allocated, 1)/num_left
+
+    # Step: remove the last seats or add the next ones until the number is
+    #  right.
+    if num_allocated > num_left:
+        # Max-heap of the last seats, keyed on (divided vote, -index):
+        heap = [(-key[0], -key[1]) for key in map(last_key, range(N)) if key]
+        heapify(heap)
+        while num_allocated > num_left:
+            i = -heappop(heap)[1]
+            allocations[i] -= 1
+            num_allocated -= 1
+            key = last_key(i)
+            if key:
+                heappush(heap, (-key[0], -key[1]))
+    heap = [(-(v_votes[i]*1.0/table[allocations[i]]), i) for i in range(N)
+            if not v_max_left or allocations[i] < limits[i]]
+    heapify(heap)
+    last_in = None
+    while num_allocated < num_left and heap:
+        last_in = heappop(heap)
+        i = last_in[1]
+        allocations[i] += 1
         num_allocated += 1
-        v_max_left[maxparty] -= 1
+        if not v_max_left or allocations[i] < limits[i]:
+            heappush(heap, (-(v_votes[i]*1.0/table[allocations[i]]), i))
+    next_in = heap[0] if heap else None
+
+    # After a jump, the seats may still be out of order around the divisor:
+    #  swap them until no divided vote left out is larger than one used.
+    while jumped:
+        next_in = min(filter(None, map(next_key, range(N))), default=None)
+        last_in = max(filter(None, map(last_key, range(N))), default=None)
+        if next_in is None or last_in is None or next_in >= last_in:
+            break
+        allocations[last_in[1]] -= 1
+        allocations[next_in[1]] += 1
+
+    return (allocations,
+            (-last_in[0], last_in[1]) if last_in else None,
+            (-next_in[0], next_in[1]) if next_in else None)
+
+def largest_remainders(v_votes, num_total_seats, prior_allocations, quota):
+    """
+    Apportion seats by largest remainders as handing them out one at a time
+    would, each to the party with the most votes left over after taking a
+    quota for each seat it has (ties going to the lowest index), but without
+    going through the seats one by one: a party's values for its successive
+    seats drop by a quota each time, so the seats are ranked by the number
+    of whole quotas left and then by the remainder.
+    Inputs:
+        - v_votes: Vector of votes to base the apportionment on.
+        - num_total_seats: Total number of seats to allocate.
+        - prior_allocations: Prior allocations to each party.
+        - quota: The number of votes per seat.
+    Outputs:
+        - allocations vector
+        - (votes left over, index) of the last seat allocated, or None
+        - (votes left over, index) of the first seat not allocated
+    """
+    N = len(v_votes)
+    allocations = copy(prior_allocations)
+    num_left = max(num_total_seats - sum(prior_allocations), 0)
 
-    return allocations, (divisors, divisor_gens, min_used)
+    def next_key(i):
+        return (-(v_votes[i] - quota*allocations[i]), i)
+    def last_key(i):
+        if allocations[i] <= prior_allocations[i]:
+            return None
+        return (-(v_votes[i] - quota*(allocations[i]-1)), i)
+
+    if num_left > 0 and quota > 0:
+        # The seat a party gets after 'n' seats is at level
+        #  floor(votes/quota) - n, and all seats at a level come before all
+        #  seats at the level below. Find the lowest level reached, give all
+        #  seats above it, and the rest of the seats at that level in order
+        #  of remainder.
+        quotas = [floor(v_votes[i]/quota) for i in range(N)]
+        top = [quotas[i] - prior_allocations[i] for i in range(N)]
+        def seats_from(level):
+            return sum(t - level + 1 for t in top if t >= level)
+        lo, hi = min(top) - num_left//N - 1, max(top) + 1
+        while hi - lo > 1:
+            mid = (lo + hi)//2
+            if seats_from(mid) >= num_left:
+                lo = mid
+            else:
+                hi = mid
+        for i in range(N):
+            if top[i] > lo:
+                allocations[i] += top[i] - lo
+        at_level = sorted((-(v_votes[i] - quotas[i]*quota), i)
+                          for i in range(N) if top[i] >= lo)
+        for _, i in at_level[:num_left - seats_from(lo+1)]:
+            allocations[i] += 1
+    elif num_left > 0:
+        allocations[min(map(next_key, range(N)))[1]] += num_left
+
+    # Seats may be out of order where rounding puts a remainder at the
+    #  wrong level: swap them until no value left out is larger than one
+    #  used.
+    while True:
+        next_in = min(map(next_key, range(N)))
+        last_in = max(filter(None, map(last_key, range(N))), default=None)
+        if last_in is None or next_in >= last_in:
+            break
+        allocations[last_in[1]] -= 1
+        allocations[next_in[1]] += 1
+
+    return (allocations,
+            (-last_in[0], last_in[1]) if last_in else None,
+            (-next_in[0], next_in[1]))
 
 def apportion1d_general(
     v_votes,
@@ -73,22 +239,28 @@ def apportion1d_general(
     """
     N = len(v_votes)
     allocations = copy(prior_allocations) if prior_allocations else [0]*N
+    votes = threshold_elimination_1d(v_votes, threshold)
 
     seat_gen = seat_generator(
-        votes=threshold_elimination_1d(v_votes, threshold),
+        votes=votes,
         num_total_seats=num_total_seats,
         prior_allocations=copy(allocations),
         rule=rule,
         type_of_rule=type_of_rule
     )
 
-    last_in = None
-    gen = seat_gen()
-    while sum(allocations) < num_total_seats:
-        seat = next(gen)
-        allocations[seat["idx"]] += 1
-        last_in = seat
-    next_in_line = next(gen)
+    if type_of_rule == "Division":
+        table = divisor_table(rule, max([num_total_seats]+allocations)+1)
+        allocations, last_in, next_in = jump_and_step(
+            votes, num_total_seats, allocations, table)
+    else:
+        assert type_of_rule == "Quota"
+        allocations, last_in, next_in = largest_remainders(
+            votes, num_total_seats, allocations,
+            rule(sum(votes), num_total_seats))
+    last_in = {"idx": last_in[1], "active_votes": last_in[0]} \
+        if last_in else None
+    next_in_line = {"idx": next_in[1], "active_votes": next_in[0]}
 
     return allocations, seat_gen, last_in, next_in_line
 
@@ -134,19 +306,21 @@ def seat_generator_div(
     N = len(votes)
     assert N == len(prior_allocations)
     def seat_gen():
-        divisor_gens = [divisor_gen() for x in range(N)]
-        active_votes = [0]*N
-        for i in range(N):
-            for k in range(prior_allocations[i]):
-                next(divisor_gens[i])
-            active_votes[i] = votes[i]*1.0/next(divisor_gens[i])
+        allocations = copy(prior_allocations)
+        table = divisor_table(divisor_gen, max(allocations+[0])+1)
+        # Max-heap keyed on (-divided vote, index); ties go to the lowest index
+        heap = [(-(votes[i]*1.0/table[allocations[i]]), i) for i in range(N)]
+        heapify(heap)
         while True:
-            idx = active_votes.index(max(active_votes))
+            active_votes, idx = heap[0]
             yield {
                 "idx": idx,
-                "active_votes": active_votes[idx],
+                "active_votes": -active_votes,
             }
-            active_votes[idx] = votes[idx]*1.0/next(divisor_gens[idx])
+            allocations[idx] += 1
+            k = allocations[idx]
+            divisor = divisor_table(divisor_gen, k+1)[k]
+            heapreplace(heap, (-(votes[idx]*1.0/divisor), idx))
 
     return seat_gen
 
@@ -171,20 +345,22 @@ def seat_generator_quota(
     N = len(votes)
     assert N == len(prior_allocations)
 
-    total_votes = sum(votes)
-    quota = quota_rule(total_votes, num_total_seats)
-    for n in range(N):
-        votes[n] -= quota*prior_allocations[n]
+    quota = quota_rule(sum(votes), num_total_seats)
 
     def seat_gen():
-        active_votes = copy(votes)
+        allocations = copy(prior_allocations)
+        # Max-heap keyed on (-votes left over, index); ties go to the lowest
+        #  index
+        heap = [(-(votes[i] - quota*allocations[i]), i) for i in range(N)]
+        heapify(heap)
         while True:
-            idx = active_votes.index(max(active_votes))
+            active_votes, idx = heap[0]
             yield {
                 "idx": idx,
-                "active_votes": active_votes[idx],
+                "active_votes": -active_votes,
             }
-            active_votes[idx] -= quota
+            allocations[idx] += 1
+            heapreplace(heap, (-(votes[idx] - quota*allocations[idx]), idx))
 
     return seat_gen
 
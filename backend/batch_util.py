@@ -0,0 +1,274 @@
+#coding:utf-8
+"""
+Array counterparts of the apportionment primitives in apportion.py and
+table_util.py. Each function works on a batch of vote vectors or vote tables
+stacked along the first axis, and gives for every element of the batch
+exactly what the scalar function gives for that element on its own: the same
+floating point operations are performed in the same order, only on arrays.
+"""
+from math import log
+
+import numpy as np
+
+from division_rules import divisor_table
+
+DIVISOR_ARRAYS = {}
+
+def divisor_array(divisor_gen, size):
+    """
+    Fetch the divisor table of 'divisor_gen' as a NumPy array holding at least
+    'size' divisors.
+    """
+    array = DIVISOR_ARRAYS.get(divisor_gen)
+    if array is None or len(array) < size:
+        array = np.array(divisor_table(divisor_gen, size), dtype=float)
+        DIVISOR_ARRAYS[divisor_gen] = array
+    return array
+
+def seq_sum(a, axis=-1):
+    """
+    Sum along 'axis' from left to right, as the builtin sum() does.
+    (np.sum uses pairwise summation, which rounds differently.)
+    """
+    a = np.moveaxis(np.asarray(a), axis, 0)
+    if len(a) == 0:
+        return np.zeros(a.shape[1:], dtype=a.dtype)
+    s = a[0].copy()
+    for x in a[1:]:
+        s = s + x
+    return s
+
+def add_totals_batch(m):
+    """Add sums of rows and columns to each table in a batch."""
+    m = np.asarray(m)
+    nm = np.concatenate([m, seq_sum(m, -1)[..., None]], axis=-1)
+    return np.concatenate([nm, seq_sum(nm, -2)[..., None, :]], axis=-2)
+
+def find_xtd_shares_batch(xtd_tables):
+    totals = xtd_tables[..., -1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = xtd_tables / totals
+    return np.where(totals != 0, shares, 0.0)
+
+def above_threshold(v_votes, threshold):
+    """Mark the entries of 'v_votes' whose share of the total exceeds
+    'threshold' percent."""
+    s = seq_sum(v_votes, -1)[..., None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        shares = np.where(s != 0, v_votes / s, v_votes)
+    return shares*100 > threshold
+
+def threshold_elimination_batch(v_votes, threshold):
+    """Batch version of threshold_elimination_1d, along the last axis."""
+    return np.where(above_threshold(v_votes, threshold), v_votes, 0)
+
+def threshold_elimination_constituencies_batch(votes, threshold):
+    """Batch version of threshold_elimination_constituencies."""
+    keep = above_threshold(seq_sum(votes, -2), threshold)
+    return np.where(keep[..., None, :], votes, 0)
+
+def apportion1d_batch(v_votes, num_total_seats, prior_allocations,
+                      divisor_gen, threshold=0, v_max_left=None):
+    """
+    Batch version of apportion1d, apportioning seats to each row of
+    'v_votes' independently.
+    Inputs:
+        - v_votes: Array of vote vectors, one per row.
+        - num_total_seats: Total number of seats to allocate in each row.
+        - prior_allocations: Array of prior allocations.
+        - divisor_gen: A divisor generator function, e.g. Sainte-Lague.
+    Outputs:
+        - array of allocations
+        - array of current divisors
+        - vector of the smallest used divided vote value in each row
+        - boolean vector marking the rows where apportion1d would have
+          raised ValueError (no valid recipient of some seat)
+    """
+    v_votes = threshold_elimination_batch(v_votes, threshold)
+    M = len(v_votes)
+    rows = np.arange(M)
+    allocations = np.array(prior_allocations, dtype=int)
+    num_total_seats = np.broadcast_to(num_total_seats, (M,))
+    num_left = num_total_seats - allocations.sum(axis=1)
+    divisors = divisor_array(divisor_gen, 1 + max(
+        int(num_total_seats.max(initial=0)), int(allocations.max(initial=0))))
+    values = v_votes / divisors[allocations]
+    if v_max_left is not None:
+        v_max_left = np.array(v_max_left)
+        values[v_max_left <= 0] = 0
+    min_used = np.full(M, 1000000.0)
+    failed = np.zeros(M, dtype=bool)
+
+    for step in range(int(num_left.max(initial=0))):
+        active = rows[num_left > step]
+        idx = values[active].argmax(axis=1)
+        maxvote = values[active, idx]
+        failed[active[maxvote == 0]] = True
+        min_used[active] = maxvote
+        allocations[active, idx] += 1
+        values[active, idx] = (v_votes[active, idx]
+                               / divisors[allocations[active, idx]])
+        if v_max_left is not None:
+            v_max_left[active, idx] -= 1
+            exhausted = v_max_left[active, idx] <= 0
+            values[active[exhausted], idx[exhausted]] = 0
+
+    return allocations, divisors[allocations], min_used, failed
+
+
+def divisor_boundaries(v_votes, num_total_seats, prior_allocations,
+                       divisor_gen, allocate=True):
+    """
+    Apportion seats to each row of 'v_votes' as apportion1d would (without
+    threshold or seat limits), finding all the seats of a row at once: the
+    seats go to the largest of the divided votes each party would get for
+    its next seats, ties going to the lowest index, which is the order
+    apportion1d hands them out in.
+    Inputs:
+        - v_votes: Array of vote vectors, one per row.
+        - num_total_seats: Total number of seats to allocate in each row.
+        - prior_allocations: Array of prior allocations.
+        - divisor_gen: A divisor generator function, e.g. Sainte-Lague.
+        - allocate: Whether to find the allocations, or only the boundaries.
+    Outputs:
+        - array of allocations (None if not 'allocate')
+        - vector of the smallest used divided vote value in each row
+          (1000000 for rows where no seats are allocated, as in apportion1d)
+        - vector of the largest unused divided vote value in each row
+        - boolean vector marking the rows where apportion1d would have
+          raised ValueError (no valid recipient of some seat)
+    """
+    v_votes = np.asarray(v_votes, dtype=float)
+    M, N = v_votes.shape
+    priors = np.asarray(prior_allocations, dtype=int)
+    num_left = np.maximum(np.broadcast_to(num_total_seats, (M,))
+                          - priors.sum(axis=1), 0)
+    if N == 0:
+        return (priors.copy() if allocate else None, np.full(M, 1000000.0),
+                np.zeros(M), num_left > 0)
+    L = int(num_left.max(initial=0))
+    divisors = divisor_array(divisor_gen, int(priors.max(initial=0)) + L + 1)
+    # The divided votes of each party for its next L+1 seats, the last of
+    #  which is never used; only the L+1 largest of them need to be ranked.
+    values = v_votes[:, :, None] / divisors[priors[:, :, None] + np.arange(L+1)]
+    flat = values.reshape(M, N*(L+1))
+    if N > 1:
+        flat = np.partition(flat, (N-1)*(L+1), axis=1)[:, (N-1)*(L+1):]
+    ranked = np.sort(flat, axis=1)[:, ::-1]
+    rows = np.arange(M)
+    min_used = np.where(num_left > 0, ranked[rows, num_left-1], 1000000.0)
+    max_unused = ranked[rows, num_left]
+    failed = (num_left > 0) & (min_used == 0)
+    if not allocate:
+        return None, min_used, max_unused, failed
+
+    threshold = np.where(num_left > 0, min_used, np.inf)[:, None, None]
+    above = (values > threshold).sum(axis=2)
+    tied = (values == threshold).any(axis=2)
+    ties_won = num_left - above.sum(axis=1)
+    tied &= np.cumsum(tied, axis=1) <= ties_won[:, None]
+    return priors + above + tied, min_used, max_unused, failed
+
+class SeatGeneratorBatch:
+    """
+    Batch version of the seat generators in apportion.py: a sequence of
+    seats for each row of 'votes', starting from 'prior_allocations', drawn
+    in lockstep.
+    """
+    def __init__(self, votes, num_total_seats, prior_allocations, rule,
+                 type_of_rule):
+        self.allocations = np.array(prior_allocations, dtype=int)
+        self.votes = votes
+        if type_of_rule == "Division":
+            self.divisors = divisor_array(rule,
+                int(self.allocations.max(initial=0)) + num_total_seats + 1)
+            self.active_votes = self.votes*1.0 / self.divisors[self.allocations]
+        else:
+            assert type_of_rule == "Quota"
+            self.divisors = None
+            total_votes = seq_sum(votes, -1)
+            self.quota = rule(total_votes, num_total_seats)[:, None]
+            self.active_votes = votes - self.quota*self.allocations
+
+    def next(self, rows, excluded=None):
+        """
+        Draw the next seat for each of 'rows', skipping parties marked in
+        'excluded'. Returns the recipients and the vote values used.
+        """
+        active_votes = self.active_votes[rows]
+        if excluded is not None:
+            active_votes = np.where(excluded, -np.inf, active_votes)
+        idx = active_votes.argmax(axis=1)
+        used = active_votes[np.arange(len(rows)), idx]
+        self.allocations[rows, idx] += 1
+        if self.divisors is None:
+            self.active_votes[rows, idx] = (self.votes[rows, idx]
+                - self.quota[rows, 0]*self.allocations[rows, idx])
+        else:
+            self.active_votes[rows, idx] = (self.votes[rows, idx]*1.0
+                / self.divisors[self.allocations[rows, idx]])
+        return idx, used
+
+def apportion1d_general_batch(v_votes, num_total_seats, prior_allocations,
+                              rule, type_of_rule, threshold=0):
+    """
+    Batch version of apportion1d_general. Returns the allocations, a factory
+    for fresh seat generators starting from 'prior_allocations' (the
+    counterpart of seat_gen), and the vote values of the last seats
+    allocated.
+    """
+    K, N = v_votes.shape
+    if prior_allocations is None:
+        prior_allocations = np.zeros((K, N), dtype=int)
+    votes = threshold_elimination_batch(v_votes, threshold)
+
+    def seat_gen():
+        return SeatGeneratorBatch(votes, num_total_seats, prior_allocations,
+                                  rule, type_of_rule)
+
+    gen = seat_gen()
+    rows = np.arange(K)
+    last_in = np.zeros(K)
+    num_left = num_total_seats - gen.allocations.sum(axis=1)
+    for step in range(int(num_left.max(initial=0))):
+        active = rows[num_left > step]
+        _, last_in[active] = gen.next(active)
+
+    return gen.allocations, seat_gen, last_in
+
+def entropy_batch(votes, allocations, divisor_gen):
+    """
+    Batch version of table_util.entropy. Also returns a boolean vector
+    marking the tables where entropy() would have raised ValueError (a seat
+    allocated to a list without votes).
+    """
+    divisors = divisor_table(divisor_gen, int(allocations.max(initial=0)))
+    K = len(votes)
+    entropies = np.zeros(K)
+    failed = np.zeros(K, dtype=bool)
+    for k in range(K):
+        e = 0
+        try:
+            for v, a in zip(votes[k].ravel().tolist(),
+                            allocations[k].ravel().tolist()):
+                for i in range(a):
+                    e += log(v/divisors[i])
+        except ValueError:
+            failed[k] = True
+        entropies[k] = e
+    return entropies, failed
+
+def rounds_to(x, value, digits=5):
+    """
+    Elementwise round(x, digits) == value, with the exact semantics of the
+    builtin round(). Only the entries close to the rounding boundary are
+    passed through round() itself.
+    """
+    x = np.asarray(x, dtype=float)
+    half = 0.5*10**-digits
+    distance = np.abs(x - value)
+    result = distance < half*(1-1e-6)
+    unsure = ~result & (distance < half*(1+1e-6))
+    for i in zip(*np.nonzero(unsure)):
+        result[i] = round(float(x[i]), digits) == value
+    return result
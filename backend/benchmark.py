@@ -0,0 +1,135 @@
+#coding:utf-8
+"""
+Benchmarks for the performance critical parts of the backend.
+
+Run with:
+    python benchmark.py
+"""
+import io
+import random
+import timeit
+from copy import copy
+
+import util
+import simulate
+from apportion import apportion1d
+from division_rules import dhondt_gen
+from electionRules import ElectionRules
+from voting import Election
+
+TABLES = {
+    "Iceland 2017": ("../data/elections/iceland_2017_hagstofan.csv", "utf-8"),
+    "Finland 2015": ("../data/elections/finland_2015.csv", "latin-1"),
+}
+
+def load_table(filename, encoding):
+    """Load a vote table from one of the bundled data files."""
+    with io.open(filename, mode="r", newline='', encoding=encoding) as f:
+        stream = io.StringIO(f.read())
+    return util.load_votes_from_stream(stream, filename)
+
+def apportion1d_linear(v_votes, num_total_seats, prior_allocations,
+                       divisor_gen):
+    """Reference seat-by-seat apportionment using a linear scan per seat."""
+    N = len(v_votes)
+    divisor_gens = [divisor_gen() for x in range(N)]
+    divisors = []
+    for n in range(N):
+        for i in range(prior_allocations[n]+1):
+            x = next(divisor_gens[n])
+        divisors.append(x)
+    allocations = copy(prior_allocations)
+    num_allocated = sum(prior_allocations)
+    while num_allocated < num_total_seats:
+        divided_votes = [float(v_votes[i])/divisors[i] for i in range(N)]
+        maxparty = divided_votes.index(max(divided_votes))
+        divisors[maxparty] = next(divisor_gens[maxparty])
+        allocations[maxparty] += 1
+        num_allocated += 1
+    return allocations
+
+def report(name, reference, candidate, number):
+    t_ref = min(timeit.repeat(reference, number=number, repeat=3))
+    t_new = min(timeit.repeat(candidate, number=number, repeat=3))
+    print(f"  {name:<40} {1e6*t_ref/number:9.1f} us "
+          f"{1e6*t_new/number:9.1f} us {t_ref/t_new:6.2f}x")
+
+def bench_apportion(number=2000):
+    """National and constituency passes of one-dimensional apportionment."""
+    print("Apportionment (linear scan vs. jump-and-step)")
+    for name, (filename, encoding) in TABLES.items():
+        table = load_table(filename, encoding)
+        votes = table["votes"]
+        v_votes = [sum(x) for x in zip(*votes)]
+        total_seats = sum(const["num_const_seats"] + const["num_adj_seats"]
+                          for const in table["constituencies"])
+        priors = [0]*len(v_votes)
+        report(f"{name}: national ({total_seats} seats)",
+            lambda: apportion1d_linear(v_votes, total_seats, priors, dhondt_gen),
+            lambda: apportion1d(v_votes, total_seats, priors, dhondt_gen),
+            number)
+        const_seats = [const["num_const_seats"]
+                       for const in table["constituencies"]]
+        report(f"{name}: constituencies ({sum(const_seats)} seats)",
+            lambda: [apportion1d_linear(v, n, [0]*len(v), dhondt_gen)
+                     for v, n in zip(votes, const_seats)],
+            lambda: [apportion1d(v, n, [0]*len(v), dhondt_gen)
+                     for v, n in zip(votes, const_seats)],
+            number)
+
+def bench_simulation(count=200, batch_size=100):
+    """Simulated elections per second, one at a time vs. in batches."""
+    print(f"Simulation ({count} simulations, batches of {batch_size})")
+    # (The Finnish table has no adjustment seats, so no simulated election
+    #  of it admits a solution under the default rules.)
+    for name in ["Iceland 2017"]:
+        table = load_table(*TABLES[name])
+        rules = ElectionRules()
+        rules["constituencies"] = table["constituencies"]
+        rates = []
+        for size in [1, batch_size]:
+            sim_rules = simulate.SimulationRules()
+            sim_rules["simulation_count"] = count
+            sim_rules["batch_size"] = size
+            sim = simulate.Simulation(sim_rules, [rules], table)
+            random.seed(1)
+            rates.append(count/timeit.timeit(sim.simulate, number=1))
+        print(f"  {name:<40} {rates[0]:9.1f}/s  {rates[1]:9.1f}/s "
+              f"{rates[1]/rates[0]:6.2f}x")
+
+def bench_processes(count=400, num_workers=4):
+    """Simulated elections per second, in one process vs. in several."""
+    print(f"Simulation ({count} simulations, {num_workers} workers)")
+    for name in ["Iceland 2017"]:
+        table = load_table(*TABLES[name])
+        rules = ElectionRules()
+        rules["constituencies"] = table["constituencies"]
+        rates = []
+        for workers in [1, num_workers]:
+            sim_rules = simulate.SimulationRules()
+            sim_rules["simulation_count"] = count
+            sim_rules["num_workers"] = workers
+            sim = simulate.Simulation(sim_rules, [rules], table)
+            random.seed(1)
+            rates.append(count/timeit.timeit(sim.simulate, number=1))
+        print(f"  {name:<40} {rates[0]:9.1f}/s  {rates[1]:9.1f}/s "
+              f"{rates[1]/rates[0]:6.2f}x")
+
+def bench_methods(methods=("monge",), number=20):
+    """Time per election of the given adjustment methods."""
+    print("Adjustment methods (time per election)")
+    table = load_table(*TABLES["Iceland 2017"])
+    for method in methods:
+        rules = ElectionRules()
+        rules["constituencies"] = table["constituencies"]
+        rules["parties"] = table["parties"]
+        rules["adjustment_method"] = method
+        election = Election(rules, table["votes"])
+        t = min(timeit.repeat(election.run, number=number, repeat=3))
+        print(f"  {method:<40} {1e3*t/number:9.2f} ms")
+
+if __name__ == "__main__":
+    bench_apportion()
+    bench_methods()
+    bench_simulation()
+    bench_processes()
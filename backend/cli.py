@@ -7,6 +7,7 @@ import tabulate
 
 import voting
 import simulate as sim
+import dictionaries
 import util
 import web
 
@@ -36,9 +37,16 @@ def cli(debug):
 @click.option('--simulation-count', type=click.INT, default=10000,
                 help='Number of simulations to run')
 @click.option('--gen-method',
-                type=click.Choice(sim.GENERATING_METHODS.keys()),
+                type=click.Choice(dictionaries.GENERATING_METHODS.keys()),
                 default="beta", help='Method to generate votes')
 @click.option('--var-param', type=click.FLOAT, default=0.1)
+@click.option('--num-workers', type=click.INT, default=1,
+                help='Number of processes to run the simulations in')
+@click.option('--warm-start', default=False, is_flag=True,
+                help='Start alternating scaling from the previous round')
+@click.option('--opt-method', default="alternating-scaling",
+                type=click.Choice(dictionaries.OPT_METHODS),
+                help='Method of the optimal allocation to compare with')
 @click.option('--to-xlsx', type=click.STRING,
                 help='Filename to write information to an xlsx file')
 @click.option('--show-details', default=False, is_flag=True)
@@ -46,8 +54,10 @@ def simulate(votes, constituencies, **kwargs):
     """Simulate elections."""
     e_rules = voting.ElectionRules()
     e_rules["constituencies"] = constituencies
+    votes_file = votes
     parties, votes = util.load_votes(votes, e_rules["constituencies"])
     e_rules["parties"] = parties
+    opt_method = kwargs.pop("opt_method")
     s_rules = sim.SimulationRules()
 
     try:
@@ -58,15 +68,47 @@ def simulate(votes, constituencies, **kwargs):
         s_rules[arg] = val
 
     e_rules = util.sim_election_rules(e_rules, s_rules["test_method"])
+    e_rules["opt_method"] = opt_method
 
-    simulation = sim.Simulation(s_rules, [e_rules], votes)
+    vote_table = {
+        "name": votes_file,
+        "parties": parties,
+        "votes": [[int(v) for v in row] for row in votes],
+        "constituencies": e_rules["constituencies"],
+    }
+    simulation = sim.Simulation(s_rules, [e_rules], vote_table)
 
     simulation.simulate()
 
     if s_rules["show_details"]:
         util.print_simulation(simulation)
     if s_rules["to_xlsx"]:
-        util.simulation_to_xlsx(simulation, s_rules["to_xlsx"])
+        simulation.to_xlsx(s_rules["to_xlsx"])
+
+@cli.command()
+@click.option('--votes', required=True, type=click.Path(exists=True),
+                help='File with vote data')
+@click.option('--constituencies', required=True, type=click.Path(exists=True),
+                help='File with constituency data')
+@click.option('--test-method', required=True, type=click.STRING,
+                help='The method to be tested')
+@click.option('--num-workers', type=click.INT, default=1,
+                help='Number of processes to probe the lists in')
+@click.option('--output', default='simple',
+              type=click.Choice(tabulate.tabulate_formats))
+def votes_to_change(votes, constituencies, test_method, num_workers, output):
+    """Find how many more votes each list needs to change the results."""
+    rules = voting.ElectionRules()
+    rules["constituencies"] = constituencies
+    parties, votes = util.load_votes(votes, rules["constituencies"])
+    rules["parties"] = parties
+    rules = util.sim_election_rules(rules, test_method)
+    rules["output"] = output
+
+    election = voting.Election(rules, [[int(v) for v in row] for row in votes])
+    election.run()
+    util.print_votes_to_change(
+        election, sim.votes_to_change(election, num_workers))
 
 @cli.command()
 @click.argument('rules', required=True,
@@ -4,8 +4,10 @@ from division_rules import dhondt_gen, sainte_lague_gen, \
 from division_rules import droop, hare
 
 from methods.var_alt_scal import var_alt_scal
-from methods.alternating_scaling import alternating_scaling
-from methods.icelandic_law import icelandic_apportionment
+from methods.alternating_scaling import alternating_scaling, \
+    alternating_scaling_batch
+from methods.icelandic_law import icelandic_apportionment, \
+    icelandic_apportionment_batch
 from methods.icelandic_law_based_on_shares import icelandic_share_apportionment
 from methods.monge import monge
 from methods.nearest_neighbor import nearest_neighbor
@@ -16,8 +18,9 @@ from methods.norwegian_icelandic import norw_ice_apportionment
 from methods.pure_vote_ratios import pure_vote_ratios_apportionment
 from methods.opt_entropy import opt_entropy
 from methods.switching import switching
+from methods.tie_and_transfer import tie_and_transfer
 
-from distributions.beta_distribution import beta_distribution
+from distributions.beta_distribution import BetaGenerator
 
 DIVIDER_RULES = {
     "dhondt": dhondt_gen,
@@ -64,6 +67,16 @@ ADJUSTMENT_METHODS = {
     "opt-entropy": opt_entropy,
     "switching": switching,
     "pure-vote-ratios": pure_vote_ratios_apportionment,
+    "tie-and-transfer": tie_and_transfer,
+}
+# Methods giving the biproportional allocation, which the "opt" comparison
+#  rules (see ElectionRules.generate_opt_ruleset) may use:
+OPT_METHODS = ["alternating-scaling", "tie-and-transfer", "opt-entropy"]
+# Array versions of adjustment methods, used by voting.BatchElection.
+# Methods not listed here are run one election at a time.
+BATCH_ADJUSTMENT_METHODS = {
+    "alternating-scaling": alternating_scaling_batch,
+    "icelandic-law": icelandic_apportionment_batch,
 }
 ADJUSTMENT_METHOD_NAMES = {
     "alternating-scaling": "Optimal method (Alternating-Scaling)",
@@ -76,11 +89,13 @@ ADJUSTMENT_METHOD_NAMES = {
     "norwegian-law": "Norwegian law",
     "norwegian-icelandic": "Norwegian-Icelandic variant",
     "switching": "Switching Method",
-    "pure-vote-ratios": "Pure Vote Ratios"
+    "pure-vote-ratios": "Pure Vote Ratios",
+    "tie-and-transfer": "Optimal method (Tie-and-Transfer)",
+    "opt-entropy": "Optimal method (Maximum entropy)",
 }
 
 GENERATING_METHODS = {
-    "beta": beta_distribution
+    "beta": BetaGenerator
 }
 GENERATING_METHOD_NAMES = {
     "beta": "Beta distribution"
@@ -1,6 +1,8 @@
 
 from random import betavariate
 
+import numpy as np
+
 from table_util import add_totals, find_xtd_shares
 
 
@@ -56,3 +58,46 @@ def beta_params(mean, stability_parameter):
     assert alpha>1
     assert beta>1
     return alpha, beta
+
+
+class BetaGenerator:
+    """
+    Generator of sets of votes with beta distribution, using 'base_votes' as
+    reference, as beta_distribution generates them one at a time.
+
+    The parameters of the distribution of each entry are computed once, and
+    votes are drawn in blocks with a NumPy random generator of its own,
+    seeded with 'seed' and 'stream': generators with the same seed and
+    stream give the same votes, and different streams of the same seed give
+    independent ones.
+    """
+    block_size = 100
+
+    def __init__(self, base_votes, stbl_param, seed=None, stream=0):
+        assert 1<stbl_param
+        xtd_votes = add_totals(base_votes)
+        shares = np.array(find_xtd_shares(xtd_votes))[:-1, :-1]
+        self.totals = np.array(xtd_votes)[:-1, -1:]
+        assert ((0 <= shares) & (shares <= 1)).all()
+        self.random = (shares > 0) & (shares < 1)
+        self.shares = shares
+        mean = np.where(self.random, shares, 0.5)
+        lower_mean = np.where(mean <= 0.5, mean, 1-mean)
+        weight = (1 + 1.0/lower_mean)*stbl_param - 1
+        self.alpha = mean*weight
+        self.beta = (1-mean)*weight
+        self.rng = np.random.default_rng(
+            np.random.SeedSequence(seed, spawn_key=(stream,)))
+
+    def draw(self, K):
+        """Draw K sets of votes, as an array of shape (K, C, P)."""
+        shares = self.rng.beta(self.alpha, self.beta,
+                               size=(K,) + self.alpha.shape)
+        shares = np.where(self.random, shares, self.shares)
+        return (shares*self.totals).astype(int)
+
+    def __iter__(self):
+        """Draw sets of votes one at a time, as lists of lists."""
+        while True:
+            for votes in self.draw(self.block_size).tolist():
+                yield votes
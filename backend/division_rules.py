@@ -1,5 +1,6 @@
 
 import math
+import threading
 
 def dhondt_gen():
     """Generate a d'Hondt divider sequence: 1, 2, 3..."""
@@ -52,3 +53,39 @@ def droop(total_votes, total_seats):
 
 def hare(total_votes, total_seats):
     return total_votes/total_seats
+
+
+# Divisor tables:
+
+class DivisorTable(list):
+    """
+    The sequence of divisors produced by a divisor generator, stored in a
+    list so that the k-th divisor (k seats already allocated) can be looked up
+    in O(1) instead of replaying the generator k times. The values are taken
+    from the generator itself, so they are identical to what it yields.
+    """
+    def __init__(self, divisor_gen):
+        super(DivisorTable, self).__init__()
+        self.gen = divisor_gen()
+        self.lock = threading.Lock()
+
+    def extend_to(self, size):
+        """Make sure the table holds at least 'size' divisors."""
+        with self.lock:
+            while len(self) < size:
+                self.append(next(self.gen))
+        return self
+
+DIVISOR_TABLES = {}
+
+def divisor_table(divisor_gen, size):
+    """
+    Fetch the cached divisor table for a divisor generator, e.g. dhondt_gen,
+    holding at least 'size' divisors.
+    """
+    table = DIVISOR_TABLES.get(divisor_gen)
+    if table is None:
+        table = DIVISOR_TABLES.setdefault(divisor_gen, DivisorTable(divisor_gen))
+    if len(table) < size:
+        table.extend_to(size)
+    return table
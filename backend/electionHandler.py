@@ -20,9 +20,15 @@ class ElectionHandler:
         self.num_parties = len(self.parties)
         self.constituencies = self.vote_table["constituencies"]
         self.num_constituencies = len(self.constituencies)
+        self.elections = None
         self.set_votes(self.vote_table["votes"])
 
     def set_votes(self, votes):
+        """
+        Run the elections on 'votes'. The rulesets and Election objects are
+        prepared the first time; after that only the votes are swapped, so
+        that re-running on new votes (as simulations do) is cheap.
+        """
         assert len(votes) == self.num_constituencies, (
             "Vote_table does not match constituency list.")
         assert all(len(row) == self.num_parties for row in votes), (
@@ -31,17 +37,25 @@ class ElectionHandler:
         self.votes = votes
         self.xtd_votes = add_totals(self.votes)
 
-        self._setup_elections()
+        if self.elections is None:
+            self._setup_elections()
+        else:
+            self._update_votes()
         self.run_elections()
         self.check_solvability()
 
+    def _election_votes(self, rules):
+        """The votes an election by 'rules' is run on."""
+        if rules["seat_spec_option"] == "one_const":
+            return [self.xtd_votes[-1][:-1]]
+        return self.votes
+
     def _setup_elections(self):
         self.elections = []
         for electoral_system in self.election_rules_list:
             rules = ElectionRules()
             rules.update(electoral_system)
             rules["parties"] = self.parties
-            votes = self.votes
             option = electoral_system["seat_spec_option"]
             if option == "refer":
                 rules["constituencies"] = self.constituencies
@@ -53,8 +67,6 @@ class ElectionHandler:
                 rules = rules.generate_all_adj_ruleset()
             elif option == "one_const":
                 rules = rules.generate_one_const_ruleset()
-                total_votes = self.xtd_votes[-1][:-1]
-                votes = [total_votes]
             else:
                 assert option == "custom", (
                     f"unexpected seat_spec_option encountered: {option}")
@@ -66,9 +78,13 @@ class ElectionHandler:
                             match = modified_const
                             break
                     rules["constituencies"].append(match)
-            election = Election(rules, votes, self.name)
+            election = Election(rules, self._election_votes(rules), self.name)
             self.elections.append(election)
 
+    def _update_votes(self):
+        for election in self.elections:
+            election.set_votes(self._election_votes(election.rules))
+
     def run_elections(self):
         for election in self.elections:
             election.run()
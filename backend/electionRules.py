@@ -5,7 +5,7 @@ from copy import copy, deepcopy
 from rules import Rules
 from util import load_constituencies
 from dictionaries import DIVIDER_RULES, QUOTA_RULES, RULE_NAMES, ADJUSTMENT_METHODS
-from dictionaries import SEAT_SPECIFICATION_OPTIONS
+from dictionaries import SEAT_SPECIFICATION_OPTIONS, OPT_METHODS
 
 class ElectionRules(Rules):
     """A set of rules for an election to follow."""
@@ -18,6 +18,7 @@ class ElectionRules(Rules):
             "adj_alloc_divider": DIVIDER_RULES.keys(),
             "adjustment_method": ADJUSTMENT_METHODS.keys(),
             "seat_spec_option": SEAT_SPECIFICATION_OPTIONS.keys(),
+            "opt_method": OPT_METHODS,
         }
         self.range_rules = {
             "adjustment_threshold": [0, 100],
@@ -39,12 +40,28 @@ class ElectionRules(Rules):
         self["seat_spec_option"] = "refer"
         self["constituencies"] = []
         self["parties"] = []
+        # Method of the optimal allocation the results are compared with:
+        self["opt_method"] = "alternating-scaling"
 
         # Display rules
         self["debug"] = False
         self["show_entropy"] = False
         self["output"] = "simple"
 
+    # Rules that have no bearing on the outcome of an election:
+    DISPLAY_RULES = {"name", "seat_spec_option", "debug", "show_entropy",
+                     "output", "opt_method"}
+
+    def canonical_key(self):
+        """
+        A hashable key that is the same for any two rulesets that give the
+        same results on the same votes, whatever they are called.
+        """
+        return json.dumps(
+            {key: value for key, value in self.items()
+             if key not in self.DISPLAY_RULES},
+            sort_keys=True, default=str)
+
     def __setitem__(self, key, value):
         if key == "constituencies" and type(value) == str:
             value = load_constituencies(value)
@@ -95,7 +112,7 @@ class ElectionRules(Rules):
     def generate_opt_ruleset(self):
         ref_rs = ElectionRules()
         ref_rs.update(self)
-        ref_rs["adjustment_method"] = "alternating-scaling"
+        ref_rs["adjustment_method"] = self["opt_method"]
         return ref_rs
 
     def generate_law_ruleset(self):
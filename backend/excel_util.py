@@ -541,6 +541,18 @@ def simulation_to_xlsx(simulation, filename):
             }
         )
 
+    stage_times = simulation.profile.as_dict()
+    if stage_times:
+        worksheet = workbook.add_worksheet("Timing")
+        worksheet.write(0, 0, "Time spent in each stage", fmt["h"])
+        worksheet.write_row(1, 1, ["Count", "Total (s)", "Average (s)"],
+            fmt["basic_h"])
+        worksheet.write_column(2, 0, list(stage_times.keys()), fmt["basic_h"])
+        write_matrix(worksheet, 2, 1, [
+            [times["cnt"], times["sum"], times["avg"]]
+            for times in stage_times.values()
+        ], fmt["cell"])
+
     workbook.close()
 
 def save_votes_to_xlsx(matrix, filename):
@@ -1,10 +1,95 @@
-from apportion import apportion1d
-from copy import deepcopy
+from batch_util import divisor_boundaries, rounds_to
+from math import inf
+import numpy as np
+
+
+class ScalingState:
+    """
+    Multipliers alternating scaling converged to, kept so that it can start
+    from them on the next, similar, vote table (e.g. in a simulation) and
+    converge in fewer sweeps, together with the number of times it has run
+    and the total number of sweeps it took. With 'warm_start' off, it only
+    counts.
+    """
+    def __init__(self, warm_start=True):
+        self.warm_start = warm_start
+        self.const_multipliers = None
+        self.party_multipliers = None
+        self.runs = 0
+        self.sweeps = 0
+
+    def start(self, num_constituencies, num_parties):
+        """
+        Multipliers to start from for a table of the given shape, or None if
+        there are none. Those that are not positive and finite (e.g. of a
+        party that got no votes after threshold elimination last time) start
+        from 1 again.
+        """
+        if (self.warm_start and self.const_multipliers is not None
+                and len(self.const_multipliers) == num_constituencies
+                and len(self.party_multipliers) == num_parties):
+            return ([x if 0 < x < inf else 1 for x in self.const_multipliers],
+                    [x if 0 < x < inf else 1 for x in self.party_multipliers])
+        return None
+
+    def record(self, runs, sweeps, const_multipliers=None,
+               party_multipliers=None):
+        """
+        Count 'runs' more runs taking 'sweeps' sweeps in total, and keep the
+        multipliers the last one converged to (None: it did not converge).
+        """
+        self.runs += runs
+        self.sweeps += sweeps
+        self.const_multipliers = const_multipliers
+        self.party_multipliers = party_multipliers
+
+    def merge(self, other):
+        """Add the runs and sweeps counted by another state."""
+        self.runs += other.runs
+        self.sweeps += other.sweeps
+
+    def as_dict(self):
+        return {
+            "runs": self.runs,
+            "sweeps": self.sweeps,
+            "avg": self.sweeps/self.runs if self.runs else 0,
+        }
+
+
+def scaled_votes(votes, const_multipliers, party_multipliers):
+    """
+    Votes divided by the multipliers of their constituency and party, for a
+    table or a stack of tables.
+    """
+    # See IV.3.5 in paper:
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        d = party_multipliers[..., None, :]*const_multipliers[..., :, None]
+        return np.where(d != 0, votes/d, 0.0)
+
+def scaling_step(v_scaled_votes, num_total_seats, v_priors, divisor_gen,
+                 allocate=False):
+    """
+    Find the multiplier putting the divisor boundary of each row of
+    'v_scaled_votes' halfway between the smallest divided vote used and the
+    largest one unused.
+    Outputs:
+        - vector of multipliers
+        - array of allocations (if 'allocate')
+        - boolean vector marking the rows where apportion1d would fail
+    """
+    alloc, minval, maxval, failed = divisor_boundaries(
+        v_scaled_votes, num_total_seats, v_priors, divisor_gen, allocate)
+    # See IV.3.9 in paper:
+    with np.errstate(over="ignore", invalid="ignore"):
+        return (minval+maxval)/2, alloc, failed
+
+def converged(muls):
+    return rounds_to(muls, 1.0) | (muls == 500000)
 
 
 def alternating_scaling(m_votes, v_desired_row_sums, v_desired_col_sums,
                         m_prior_allocations, divisor_gen, threshold,
-                        **kwargs):
+                        scaling=None, **kwargs):
     """
     # Implementation of the Alternating-Scaling algorithm.
 
@@ -17,91 +102,182 @@ def alternating_scaling(m_votes, v_desired_row_sums, v_desired_col_sums,
             gotten seats
         - divisor_gen: A generator function generating divisors, e.g. d'Hondt
         - threshold: A cutoff threshold for participation, between 0 and 100.
+        - scaling: A ScalingState to start from and to record the converged
+            multipliers in (optional).
     """
-    m_allocations = deepcopy(m_prior_allocations)
-
-    def const_step(v_votes, const_id, const_multipliers, party_multipliers):
-        num_total_seats = v_desired_row_sums[const_id]
-        cm = const_multiplier = const_multipliers[const_id]
-        # See IV.3.5 in paper:
-        v_scaled_votes = [a/(b*cm) if b*cm != 0 else 0
-                          for a, b in zip(v_votes, party_multipliers)]
+    votes = np.array(m_votes, dtype=float)
+    priors = np.array(m_prior_allocations, dtype=int)
+    num_constituencies, num_parties = votes.shape
 
-        v_priors = m_allocations[const_id]
+    def scale(const_multipliers, party_multipliers):
+        """Scale until the multipliers converge."""
+        nonlocal sweeps
+        for step in range(100):
+            # Constituency step:
+            c_muls, _, failed = scaling_step(
+                scaled_votes(votes, const_multipliers, party_multipliers),
+                v_desired_row_sums, priors, divisor_gen)
+            if failed.any():
+                raise ValueError("No valid recipient of a constituency seat")
+            with np.errstate(over="ignore", invalid="ignore"):
+                const_multipliers *= c_muls
+            const_done = converged(c_muls).all()
 
-        _, div = apportion1d(v_scaled_votes, num_total_seats,
-                                 v_priors, divisor_gen)
+            # Party step:
+            p_muls, _, failed = scaling_step(
+                scaled_votes(votes, const_multipliers, party_multipliers).T,
+                v_desired_col_sums, priors.T, divisor_gen)
+            if failed.any():
+                raise ValueError("No valid recipient of a party seat")
+            with np.errstate(over="ignore", invalid="ignore"):
+                party_multipliers *= p_muls
+            party_done = converged(p_muls).all()
 
-        # See IV.3.9 in paper:
-        minval = div[2] # apportion1d gives the last used value, which is min
-        maxval = max([float(a)/b for a, b in zip(v_scaled_votes, div[0])])
-        const_multiplier = (minval+maxval)/2
+            sweeps += 1
 
-        return const_multiplier
+            if const_done and party_done:
+                return
 
-    def party_step(v_votes, party_id, const_multipliers, party_multipliers):
-        num_total_seats = v_desired_col_sums[party_id]
-        pm = party_multiplier = party_multipliers[party_id]
+        raise RuntimeError("AS does not seem to be converging.")
 
-        v_scaled_votes = [a/(b*pm) if b*pm != 0 else 0
-                          for a, b in zip(v_votes, const_multipliers)]
+    if scaling is None:
+        scaling = ScalingState()
+    sweeps = 0
+    starts = [(np.ones(num_constituencies), np.ones(num_parties))]
+    warm_start = scaling.start(num_constituencies, num_parties)
+    if warm_start is not None:
+        # Should the multipliers of the previous table be too far off (e.g.
+        #  for a party that was below the threshold then), start from
+        #  scratch after all.
+        starts.insert(0, tuple(np.array(m, dtype=float) for m in warm_start))
+    for attempt, (const_multipliers, party_multipliers) in enumerate(starts, 1):
+        try:
+            scale(const_multipliers, party_multipliers)
+            break
+        except (ValueError, RuntimeError):
+            if attempt == len(starts):
+                scaling.record(1, sweeps)
+                raise
+    scaling.record(1, sweeps, const_multipliers.tolist(),
+                   party_multipliers.tolist())
 
-        v_priors = [const_alloc[party_id] for const_alloc in m_allocations]
+    # Finally, use party_multipliers and const_multipliers to arrive at
+    #  final apportionment:
+    _, results, failed = scaling_step(
+        scaled_votes(votes, const_multipliers, party_multipliers),
+        v_desired_row_sums, priors, divisor_gen, allocate=True)
+    if failed.any():
+        raise ValueError("No valid recipient of a constituency seat")
 
-        _, div = apportion1d(v_scaled_votes, num_total_seats, v_priors,
-                                 divisor_gen)
+    return results.tolist(), None
 
-        minval = div[2]
-        maxval = max([float(a)/b for a, b in zip(v_scaled_votes, div[0])])
-        party_multiplier = (minval+maxval)/2
 
-        return party_multiplier
+def alternating_scaling_batch(m_votes, v_desired_row_sums, v_desired_col_sums,
+                              m_prior_allocations, divisor_gen, threshold,
+                              scaling=None, **kwargs):
+    """
+    Batch version of alternating_scaling, for a stack of K vote tables
+    (m_votes has shape (K, C, P)). Each table is scaled until it converges,
+    exactly as alternating_scaling would scale it, and is left alone after
+    that. With a ScalingState, every table starts from its multipliers, and
+    those of the last table to converge are kept in it.
 
-    num_constituencies = len(m_votes)
-    num_parties = len(m_votes[0])
-    const_multipliers = [1] * num_constituencies
-    party_multipliers = [1] * num_parties
-    step = 0
+    Outputs:
+        - array of results (prior allocations for tables that failed)
+        - boolean vector marking the tables for which alternating_scaling
+          raises ValueError
+        - boolean vector marking the tables for which it raises RuntimeError
+    """
+    m_votes = np.asarray(m_votes)
+    K, C, P = m_votes.shape
+    m_priors = np.asarray(m_prior_allocations)
+    row_sums = np.broadcast_to(v_desired_row_sums, (K, C))
+    col_sums = np.broadcast_to(v_desired_col_sums, (K, P))
+    if scaling is None:
+        scaling = ScalingState()
+    warm_start = scaling.start(C, P)
+    if warm_start is None:
+        const_multipliers = np.ones((K, C))
+        party_multipliers = np.ones((K, P))
+    else:
+        const_multipliers = np.tile(np.array(warm_start[0], dtype=float), (K, 1))
+        party_multipliers = np.tile(np.array(warm_start[1], dtype=float), (K, 1))
+    failed = np.zeros(K, dtype=bool)
+    done = np.zeros(K, dtype=bool)
+    sweeps = np.zeros(K, dtype=int)
 
-    while step < 100:
-        # Constituency step:
-        c_muls = []
-        for c in range(num_constituencies):
-            mul = const_step(m_votes[c], c, const_multipliers,
-                                party_multipliers)
-            const_multipliers[c] *= mul
-            c_muls.append(mul)
-        const_done = all([round(x, 5) == 1.0 or x == 500000 for x in c_muls])
+    def scale(active):
+        """Scale the tables 'active' until they converge or fail."""
+        for step in range(100):
+            if len(active) == 0:
+                break
+            n = len(active)
+            votes = m_votes[active]
+            priors = m_priors[active]
+            cm = const_multipliers[active]
+            pm = party_multipliers[active]
 
-        # Party step:
-        p_muls = []
-        for p in range(num_parties):
-            vp = [v[p] for v in m_votes]
-            mul = party_step(vp, p, const_multipliers, party_multipliers)
-            party_multipliers[p] *= mul
-            p_muls.append(mul)
-        party_done = all([round(x, 5) == 1.0 or x == 500000 for x in p_muls])
+            # Constituency step:
+            c_muls, _, c_failed = scaling_step(
+                scaled_votes(votes, cm, pm).reshape(n*C, P),
+                row_sums[active].ravel(), priors.reshape(n*C, P),
+                divisor_gen)
+            c_muls = c_muls.reshape(n, C)
+            with np.errstate(over="ignore", invalid="ignore"):
+                cm = cm*c_muls
+            const_done = converged(c_muls).all(axis=1)
 
-        step += 1
+            # Party step:
+            p_muls, _, p_failed = scaling_step(
+                scaled_votes(votes, cm, pm).transpose(0, 2, 1).reshape(n*P, C),
+                col_sums[active].ravel(),
+                priors.transpose(0, 2, 1).reshape(n*P, C), divisor_gen)
+            p_muls = p_muls.reshape(n, P)
+            with np.errstate(over="ignore", invalid="ignore"):
+                pm = pm*p_muls
+            party_done = converged(p_muls).all(axis=1)
 
-        if const_done and party_done:
-            break
+            const_multipliers[active] = cm
+            party_multipliers[active] = pm
+            sweeps[active] += 1
+            step_failed = (c_failed.reshape(n, C).any(axis=1)
+                           | p_failed.reshape(n, P).any(axis=1))
+            failed[active[step_failed]] = True
+            finished = const_done & party_done & ~step_failed
+            done[active[finished]] = True
+            active = active[~(finished | step_failed)]
 
-    if not (const_done and party_done):
-        raise RuntimeError("AS does not seem to be converging.")
+    scale(np.arange(K))
+    if warm_start is not None:
+        # Should the multipliers of the previous table be too far off for
+        #  some tables, start those from scratch, as alternating_scaling does.
+        retry = np.flatnonzero(~done)
+        const_multipliers[retry] = 1
+        party_multipliers[retry] = 1
+        failed[retry] = False
+        scale(retry)
 
+    diverged = ~(done | failed)
+    if done.any():
+        last = np.flatnonzero(done)[-1]
+        scaling.record(K, int(sweeps.sum()),
+                       const_multipliers[last].tolist(),
+                       party_multipliers[last].tolist())
+    else:
+        scaling.record(K, int(sweeps.sum()))
 
     # Finally, use party_multipliers and const_multipliers to arrive at
     #  final apportionment:
-    results = []
-    for c in range(num_constituencies):
-        num_total_seats = v_desired_row_sums[c]
-        cm = const_multipliers[c]
-        v_scaled_votes = [a/(b*cm) if b*cm != 0 else None
-                          for a, b in zip(m_votes[c], party_multipliers)]
-        v_priors = m_allocations[c]
-        alloc, _ = apportion1d(v_scaled_votes, num_total_seats,
-                                 v_priors, divisor_gen)
-        results.append(alloc)
-
-    return results, None
+    results = np.array(m_priors, dtype=int)
+    active = np.flatnonzero(done)
+    n = len(active)
+    if n > 0:
+        _, alloc, final_failed = scaling_step(
+            scaled_votes(m_votes[active], const_multipliers[active],
+                         party_multipliers[active]).reshape(n*C, P),
+            row_sums[active].ravel(), m_priors[active].reshape(n*C, P),
+            divisor_gen, allocate=True)
+        results[active] = alloc.reshape(n, C, P)
+        failed[active[final_failed.reshape(n, C).any(axis=1)]] = True
+
+    return results, failed, diverged
@@ -1,6 +1,11 @@
 #coding:utf-8
 from copy import deepcopy
+import heapq
 import random
+import numpy as np
+
+from division_rules import divisor_table
+from batch_util import divisor_array
 
 def icelandic_apportionment(
     m_votes,
@@ -16,15 +21,40 @@ def icelandic_apportionment(
     """
     Apportion based on Icelandic law nr. 24/2000.
     """
+    return list_share_apportionment(
+        m_votes, v_desired_row_sums, m_prior_allocations, divisor_gen,
+        adj_seat_gen, orig_votes)
+
+def list_share_apportionment(
+    m_votes,
+    v_desired_row_sums,
+    m_prior_allocations,
+    divisor_gen,
+    adj_seat_gen,
+    orig_votes,
+    seat_weighted=False
+):
+    """
+    Give each adjustment seat, in the order given by 'adj_seat_gen', to the
+    list of its party with the highest list share divided by the divisor for
+    its next seat, in a constituency that still has seats left. With
+    'seat_weighted', the list shares are multiplied by the number of seats in
+    the constituency.
+
+    Vote totals are computed once, and each party's lists are kept in a heap
+    that is only updated where a seat lands, so that each seat costs time
+    logarithmic in the number of constituencies.
+    """
     m_allocations = deepcopy(m_prior_allocations)
+    num_constituencies = len(m_votes)
 
     # 2.1.
     #   (Deila skal í atkvæðatölur samtakanna með tölu kjördæmissæta þeirra,
     #   fyrst að viðbættum 1, síðan 2, þá 3 o.s.frv. Útkomutölurnar nefnast
     #   landstölur samtakanna.)
-    v_seats = [sum(x) for x in zip(*m_prior_allocations)]
     v_votes = [sum(x) for x in zip(*m_votes)]
-    num_allocated = sum(v_seats)
+    v_row_seats = [sum(row) for row in m_prior_allocations]
+    num_allocated = sum(v_row_seats)
     total_seats = sum(v_desired_row_sums)
 
     # 2.2.
@@ -32,13 +62,45 @@ def icelandic_apportionment(
     #   komust því að fá úthlutun í kjördæmi skv. 107. gr. Við hvert
     #   þessara sæta skal skrá hlutfall útkomutölu sætisins skv. 1. tölul.
     #   107. gr. af öllum gildum atkvæðum í kjördæminu.)
-    # Create list of 2 top seats on each remaining list that almost got in.
+    const_totals = [sum(orig_votes[const]) for const in range(num_constituencies)]
+
+    # 2.5.
+    #   (Þegar lokið hefur verið að úthluta jöfnunarsætum í hverju
+    #   kjördæmi skv. 2. mgr. 8. gr. skulu hlutfallstölur allra
+    #   lista í því kjördæmi felldar niður.)
+    v_full = [v_row_seats[const] == v_desired_row_sums[const]
+              for const in range(num_constituencies)]
 
+    divisors = divisor_table(divisor_gen, total_seats+1)
+    shares = {}
+    candidates = {}
+
+    def push(idx, const):
+        # Enter the list share of party 'idx' in 'const' for its next seat,
+        #  along with its seat count at that time, so that the entry can be
+        #  recognized as outdated once the list gets another seat.
+        seats = m_allocations[const][idx]
+        p = shares[idx][const]/divisors[seats]
+        if p != 0:
+            heapq.heappush(candidates[idx], (-p, const, seats))
+
+    def party_candidates(idx):
+        if idx not in candidates:
+            shares[idx] = [float(orig_votes[const][idx])/const_totals[const]
+                           for const in range(num_constituencies)]
+            if seat_weighted:
+                shares[idx] = [share*v_desired_row_sums[const]
+                               for const, share in enumerate(shares[idx])]
+            candidates[idx] = []
+            for const in range(num_constituencies):
+                if not v_full[const]:
+                    push(idx, const)
+        return candidates[idx]
 
     # 2.7.
     #   (Beita skal ákvæðum 3. tölul. svo oft sem þarf þar til lokið er
     #   úthlutun allra jöfnunarsæta, sbr. 2. mgr. 8. gr.)
-    invalid = []
+    invalid = set()
     seats_info = []
     adj_seat = adj_seat_gen()
     while num_allocated < total_seats:
@@ -53,56 +115,127 @@ def icelandic_apportionment(
         country_num = seat["active_votes"]
         idx = seat["idx"]
 
-        # 2.6.
-        #   (Hafi allar hlutfallstölur stjórnmálasamtaka verið numdar brott
-        #   skal jafnframt fella niður allar landstölur þeirra.)
-
-        v_proportions = []
-        for const in range(len(m_votes)):
-            const_votes = orig_votes[const]
-            s = sum(const_votes)
-            div = divisor_gen()
-            for i in range(m_allocations[const][idx]+1):
-                x = next(div)
-            p = (float(const_votes[idx])/s)/x
-            v_proportions.append(p)
-
-            # 2.5.
-            #   (Þegar lokið hefur verið að úthluta jöfnunarsætum í hverju
-            #   kjördæmi skv. 2. mgr. 8. gr. skulu hlutfallstölur allra
-            #   lista í því kjördæmi felldar niður.)
-            if sum(m_allocations[const]) == v_desired_row_sums[const]:
-                v_proportions[const] = 0
-
         # 2.3.
         #   (Finna skal hæstu landstölu skv. 1. tölul. sem hefur ekki þegar
         #   verið felld niður. Hjá þeim stjórnmálasamtökum, sem eiga þá
         #   landstölu, skal finna hæstu hlutfallstölu lista skv. 2. tölul.
         #   og úthluta jöfnunarsæti til hans. Landstalan og hlutfallstalan
         #   skulu síðan báðar felldar niður.)
+        heap = party_candidates(idx)
+        tied = []
+        while heap:
+            neg_p, const, seats = heap[0]
+            if v_full[const] or m_allocations[const][idx] != seats:
+                heapq.heappop(heap)
+            elif tied and neg_p != tied[0][0]:
+                break
+            else:
+                tied.append(heapq.heappop(heap))
+
+        # 2.6.
+        #   (Hafi allar hlutfallstölur stjórnmálasamtaka verið numdar brott
+        #   skal jafnframt fella niður allar landstölur þeirra.)
+        if not tied:
+            invalid.add(idx)
+            continue
+
+        chosen = tied[0]
+        if len(tied) > 1:
+            # 2.4.
+            #   (Nú eru tvær eða fleiri lands- eða hlutfallstölur jafnháar
+            #   þegar að þeim kemur skv. 3. tölul. og skal þá hluta um röð
+            #   þeirra.)
+            chosen = random.choice(tied)
+            for entry in tied:
+                if entry is not chosen:
+                    heapq.heappush(heap, entry)
+        neg_p, const, _ = chosen
 
-        if max(v_proportions) != 0:
-            const = [j for j,k in enumerate(v_proportions)
-                        if k == max(v_proportions)]
-            if len(const) > 1:
-                # 2.4.
-                #   (Nú eru tvær eða fleiri lands- eða hlutfallstölur jafnháar
-                #   þegar að þeim kemur skv. 3. tölul. og skal þá hluta um röð
-                #   þeirra.)
-                const = [random.choice(const)]
-
-            m_allocations[const[0]][idx] += 1
-            num_allocated += 1
-            seats_info.append({
-                "constituency": const[0], "party": idx,
-                "reason": "Highest list share",
-                "country_num": country_num,
-                "list_share": v_proportions[const[0]],
-            })
-        else:
-            invalid.append(idx)
+        m_allocations[const][idx] += 1
+        v_row_seats[const] += 1
+        v_full[const] = v_row_seats[const] == v_desired_row_sums[const]
+        num_allocated += 1
+        if not v_full[const]:
+            push(idx, const)
+        seats_info.append({
+            "constituency": const, "party": idx,
+            "reason": "Highest list share",
+            "country_num": country_num,
+            "list_share": -neg_p,
+        })
     return m_allocations, (seats_info, print_seats)
 
+def icelandic_apportionment_batch(
+    m_votes,
+    v_desired_row_sums,
+    v_desired_col_sums,
+    m_prior_allocations,
+    divisor_gen,
+    adj_seat_gen,
+    threshold=None,
+    orig_votes=None,
+    **kwargs
+):
+    """
+    Batch version of icelandic_apportionment, for a stack of K vote tables.
+    'adj_seat_gen' is a factory for SeatGeneratorBatch objects.
+
+    Outputs:
+        - array of allocations
+        - boolean vector marking the tables for which icelandic_apportionment
+          raises ValueError
+        - boolean vector marking the tables for which it raises
+          ZeroDivisionError (a constituency without any votes)
+    """
+    m_allocations = np.array(m_prior_allocations, dtype=int)
+    K, C, P = m_allocations.shape
+    v_votes = m_votes.sum(axis=1)
+    num_allocated = m_allocations.sum(axis=(1, 2))
+    v_desired_row_sums = np.asarray(v_desired_row_sums)
+    total_seats = int(v_desired_row_sums.sum())
+
+    divisors = divisor_array(divisor_gen, total_seats+1)
+    s = orig_votes.sum(axis=2, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        const_shares = orig_votes/s
+    no_votes = (s[:, :, 0] == 0).any(axis=1)
+
+    invalid = np.zeros((K, P), dtype=bool)
+    failed = np.zeros(K, dtype=bool)
+    zero_division = np.zeros(K, dtype=bool)
+    adj_seat = adj_seat_gen()
+    active = np.flatnonzero(num_allocated < total_seats)
+    while len(active) > 0:
+        #if all parties are either invalid or below threshold,
+        #then no more seats can be allocated
+        stuck = (invalid[active] | (v_votes[active] == 0)).all(axis=1)
+        failed[active[stuck]] = True
+        zero_division[active[~stuck & no_votes[active]]] = True
+        active = active[~stuck & ~no_votes[active]]
+        if len(active) == 0:
+            break
+
+        idx, _ = adj_seat.next(active, invalid[active])
+        v_proportions = (const_shares[active, :, idx]
+                         / divisors[m_allocations[active, :, idx]])
+        full = m_allocations[active].sum(axis=2) == v_desired_row_sums
+        v_proportions[full] = 0
+
+        best = v_proportions.max(axis=1)
+        const = v_proportions.argmax(axis=1)
+        won = best != 0
+        ties = (v_proportions == best[:, None]).sum(axis=1) > 1
+        for i in np.flatnonzero(ties & won):
+            const[i] = random.choice(
+                np.flatnonzero(v_proportions[i] == best[i]).tolist())
+
+        m_allocations[active[won], const[won], idx[won]] += 1
+        num_allocated[active[won]] += 1
+        invalid[active[~won], idx[~won]] = True
+        active = active[num_allocated[active] < total_seats]
+
+    return m_allocations, failed, zero_division
+
 
 def print_seats(rules, allocation_sequence):
     # Return data to print breakdown of adjustment seat apportionment
@@ -1,4 +1,6 @@
 from copy import deepcopy
+import numpy as np
+from division_rules import divisor_table
 
 def monge(
     m_votes,             #2d - votes for each list
@@ -23,20 +25,20 @@ def monge(
         - divisor_gen: A generator function generating divisors, e.g. d'Hondt
         - threshold: A cutoff threshold for participation, between 0 and 100.
     """
-    allocations = deepcopy(m_prior_allocations)
+    allocator = MongeAllocator(m_votes, v_desired_row_sums,
+                               v_desired_col_sums, m_prior_allocations,
+                               divisor_gen)
     allocation_sequence = []
-    total_seats = sum(v_desired_row_sums)
-    assert(sum(v_desired_col_sums) == total_seats)
-    while sum([sum(x) for x in allocations]) < total_seats:
-        trivial_lists = find_trivial_seats(allocations, v_desired_col_sums, v_desired_row_sums)
+    while allocator.num_allocated < allocator.total_seats:
+        trivial_lists = allocator.find_trivial_seats()
         for l in trivial_lists:
-            allocations[l["constituency"]][l["party"]] += l["seats"]
+            allocator.allocate(l["constituency"], l["party"], l["seats"])
             allocation_sequence.append(l)
-        if sum([sum(x) for x in allocations]) >= total_seats:
+        if allocator.num_allocated >= allocator.total_seats:
             break
-        best = find_best_Monge_list(
-            m_votes, allocations, v_desired_row_sums, v_desired_col_sums, divisor_gen
-        )
+        if trivial_lists:
+            allocator.refresh()
+        best = allocator.find_best_Monge_list()
         if best == None:
             # if we did not find any list now to allocate to,
             # then we won't on further iterations either
@@ -47,192 +49,158 @@ def monge(
             })
             break
         #allocate seat based on best Monge ratio
-        allocations[best["constituency"]][best["party"]] += 1
+        allocator.allocate(best["constituency"], best["party"])
+        allocator.update(best["constituency"], best["party"])
         allocation_sequence.append(best)
-    return allocations, (allocation_sequence, print_seats)
+    return allocator.allocations, (allocation_sequence, print_seats)
 
-def find_trivial_seats(allocations, p_goals, c_goals):
-    num_constituencies = len(allocations)
-    num_parties = len(allocations[0])
-    available_constituencies = []
-    for C in range(num_constituencies):
-        if not constituency_full(C, c_goals, allocations):
-            available_constituencies.append(C)
-    if available_constituencies == []:
-        return []
-    hungry_parties = []
-    for P in range(num_parties):
-        if not party_satisfied(P, p_goals, allocations):
-            hungry_parties.append(P)
-    if hungry_parties == []:
-        return []
-    if len(available_constituencies) == 1:
-        trivial_seats = []
-        C = available_constituencies[0]
-        c_slack = c_unclaimed(C, c_goals, allocations)
-        p_slack = 0
-        for P in hungry_parties:
-            slack = p_unclaimed(P, p_goals, allocations)
-            p_slack += slack
-            trivial_seats.append({
-                "constituency": C,
-                "party": P,
-                "seats": slack,
-                "reason": "Only one constituency available.",
-            })
-        assert(p_slack == c_slack)
-        return trivial_seats
-    if len(hungry_parties) == 1:
-        trivial_seats = []
-        P = hungry_parties[0]
-        p_slack = p_unclaimed(P, p_goals, allocations)
-        c_slack = 0
-        for C in available_constituencies:
-            slack = c_unclaimed(C, c_goals, allocations)
-            c_slack += slack
-            trivial_seats.append({
-                "constituency": C,
-                "party": P,
-                "seats": slack,
-                "reason": "Only one party available.",
-            })
-        assert(p_slack == c_slack)
-        return trivial_seats
-    return [] # Multiple options, non-trivial.
-
-def find_best_Monge_list(
-    votes,       #2d - votes for each list
-    allocations, #2d - seats already allocated to lists
-    c_goals,     #1d - total number of seats in each constituency
-    p_goals,     #1d - total number of seats each party is supposed to get
-    divisor_gen  #divisor sequence formula
-):
-    #calculate max_Monge_ratio
-    num_constituencies = len(votes)
-    num_parties = len(votes[0])
-    considerations = []
-    for C in range(num_constituencies):
-        if constituency_full(C, c_goals, allocations):
-            continue #No need to consider lists that can't be given more seats
-        for P in range(num_parties):
-            if party_satisfied(P, p_goals, allocations):
-                continue
-            if list_unsupported(votes, C, P):
-                continue
-            closest = find_closest_comparison(
-                C, P, votes, allocations, c_goals, p_goals, divisor_gen
-            )
-            if closest == None:
-                #do not append, ignore list if there is no valid comparison
-                continue
-            considerations.append({
-                "min_det": closest["det"],
-                "constituency": C,
-                "party": P,
-                "reference_constituency": closest["reference_constituency"],
-                "reference_party": closest["reference_party"],
-                "ad": closest["ad"],
-                "bc": closest["bc"],
-                "a": closest["a"],
-                "b": closest["b"],
-                "c": closest["c"],
-                "d": closest["d"],
-            })
-    if considerations:
-        determinants = [conion["min_det"] for conion in considerations]
-        best = considerations[determinants.index(max(determinants))]
-        best["reason"] = "Maximizes comparison against closest competitor."
-        return best
-    return None
-
-def constituency_full(C, c_goals, allocations):
-    return c_unclaimed(C, c_goals, allocations) <= 0
-
-def party_satisfied(P, p_goals, allocations):
-    return p_unclaimed(P, p_goals, allocations) <= 0
-
-def list_unsupported(votes, C, P):
-    return votes[C][P] <= 0
-
-def c_unclaimed(C, c_goals, allocations):
-    return c_goals[C] - sum(allocations[C])
 
-def p_unclaimed(P, p_goals, allocations):
-    return p_goals[P] - sum([c[P] for c in allocations])
-
-def find_closest_comparison(
-    C1,          #index of constituency being considered
-    P1,          #index of party        being considered
-    votes,       #2d - votes for each list
-    allocations, #2d - seats already allocated to lists
-    c_goals,     #1d - total number of seats in each constituency
-    p_goals,     #1d - total number of seats each party is supposed to get
-    divisor_gen  #divisor sequence formula
-):
-    num_constituencies = len(votes)
-    num_parties = len(votes[0])
-    a = divided_vote(votes, allocations, C1, P1, divisor_gen)
-    comparisons = []
-    for C2 in range(num_constituencies):
-        if C2 == C1:
-            continue #compare to lists in different constituencies only
-        if constituency_full(C2, c_goals, allocations):
-            continue
-        for P2 in range(num_parties):
-            if P2 == P1:
-                continue #compare to lists for different party only
-            if party_satisfied(P2, p_goals, allocations):
-                continue
-            # d = fully_divided_vote(
-            #     votes, allocations, C2, P2, c_goals, p_goals, divisor_gen
-            # )
-            d = divided_vote(votes, allocations, C2, P2, divisor_gen)
-            b = divided_vote(votes, allocations, C1, P2, divisor_gen)
-            c = divided_vote(votes, allocations, C2, P1, divisor_gen)
-            comparisons.append({
-                "det": a*d-b*c,
-                "ad": a*d,
-                "bc": b*c,
-                "a": a,
-                "b": b,
-                "c": c,
-                "d": d,
-                "reference_constituency": C2,
-                "reference_party": P2
-            })
-    if comparisons:
-        determinants = [comparison["det"] for comparison in comparisons]
-        closest = comparisons[determinants.index(min(determinants))]
-        return closest
-    return None
-
-def divided_vote(votes, prior_allocations, C, P, divisor_gen):
-    k = prior_allocations[C][P]
-    return float(votes[C][P]) / divisor(k, divisor_gen)
-
-def divisor(k, divisor_gen):
-    gen = divisor_gen()
-    d = next(gen)
-    for step in range(k):
-        d = next(gen)
-    return d
-
-def fully_divided_vote(votes, allocations, C, P, c_goals, p_goals, divisor_gen):
-    slack = seats_still_available(C, P, c_goals, p_goals, allocations)
-    N = allocations[C][P] + slack
-    return float(votes[C][P]) / divisor(N, divisor_gen)
+class MongeAllocator:
+    """
+    State of an apportionment by the Monge algorithm.
 
-def seats_still_available(C, P, c_goals, p_goals, allocations):
-    c_left = c_unclaimed(C, c_goals, allocations)
-    p_left = p_unclaimed(P, p_goals, allocations)
-    return min(c_left, p_left)
+    The divided vote of each list, the seats still unclaimed in each
+    constituency and by each party, and for each list the determinant
+    against its closest comparison (the smallest a*d-b*c, where a and d are
+    the divided votes of the list and of a list of another party in another
+    constituency, and b and c those of the two lists crossing them) are kept
+    in arrays. When a seat is allocated only the determinants it can change
+    are recomputed: those of the lists in its constituency and party, those
+    comparing against the list itself, and, if the constituency or party is
+    then full, those whose closest comparison was in it.
+    """
+    def __init__(self, votes, c_goals, p_goals, prior_allocations, divisor_gen):
+        self.allocations = deepcopy(prior_allocations)
+        self.total_seats = sum(c_goals)
+        assert(sum(p_goals) == self.total_seats)
+        self.num_allocated = sum([sum(x) for x in self.allocations])
+        self.divisor_gen = divisor_gen
+        self.votes = np.array(votes, dtype=float)
+        num_constituencies, num_parties = self.votes.shape
+        seats = np.array(self.allocations, dtype=int).reshape(self.votes.shape)
+        self.c_slack = np.array(c_goals, dtype=int) - seats.sum(axis=1)
+        self.p_slack = np.array(p_goals, dtype=int) - seats.sum(axis=0)
+        divisors = divisor_table(divisor_gen, seats.max(initial=0)+1)
+        self.divided = self.votes/np.array(divisors)[seats]
+        self.min_det = np.full(self.votes.shape, np.inf)
+        self.closest = np.full(self.votes.shape, -1)
+        self.refresh()
 
+    def allocate(self, C, P, seats=1):
+        """Give list (C, P) 'seats' more seats."""
+        self.allocations[C][P] += seats
+        self.num_allocated += seats
+        self.c_slack[C] -= seats
+        self.p_slack[P] -= seats
+        k = self.allocations[C][P]
+        divisor = divisor_table(self.divisor_gen, k+1)[k]
+        self.divided[C,P] = float(self.votes[C,P])/divisor
 
+    def open_lists(self):
+        return (self.c_slack > 0)[:,None] & (self.p_slack > 0)[None,:]
 
+    def refresh(self):
+        """Find the closest comparison of every list from scratch."""
+        self.compare(*np.nonzero(self.open_lists()))
 
+    def compare(self, rows, cols):
+        """Find the closest comparisons of the lists (rows[i], cols[i])."""
+        if len(rows) == 0:
+            return
+        D = self.divided
+        num_constituencies, num_parties = D.shape
+        a = D[rows, cols][:,None,None]
+        b = D[rows][:,None,:]
+        c = D[:,cols].T[:,:,None]
+        det = a*D[None,:,:] - b*c
+        valid = self.open_lists()[None,:,:] \
+            & (np.arange(num_constituencies)[None,:] != rows[:,None])[:,:,None] \
+            & (np.arange(num_parties)[None,:] != cols[:,None])[:,None,:]
+        det = np.where(valid, det, np.inf).reshape(len(rows), -1)
+        closest = det.argmin(axis=1)
+        found = valid.reshape(len(rows), -1).any(axis=1)
+        self.min_det[rows, cols] = np.where(
+            found, det[np.arange(len(rows)), closest], np.inf)
+        self.closest[rows, cols] = np.where(found, closest, -1)
 
+    def update(self, C, P):
+        """Update the closest comparisons after list (C, P) got a seat."""
+        D = self.divided
+        num_constituencies, num_parties = D.shape
+        open_lists = self.open_lists()
+        stale = np.zeros(D.shape, dtype=bool)
+        stale[C,:] = True
+        stale[:,P] = True
+        if open_lists[C,P]:
+            # (C, P) is still a candidate comparison for the other lists, and
+            # its determinant against each of them has decreased.
+            k = C*num_parties + P
+            det = D*D[C,P] - np.outer(D[:,P], D[C,:])
+            closer = (det < self.min_det) \
+                | ((det == self.min_det) & (k < self.closest))
+            self.min_det = np.where(closer, det, self.min_det)
+            self.closest = np.where(closer, k, self.closest)
+        else:
+            closest_c, closest_p = np.divmod(self.closest, num_parties)
+            stale |= (self.closest >= 0) & (
+                (self.c_slack[closest_c] <= 0) | (self.p_slack[closest_p] <= 0))
+        self.compare(*np.nonzero(stale & open_lists))
 
+    def find_best_Monge_list(self):
+        candidates = self.open_lists() & (self.votes > 0) & (self.closest >= 0)
+        if not candidates.any():
+            return None
+        C, P = np.unravel_index(
+            np.where(candidates, self.min_det, -np.inf).argmax(),
+            self.votes.shape)
+        C2, P2 = np.unravel_index(self.closest[C,P], self.votes.shape)
+        a = float(self.divided[C,P])
+        b = float(self.divided[C,P2])
+        c = float(self.divided[C2,P])
+        d = float(self.divided[C2,P2])
+        return {
+            "min_det": a*d-b*c,
+            "constituency": int(C),
+            "party": int(P),
+            "reference_constituency": int(C2),
+            "reference_party": int(P2),
+            "ad": a*d,
+            "bc": b*c,
+            "a": a,
+            "b": b,
+            "c": c,
+            "d": d,
+            "reason": "Maximizes comparison against closest competitor.",
+        }
 
+    def find_trivial_seats(self):
+        available_constituencies = np.nonzero(self.c_slack > 0)[0].tolist()
+        if available_constituencies == []:
+            return []
+        hungry_parties = np.nonzero(self.p_slack > 0)[0].tolist()
+        if hungry_parties == []:
+            return []
+        if len(available_constituencies) == 1:
+            C = available_constituencies[0]
+            trivial_seats = [{
+                "constituency": C,
+                "party": P,
+                "seats": int(self.p_slack[P]),
+                "reason": "Only one constituency available.",
+            } for P in hungry_parties]
+            assert(self.p_slack[hungry_parties].sum() == self.c_slack[C])
+            return trivial_seats
+        if len(hungry_parties) == 1:
+            P = hungry_parties[0]
+            trivial_seats = [{
+                "constituency": C,
+                "party": P,
+                "seats": int(self.c_slack[C]),
+                "reason": "Only one party available.",
+            } for C in available_constituencies]
+            assert(self.c_slack[available_constituencies].sum() == self.p_slack[P])
+            return trivial_seats
+        return [] # Multiple options, non-trivial.
 
 
 def print_seats(rules, adj_seats_info):
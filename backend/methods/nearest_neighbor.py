@@ -1,59 +1,108 @@
 #coding:utf-8
 from copy import deepcopy, copy
-from apportion import apportion1d, threshold_elimination_constituencies
+from division_rules import divisor_table
 
 def nearest_neighbor(m_votes, v_desired_row_sums, v_desired_col_sums,
                         m_prior_allocations, divisor_gen, threshold=None,
                         **kwargs):
 
     assert("last" in kwargs)
-    last = kwargs["last"]
+    m_allocations, allocation_sequence = least_ratio_apportionment(
+        m_votes, v_desired_row_sums, v_desired_col_sums, m_prior_allocations,
+        divisor_gen, kwargs["last"], "Least neighbor ratio")
 
+    return m_allocations, (allocation_sequence, present_allocation_sequence)
+
+
+def least_ratio_apportionment(m_votes, v_desired_row_sums, v_desired_col_sums,
+                              m_prior_allocations, divisor_gen, last, reason):
+    """
+    Give each adjustment seat to the list next in line in the constituency
+    where the ratio of the divided votes of the last seat allocated to those
+    of the next one is the least, leaving out the lists of parties that
+    already have all their seats. 'last' holds the divided votes of the last
+    seat allocated in each constituency so far, and is not changed.
+
+    The list next in line in each constituency is kept between seats and
+    only found anew in the constituency that got the last seat, and in
+    those where the party that got it was next in line, should it now have
+    all its seats.
+    """
+    last = copy(last)
     m_allocations = deepcopy(m_prior_allocations)
+    num_constituencies = len(m_votes)
+    num_parties = len(v_desired_col_sums)
     num_allocated = sum([sum(x) for x in m_allocations])
     num_total_seats = sum(v_desired_row_sums)
     allocation_sequence = []
+    if num_allocated >= num_total_seats:
+        return m_allocations, allocation_sequence
+
+    table = divisor_table(divisor_gen, max([num_total_seats]
+        + [max(row, default=0) for row in m_allocations])+1)
+    v_party_seats = [sum(col) for col in zip(*m_allocations)]
+    v_running = [v_party_seats[p] != v_desired_col_sums[p]
+                 for p in range(num_parties)]
+
+    # For each constituency: the neighbor ratio, the list next in line and
+    #  its divided votes (for full constituencies, a ratio too high to be
+    #  chosen, and the first list), or the error finding it would raise.
+    v_ratios = [None]*num_constituencies
+    first_in = [None]*num_constituencies
+    next_used = [None]*num_constituencies
+    v_errors = [None]*num_constituencies
+
+    def find_next(c):
+        v_errors[c] = None
+        if v_desired_row_sums[c] == sum(m_allocations[c]):
+            v_ratios[c], first_in[c], next_used[c] = 10000000, 0, 0
+            return
+        # Find the party next in line in the constituency:
+        votes = [m_votes[c][p] if v_running[p] else 0
+                 for p in range(num_parties)]
+        next_in = max(range(num_parties), key=lambda p:
+                      (votes[p]*1.0/table[m_allocations[c][p]], -p))
+        divided_votes = votes[next_in]*1.0/table[m_allocations[c][next_in]]
+        if divided_votes == 0:
+            v_errors[c] = "No valid recipient of seat nr. " \
+                f"{sum(m_allocations[c])+1}"
+            return
+        first_in[c] = next_in
+        next_used[c] = divided_votes
+        v_ratios[c] = float(last[c])/divided_votes
+
+    for c in range(num_constituencies):
+        find_next(c)
+
     for n in range(num_total_seats-num_allocated):
-        m_votes = threshold_elimination_constituencies(m_votes, 0.0,
-                    v_desired_col_sums, m_allocations)
-        neighbor_ratio = []
-        first_in = []
-        next_used = []
-        for c in range(len(m_votes)):
-            seats_left = v_desired_row_sums[c] - sum(m_allocations[c])
-            if not seats_left:
-                neighbor_ratio.append(10000000)
-                first_in.append(0)
-                next_used.append(0)
-                continue
-
-            # Find the party next in line in the constituency:
-            next_alloc_num = sum(m_allocations[c]) + 1
-            alloc_next, div = apportion1d(m_votes[c], next_alloc_num,
-                                   m_allocations[c], divisor_gen)
-            diff = [alloc_next[p]-m_allocations[c][p]
-                    for p in range(len(m_votes[c]))]
-            next_in = diff.index(1)
-            first_in.append(next_in)
-            next_used.append(div[2])
-
-            # Calculate neighbor ratio:
-            nr = float(last[c])/next_used[c]
-            neighbor_ratio.append(nr)
-
-        # Allocate seat in constituency where the calculated
-        #  neighbor ratio is lowest:
-        least = min(neighbor_ratio)
-        idx = neighbor_ratio.index(least)
-        m_allocations[idx][first_in[idx]] += 1
+        for c in range(num_constituencies):
+            if v_errors[c]:
+                raise ValueError(v_errors[c])
+
+        # Allocate seat in constituency where the calculated ratio is
+        #  lowest:
+        least = min(v_ratios)
+        idx = v_ratios.index(least)
+        party = first_in[idx]
+        m_allocations[idx][party] += 1
         last[idx] = next_used[idx]
         allocation_sequence.append({
-            "constituency": idx, "party": first_in[idx],
-            "reason": "Least neighbor ratio",
+            "constituency": idx, "party": party,
+            "reason": reason,
             "min": least,
         })
 
-    return m_allocations, (allocation_sequence, present_allocation_sequence)
+        v_party_seats[party] += 1
+        find_next(idx)
+        if v_running[party] and \
+                v_party_seats[party] == v_desired_col_sums[party]:
+            # The party has all its seats now
+            v_running[party] = False
+            for c in range(num_constituencies):
+                if first_in[c] == party and next_used[c] != 0:
+                    find_next(c)
+
+    return m_allocations, allocation_sequence
 
 
 def present_allocation_sequence(rules, allocation_sequence):
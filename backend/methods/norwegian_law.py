@@ -1,47 +1,100 @@
 #coding:utf-8
 from copy import deepcopy
-from apportion import apportion1d, threshold_elimination_constituencies
+from heapq import heappop, heappush
+from division_rules import divisor_table
 
 def norwegian_apportionment(m_votes, v_desired_row_sums, v_desired_col_sums,
                             m_prior_allocations, divisor_gen, v_const_seats,
                             threshold=None, orig_votes=None, **kwargs):
     """Apportion based on Norwegian law."""
+    const_totals = [sum(orig_votes[c]) for c in range(len(m_votes))]
 
+    def seat_share(c, p):
+        seat_factor = max(1, v_const_seats[c])
+        return float(orig_votes[c][p])*seat_factor/const_totals[c]
+
+    return highest_divided_votes_apportionment(
+        m_votes, v_desired_row_sums, v_desired_col_sums,
+        m_prior_allocations, divisor_gen, seat_share)
+
+
+def highest_divided_votes_apportionment(m_votes, v_desired_row_sums,
+                                        v_desired_col_sums,
+                                        m_prior_allocations, divisor_gen,
+                                        seat_share):
+    """
+    Give each adjustment seat to the list with the highest seat share,
+    'seat_share(c, p)', divided by the divisor for its next seat, among the
+    lists with votes in constituencies that still have seats left, of
+    parties that do not yet have all their seats. Ties go to the first
+    constituency and then the first party.
+
+    The divided seat shares of all lists are kept in a single heap, where
+    only the list that got the last seat is entered anew; lists of full
+    constituencies and of parties with all their seats are dropped as they
+    come up.
+    """
     m_allocations = deepcopy(m_prior_allocations)
+    num_constituencies = len(m_votes)
+    num_parties = len(v_desired_col_sums)
 
-    num_allocated = sum([sum(c) for c in m_allocations])
+    v_row_seats = [sum(c) for c in m_allocations]
+    v_party_seats = [sum(x) for x in zip(*m_allocations)]
+    num_allocated = sum(v_row_seats)
     total_seats = sum(v_desired_row_sums)
     allocation_sequence = []
+    if num_allocated >= total_seats:
+        return m_allocations, (allocation_sequence,
+                               present_allocation_sequence)
+    divisors = divisor_table(divisor_gen, total_seats+1)
+
+    v_full = [v_row_seats[c] == v_desired_row_sums[c]
+              for c in range(num_constituencies)]
+    v_done = [v_party_seats[p] == v_desired_col_sums[p]
+              for p in range(num_parties)]
+    m_seat_shares = [[seat_share(c, p) if m_votes[c][p] != 0 and not v_done[p]
+                      else 0 for p in range(num_parties)]
+                     for c in range(num_constituencies)]
+
+    heap = []
+    def push(c, p):
+        if m_seat_shares[c][p] != 0 and not v_done[p] and not v_full[c]:
+            seats = m_allocations[c][p]
+            a = m_seat_shares[c][p]/divisors[seats]
+            if a != 0:
+                heappush(heap, (-a, c, p, seats))
+
+    for c in range(num_constituencies):
+        for p in range(num_parties):
+            push(c, p)
 
     for n in range(total_seats-num_allocated):
-        m_votes = threshold_elimination_constituencies(m_votes, 0.0,
-                    v_desired_col_sums, m_allocations)
-        m_seat_props = []
-        maximums = []
-        for c in range(len(m_votes)):
-            m_seat_props.append([])
-            s = sum(orig_votes[c])
-            for p in range(len(m_votes[c])):
-                div = divisor_gen()
-                for k in range(m_allocations[c][p]+1):
-                    x = next(div)
-                if m_votes[c][p] != 0:
-                    seat_factor = max(1, v_const_seats[c])
-                    a = float(orig_votes[c][p])*seat_factor/s/x
-                else:
-                    a = 0
-                m_seat_props[c].append(a)
-            maximums.append(max(m_seat_props[c]))
-
-            if sum(m_allocations[c]) == v_desired_row_sums[c]:
-                m_seat_props[c] = [0]*len(m_votes[c])
-                maximums[c] = 0
-
-        maximum = max(maximums)
-        const = maximums.index(maximum)
-        party = m_seat_props[const].index(maximum)
+        while heap:
+            neg_a, const, party, seats = heap[0]
+            if (v_full[const] or v_done[party]
+                    or m_allocations[const][party] != seats):
+                heappop(heap)
+            else:
+                break
+        if heap:
+            neg_a, const, party, _ = heappop(heap)
+            maximum = -neg_a
+        else:
+            # No list is left; the seat goes to the first one regardless.
+            maximum, const, party = 0, 0, 0
 
+        was_full = v_full[const]
         m_allocations[const][party] += 1
+        v_row_seats[const] += 1
+        v_party_seats[party] += 1
+        v_full[const] = v_row_seats[const] == v_desired_row_sums[const]
+        v_done[party] = (v_done[party]
+                         or v_party_seats[party] == v_desired_col_sums[party])
+        if was_full and not v_full[const]:
+            for p in range(num_parties):
+                push(const, p)
+        else:
+            push(const, party)
         allocation_sequence.append({
             "constituency": const, "party": party,
             "reason": "Highest divided votes",
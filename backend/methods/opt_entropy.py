@@ -1,54 +1,118 @@
+from math import inf
 import numpy as np
-# from scipy.optimize import minimize, LinearConstraint
 
-from copy import copy, deepcopy
-from math import log
+from batch_util import divisor_array
 
+# Improvement in the cost of a path below which it is not taken to be
+#  shorter, so that rounding errors cannot send the search around in circles.
+COST_TOLERANCE = 1e-9
 
-def entropy(alloc, votes, divisor_gen, c_num, p_num):
+
+def opt_entropy(m_votes, v_desired_row_sums, v_desired_col_sums,
+                m_prior_allocations, divisor_gen, threshold, **kwargs):
     """
-    Calculate entropy of the election, taking into account votes and
-     allocations.
-     $\\sum_i \\sum_j \\sum_k \\log{v_{ij}/d_k}$, more or less.
+    # Entropy-optimal apportionment, by min-cost flow.
+
+    Finds the integer allocation meeting both the constituency and the party
+    totals that maximizes the entropy, the sum over all seats of the log of
+    the votes of the list divided by the divisor for the seat (see
+    table_util.entropy).
+
+    As the divisors increase, each further seat of a list adds less to the
+    entropy than the one before, so this is a min-cost flow from parties to
+    constituencies with convex costs. The seats are added one at a time
+    along the cheapest path from a party that needs seats to a constituency
+    that has seats left, where a path may move seats between lists.
+    Lists without votes get no seats beyond their prior allocation.
+
+    Inputs:
+        - m_votes: A matrix of votes (rows: constituencies, columns:
+            parties)
+        - v_desired_row_sums: A vector of total seats in each constituency
+        - v_desired_col_sums: A vector of seats allocated to parties
+        - m_prior_allocations: A matrix of where parties have previously
+            gotten seats
+        - divisor_gen: A generator function generating divisors, e.g. d'Hondt
+        - threshold: A cutoff threshold for participation, between 0 and 100.
     """
-    e = 0
-    for i in range(c_num):
-        divisor_gens = [divisor_gen() for x in range(p_num)]
-        for j in range(p_num):
-            for k in range(int(alloc[i*p_num+j])):
-                dk = next(divisor_gens[j])
-                e -= log(votes[i*p_num+j]/dk)
+    votes = np.array(m_votes, dtype=float)
+    priors = np.array(m_prior_allocations, dtype=int)
+    seats = priors.copy()
+    row_slacks = np.array(v_desired_row_sums, dtype=int) - seats.sum(axis=1)
+    col_slacks = np.array(v_desired_col_sums, dtype=int) - seats.sum(axis=0)
+    if row_slacks.sum() != col_slacks.sum():
+        raise ValueError("Constituency and party totals do not match")
+    if (row_slacks < 0).any() or (col_slacks < 0).any():
+        raise ValueError("Prior allocations exceed the totals")
 
-    return e
+    log_divisors = np.log(divisor_array(divisor_gen,
+        int(seats.max(initial=0) + row_slacks.max(initial=0)) + 1))
+    with np.errstate(divide="ignore"):
+        log_votes = np.log(votes)
 
+    for n in range(int(row_slacks.sum())):
+        # Entropy lost by giving a list its next seat, and by taking its last
+        #  seat above the prior allocation away again (inf if impossible):
+        add_cost = np.where(votes > 0, log_divisors[seats] - log_votes, inf)
+        remove_cost = np.where(seats > priors,
+                               log_votes - log_divisors[seats-1], inf)
+        path = cheapest_path(add_cost, remove_cost,
+                             col_slacks > 0, row_slacks > 0)
+        if path is None:
+            raise ValueError("No allocation meets the party totals")
+        for const, party, change in path:
+            seats[const, party] += change
+        row_slacks[path[0][0]] -= 1
+        col_slacks[path[-1][1]] -= 1
 
-def opt_entropy(m_votes, v_desired_row_sums, v_desired_col_sums,
-                m_prior_allocations, divisor_gen, threshold, **kwargs):
+    return seats.tolist(), None
+
+
+def cheapest_path(add_cost, remove_cost, sources, sinks):
+    """
+    Find the cheapest path from a party in 'sources' to a constituency in
+    'sinks', alternately giving a party a seat in a constituency and taking
+    one there from another party, by Bellman-Ford.
+    Outputs:
+        - the path as a list of (constituency, party, +1 or -1), starting at
+          the end, or None if there is none
+    """
+    num_constituencies, num_parties = add_cost.shape
+    const_range = np.arange(num_constituencies)
+    party_range = np.arange(num_parties)
+    party_costs = np.where(sources, 0.0, inf)
+    const_costs = np.full(num_constituencies, inf)
+    reached_from_party = np.full(num_constituencies, -1)
+    reached_from_const = np.full(num_parties, -1)
+
+    for step in range(num_constituencies + num_parties):
+        via = party_costs[None, :] + add_cost
+        best = via.argmin(axis=1)
+        costs = via[const_range, best]
+        const_better = costs < const_costs - COST_TOLERANCE
+        const_costs[const_better] = costs[const_better]
+        reached_from_party[const_better] = best[const_better]
+
+        via = const_costs[:, None] + remove_cost
+        best = via.argmin(axis=0)
+        costs = via[best, party_range]
+        party_better = costs < party_costs - COST_TOLERANCE
+        party_costs[party_better] = costs[party_better]
+        reached_from_const[party_better] = best[party_better]
+
+        if not (const_better.any() or party_better.any()):
+            break
 
-    alloc = []
-    for const in m_prior_allocations:
-        alloc.extend(copy(const))
-    votes = []
-    for const in m_votes:
-        votes.extend(copy(const))
-    seats = copy(v_desired_row_sums)
-
-    c = len(m_votes)
-    p = len(m_votes[0])
-    linear_constraints = []
-    for i in range(c):
-        a = [0]*p*i
-        a.extend([1]*p)
-        a.extend([0]*p*(c-i-1))
-        lc = LinearConstraint(a, seats[i], seats[i])
-        linear_constraints.append(lc)
-
-    res = minimize(entropy, alloc, args=(votes,divisor_gen,c,p),
-            method='trust-constr', constraints=linear_constraints)
-
-    v_results = res.x
-    results = []
-    for i in range(c):
-        results.append(v_results[i*p:(i+1)*p])
-
-    return results, None
+    end_costs = np.where(sinks, const_costs, inf)
+    const = int(end_costs.argmin())
+    if end_costs[const] == inf:
+        return None
+    path = []
+    for step in range(num_constituencies + num_parties):
+        party = int(reached_from_party[const])
+        path.append((const, party, +1))
+        if reached_from_const[party] < 0:
+            return path
+        const = int(reached_from_const[party])
+        path.append((const, party, -1))
+    raise RuntimeError("Cheapest path search did not terminate.")
@@ -1,43 +1,82 @@
 #coding:utf-8
 from copy import deepcopy
-from apportion import apportion1d
-import random
+from heapq import heappop, heappush
+from division_rules import divisor_table
 
 def pure_vote_ratios_apportionment(m_votes, v_desired_row_sums, v_desired_col_sums,
                             m_prior_allocations, divisor_gen, threshold=None,
                             orig_votes=None, **kwargs):
+    """
+    Give each adjustment seat to the list with the highest vote share in its
+    constituency divided by the divisor for its next seat, among the lists
+    in constituencies that still have seats left, of parties that do not yet
+    have all their seats. Ties go to the first constituency and then the
+    first party.
+
+    The divided vote shares are kept in a single heap, where only the list
+    that got the last seat is entered anew; lists of full constituencies and
+    of parties with all their seats are dropped as they come up.
+    """
     m_allocations = deepcopy(m_prior_allocations)
+    num_constituencies = len(m_votes)
+    num_parties = len(v_desired_col_sums)
 
-    num_allocated = sum([sum(c) for c in m_allocations])
+    v_row_seats = [sum(c) for c in m_allocations]
+    v_party_seats = [sum(x) for x in zip(*m_allocations)]
+    num_allocated = sum(v_row_seats)
     total_seats = sum(v_desired_row_sums)
     allocation_sequence = []
+    if num_allocated >= total_seats:
+        return m_allocations, (allocation_sequence,
+                               present_allocation_sequence)
+    divisors = divisor_table(divisor_gen, total_seats+1)
 
-    for n in range(total_seats-num_allocated):
-        m_seat_props = []
-        maximums = []
-        for const in range(len(m_votes)):
-            m_seat_props.append([])
-            s = sum(orig_votes[const])
-            for party in range(len(m_votes[const])):
-                a = 0
-                col_sum = sum(row[party] for row in m_allocations)
-                if col_sum < v_desired_col_sums[party]:
-                    div = divisor_gen()
-                    for k in range(m_allocations[const][party]+1):
-                        x = next(div)
-                    a = (float(orig_votes[const][party])/s)/x
-                m_seat_props[const].append(a)
-            maximums.append(max(m_seat_props[const]))
+    v_full = [v_row_seats[c] == v_desired_row_sums[c]
+              for c in range(num_constituencies)]
+    v_done = [v_party_seats[p] >= v_desired_col_sums[p]
+              for p in range(num_parties)]
+    const_totals = [sum(orig_votes[c]) for c in range(num_constituencies)]
+    m_vote_shares = [[float(orig_votes[c][p])/const_totals[c]
+                      if not v_done[p] else 0 for p in range(num_parties)]
+                     for c in range(num_constituencies)]
 
-            if sum(m_allocations[const]) == v_desired_row_sums[const]:
-                m_seat_props[const] = [0]*len(m_votes[const])
-                maximums[const] = 0
+    heap = []
+    def push(c, p):
+        if not v_done[p] and not v_full[c]:
+            seats = m_allocations[c][p]
+            a = m_vote_shares[c][p]/divisors[seats]
+            if a != 0:
+                heappush(heap, (-a, c, p, seats))
 
-        maximum = max(maximums)
-        c = maximums.index(maximum)
-        p = m_seat_props[c].index(maximum)
+    for c in range(num_constituencies):
+        for p in range(num_parties):
+            push(c, p)
+
+    for n in range(total_seats-num_allocated):
+        while heap:
+            neg_a, c, p, seats = heap[0]
+            if v_full[c] or v_done[p] or m_allocations[c][p] != seats:
+                heappop(heap)
+            else:
+                break
+        if heap:
+            neg_a, c, p, _ = heappop(heap)
+            maximum = -neg_a
+        else:
+            # No list is left; the seat goes to the first one regardless.
+            maximum, c, p = 0, 0, 0
 
+        was_full = v_full[c]
         m_allocations[c][p] += 1
+        v_row_seats[c] += 1
+        v_party_seats[p] += 1
+        v_full[c] = v_row_seats[c] == v_desired_row_sums[c]
+        v_done[p] = v_party_seats[p] >= v_desired_col_sums[p]
+        if was_full and not v_full[c]:
+            for party in range(num_parties):
+                push(c, party)
+        else:
+            push(c, p)
         allocation_sequence.append({
             "constituency": c, "party": p,
             "reason": "Highest divided votes",
@@ -1,11 +1,36 @@
 #coding:utf-8
 from copy import deepcopy, copy
-from apportion import apportion1d, threshold_elimination_constituencies
+from apportion import jump_and_step
+from division_rules import divisor_table
 from table_util import v_subtract
 
 def relative_superiority(m_votes, v_desired_row_sums, v_desired_col_sums,
     m_prior_allocations, divisor_gen, threshold=None, **kwargs):
     """Apportion by Þorkell Helgason's Relative Superiority method"""
+    return superiority_apportionment(m_votes, v_desired_row_sums,
+        v_desired_col_sums, m_prior_allocations, divisor_gen)
+
+
+REASONS = {
+    "necessary": "Can't fill this constituency without this list",
+    "available": "Greatest relative superiority",
+    "violating": "Must violate party sums to fill this constituency",
+}
+
+def superiority_apportionment(m_votes, v_desired_row_sums, v_desired_col_sums,
+    m_prior_allocations, divisor_gen, simple=False):
+    """
+    Apportion by relative superiority: the list next in line in each
+    constituency is compared to the seat its constituency would fill last
+    without it (with 'simple', to the seat next in line after it).
+
+    What each constituency has next in line is kept between seats and only
+    worked out again for the constituency that got the last seat, and for
+    those where the change in the party's slack can make a difference:
+    where the party has votes and either no longer needs seats, has as many
+    seats left as it would get in the continuation, or its slack was all
+    that kept the constituency from needing the list next in line.
+    """
     num_constituencies = len(v_desired_row_sums)
     num_parties        = len(v_desired_col_sums)
     assert len(m_votes) == num_constituencies
@@ -16,107 +41,118 @@ def relative_superiority(m_votes, v_desired_row_sums, v_desired_col_sums,
     num_allocated = sum([sum(x) for x in m_allocations])
     num_total_seats = sum(v_desired_row_sums)
     allocation_sequence = []
-    for n in range(num_total_seats-num_allocated):
-        v_col_sums = [sum(col) for col in zip(*m_allocations)]
-        v_col_slacks = v_subtract(v_desired_col_sums, v_col_sums)
-        hungry_parties = [p for p in range(num_parties) if v_col_slacks[p]>0]
-        v_row_sums = [sum(row) for row in m_allocations]
-        v_row_slacks = v_subtract(v_desired_row_sums, v_row_sums)
-        unfilled_const = [c for c in range(num_constituencies) if v_row_slacks[c]>0]
-        necessary = []
-        available = []
-        violating = []
-        for c in unfilled_const:
-            running_lists = [p for p in range(num_parties) if m_votes[c][p]>0]
-            if len(running_lists) == 0:
-                raise RuntimeError(f"After allocating {n} adjustment seats, "
-                    f"constituency {c} has not been filled, "
-                    "but there are no parties with any votes "
-                    "in this constituency (after threshold elimination).")
-            hungry_lists = set(running_lists).intersection(hungry_parties)
-            if len(hungry_lists) == 0:
-                # All parties running in this constituency (and above threshold)
-                #  have already been satisfied
-                v_slacks = []
-            else:
-                v_slacks = v_col_slacks
-
-            # Find the party next in line in the constituency:
-            alloc_next, div_next = apportion1d(
-                v_votes=m_votes[c],
-                num_total_seats=v_row_sums[c] + 1,
-                prior_allocations=m_allocations[c],
-                divisor_gen=divisor_gen,
-                v_max_left=v_slacks
-            )
-            diff = v_subtract(alloc_next, m_allocations[c])
-            next_in = diff.index(1)
-            if len(hungry_lists) == 0:
-                violating.append({
-                    "constituency": c,
-                    "party": next_in,
-                    "divided_votes": div_next[2],
-                })
-                continue
+    if num_allocated >= num_total_seats:
+        return m_allocations, (allocation_sequence, present_allocation_sequence)
 
-            # Calculate continuation:
-            v_slacks = [v_col_slacks[p] if m_votes[c][p]>0 else 0 for p in range(num_parties)]
-            v_slacks[next_in] = 0
-            if sum(v_slacks) < v_row_slacks[c]:
-                # top list must get a seat, else it's impossible to man all seats in this constituency
-                necessary.append({
-                    "constituency": c,
-                    "party": next_in,
-                    "divided_votes": div_next[2],
-                })
-                continue
-            _, div_after = apportion1d(
-                v_votes=m_votes[c],
-                num_total_seats=v_desired_row_sums[c],
-                prior_allocations=m_allocations[c],
-                divisor_gen=divisor_gen,
-                v_max_left=v_slacks
-            )
-
-            # Calculate relative superiority
-            rs = float(div_next[2])/div_after[2]
-            available.append({
-                "constituency": c,
-                "party": next_in,
-                "divided_votes": div_next[2],
-                "superiority": rs,
-            })
-
-        greatest = 0
+    table = divisor_table(divisor_gen, max([num_total_seats]
+        + [max(row, default=0) for row in m_allocations])+1)
+    v_col_slacks = v_subtract(v_desired_col_sums,
+                              [sum(col) for col in zip(*m_allocations)])
+    v_row_slacks = v_subtract(v_desired_row_sums,
+                              [sum(row) for row in m_allocations])
+
+    # For each unfilled constituency: whether its list next in line is
+    #  necessary, available or violating, the seat itself, and for available
+    #  ones, the sum of the slacks of the other lists and how many seats
+    #  each list gets in the continuation.
+    v_kinds = [None]*num_constituencies
+    v_next = [None]*num_constituencies
+    v_slack_sums = [None]*num_constituencies
+    v_continuations = [None]*num_constituencies
+
+    def find_next(c, n):
+        votes = m_votes[c]
+        allocations = m_allocations[c]
+        running_lists = [p for p in range(num_parties) if votes[p]>0]
+        if len(running_lists) == 0:
+            raise RuntimeError(f"After allocating {n} adjustment seats, "
+                f"constituency {c} has not been filled, "
+                "but there are no parties with any votes "
+                "in this constituency (after threshold elimination).")
+        hungry = any(v_col_slacks[p]>0 for p in running_lists)
+
+        # Find the party next in line in the constituency (if none of the
+        #  parties running in it, above threshold, need seats, any of them):
+        next_in = max((p for p in range(num_parties)
+                       if not hungry or v_col_slacks[p]>0),
+                      key=lambda p: (votes[p]*1.0/table[allocations[p]], -p))
+        item = {
+            "constituency": c,
+            "party": next_in,
+            "divided_votes": votes[next_in]*1.0/table[allocations[next_in]],
+        }
+        v_next[c] = item
+        if not hungry:
+            v_kinds[c] = "violating"
+            return
+
+        # Calculate continuation:
+        v_slacks = [v_col_slacks[p] if votes[p]>0 else 0 for p in range(num_parties)]
+        v_slacks[next_in] = 0
+        v_slack_sums[c] = sum(v_slacks)
+        if v_slack_sums[c] < v_row_slacks[c]:
+            # top list must get a seat, else it's impossible to man all seats in this constituency
+            v_kinds[c] = "necessary"
+            return
+        continuation, last_in, _ = jump_and_step(
+            votes,
+            sum(allocations) + 1 if simple else v_desired_row_sums[c],
+            allocations, table, v_slacks)
+        v_continuations[c] = continuation
+
+        # Calculate relative superiority
+        item["superiority"] = float(item["divided_votes"])/last_in[0]
+        v_kinds[c] = "available"
+
+    for c in range(num_constituencies):
+        if v_row_slacks[c]>0:
+            find_next(c, 0)
+
+    for n in range(num_total_seats-num_allocated):
+        # Allocate necessary seats first, then the one where the relative
+        #  superiority is highest, and violating seats last:
         first = None
-        if necessary:
-            # Allocate necessary seats first
-            for item in necessary:
-                if item["divided_votes"] > greatest:
-                    greatest = item["divided_votes"]
-                    first = item
-            first["reason"] = "Can't fill this constituency without this list"
-        elif available:
-            # Allocate seat in constituency where the calculated
-            #  relative superiority is highest:
-            for item in available:
-                if item["superiority"] > greatest:
-                    greatest = item["superiority"]
-                    first = item
-            first["reason"] = "Greatest relative superiority"
-        else:
-            assert violating
-            # Allocate violating seats last
-            for item in violating:
-                if item["divided_votes"] > greatest:
-                    greatest = item["divided_votes"]
-                    first = item
-            first["reason"] = "Must violate party sums to fill this constituency"
+        for kind, key in [("necessary", "divided_votes"),
+                          ("available", "superiority"),
+                          ("violating", "divided_votes")]:
+            greatest = 0
+            for c in range(num_constituencies):
+                if v_kinds[c] == kind and v_next[c][key] > greatest:
+                    greatest = v_next[c][key]
+                    first = v_next[c]
+            if first is not None:
+                break
+        assert first is not None
+        first = dict(first, reason=REASONS[kind])
         const = first["constituency"]
         party = first["party"]
         m_allocations[const][party] += 1
         allocation_sequence.append(first)
 
+        v_row_slacks[const] -= 1
+        v_col_slacks[party] -= 1
+        for c in range(num_constituencies):
+            if v_row_slacks[c] <= 0:
+                v_kinds[c] = None
+            elif c == const:
+                find_next(c, n+1)
+            elif m_votes[c][party] <= 0 or v_kinds[c] == "violating":
+                continue
+            elif v_col_slacks[party] == 0:
+                # The party no longer needs seats
+                find_next(c, n+1)
+            elif v_next[c]["party"] == party:
+                continue
+            elif v_kinds[c] == "available":
+                # The party still needs seats here: only violating seats go
+                #  to parties that don't, and those are only given once no
+                #  constituency is available.
+                v_slack_sums[c] -= 1
+                gets = v_continuations[c][party] - m_allocations[c][party]
+                if gets > v_col_slacks[party] \
+                        or v_slack_sums[c] < v_row_slacks[c]:
+                    find_next(c, n+1)
+
     return m_allocations, (allocation_sequence, present_allocation_sequence)
 
 
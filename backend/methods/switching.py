@@ -1,6 +1,7 @@
 import heapq
 
 from apportion import apportion1d
+from division_rules import divisor_table
 from table_util import v_subtract
 
 def switching(m_votes, v_desired_row_sums, v_desired_col_sums, m_prior_allocations,
@@ -41,45 +42,9 @@ def switching(m_votes, v_desired_row_sums, v_desired_col_sums, m_prior_allocatio
     #  too many seats to parties that have too few seats, prioritized by
     #  "sensitivity", until all parties have the correct number of seats
     #  or no more swaps can be made:
-
-    switches = []
-    done = False
-    while not done:
-        v_adj_seats = [sum(x) for x in zip(*m_adj_seats)]
-        diff_party = v_subtract(v_adj_seats, correct_adj_seats)
-
-        over = [i for i in range(len(diff_party)) if diff_party[i] > 0]
-        under = [i for i in range(len(diff_party)) if diff_party[i] < 0]
-        sensitivity = []
-        for i in range(len(m_votes)):
-            for j in over:
-                for k in under:
-                    if m_adj_seats[i][j] != 0 and m_votes[i][k] != 0:
-                        gen_j = divisor_gen()
-                        j_seats = m_prior_allocations[i][j]+m_adj_seats[i][j]
-                        for x in range(j_seats):
-                            div_j = next(gen_j)
-                        gen_k = divisor_gen()
-                        k_seats = m_prior_allocations[i][k]+m_adj_seats[i][k]
-                        for x in range(k_seats+1):
-                            div_k = next(gen_k)
-                        s = (m_votes[i][j]/div_j) / (m_votes[i][k]/div_k)
-                        heapq.heappush(sensitivity, (s,(i,j,k)))
-
-        done = len(sensitivity) == 0
-        if not done:
-            # Find the constituency and pair of parties with the lowest
-            #  sensitivity, and transfer a seat:
-            s, (i, j, k) = heapq.heappop(sensitivity)
-            m_adj_seats[i][j] -= 1
-            m_adj_seats[i][k] += 1
-            switches.append({
-                "constituency": i,
-                "from": j,
-                "to": k,
-                # "reason": "",
-                "sensitivity": s,
-            })
+    switches = switch_seats(m_votes, m_prior_allocations, m_adj_seats,
+                            correct_adj_seats, divisor_gen,
+                            sum(v_desired_row_sums))
 
     steps = {
         "initial_allocation": initial_allocation,
@@ -95,6 +60,80 @@ def switching(m_votes, v_desired_row_sums, v_desired_col_sums, m_prior_allocatio
 
 
 
+def switch_seats(m_votes, m_prior_allocations, m_adj_seats, correct_adj_seats,
+                 divisor_gen, num_total_seats):
+    """
+    Transfer adjustment seats in 'm_adj_seats' (in place) from parties that
+    have more than 'correct_adj_seats' to parties that have fewer, one at a
+    time, always making the transfer with the lowest sensitivity (ties going
+    to the lowest (constituency, from, to)), until no transfer can be made.
+    Returns the list of transfers made.
+
+    The candidate transfers are kept in a heap across transfers. A transfer
+    in constituency i from party j to party k only changes the sensitivity
+    of transfers in i from j or to k, so only those are pushed again; the
+    entries they replace, and those of parties that have reached their goal,
+    are discarded when they reach the top of the heap.
+    """
+    divisors = divisor_table(divisor_gen, num_total_seats+1)
+    v_adj_seats = [sum(x) for x in zip(*m_adj_seats)]
+    diff_party = v_subtract(v_adj_seats, correct_adj_seats)
+    over = {p for p in range(len(diff_party)) if diff_party[p] > 0}
+    under = {p for p in range(len(diff_party)) if diff_party[p] < 0}
+
+    generation = {}
+    sensitivity = []
+    def candidate(i, j, k):
+        # Replaces any earlier entry for (i, j, k), which becomes stale.
+        gen = generation.get((i, j, k), 0) + 1
+        generation[(i, j, k)] = gen
+        if m_adj_seats[i][j] != 0 and m_votes[i][k] != 0:
+            j_seats = m_prior_allocations[i][j]+m_adj_seats[i][j]
+            div_j = divisors[j_seats-1]
+            k_seats = m_prior_allocations[i][k]+m_adj_seats[i][k]
+            div_k = divisors[k_seats]
+            s = (m_votes[i][j]/div_j) / (m_votes[i][k]/div_k)
+            return (s, (i, j, k), gen)
+        return None
+
+    for i in range(len(m_votes)):
+        for j in over:
+            for k in under:
+                entry = candidate(i, j, k)
+                if entry is not None:
+                    sensitivity.append(entry)
+    heapq.heapify(sensitivity)
+
+    switches = []
+    while sensitivity:
+        s, (i, j, k), gen = heapq.heappop(sensitivity)
+        if gen != generation[(i, j, k)] or j not in over or k not in under:
+            continue
+        m_adj_seats[i][j] -= 1
+        m_adj_seats[i][k] += 1
+        switches.append({
+            "constituency": i,
+            "from": j,
+            "to": k,
+            # "reason": "",
+            "sensitivity": s,
+        })
+        diff_party[j] -= 1
+        diff_party[k] += 1
+        if diff_party[j] == 0:
+            over.remove(j)
+        if diff_party[k] == 0:
+            under.remove(k)
+        changed = [(i, j, l) for l in under] if j in over else []
+        changed += [(i, l, k) for l in over if l != j] if k in under else []
+        for key in changed:
+            entry = candidate(*key)
+            if entry is not None:
+                heapq.heappush(sensitivity, entry)
+
+    return switches
+
+
 def present_switching_sequence(rules, steps):
     headers = [
         "Party", "To be achieved", "All as const.", "Off by",
@@ -0,0 +1,123 @@
+from collections import deque
+from math import inf
+import numpy as np
+
+from batch_util import divisor_array, divisor_boundaries
+
+# Relative difference below which two scaled quotients count as tied. Every
+#  scaling step makes one tie exact up to rounding, which must still be seen
+#  as a tie after a few hundred further steps.
+TIE_TOLERANCE = 1e-10
+
+
+def tie_and_transfer(m_votes, v_desired_row_sums, v_desired_col_sums,
+                     m_prior_allocations, divisor_gen, threshold, **kwargs):
+    """
+    # Biproportional apportionment by the Tie-and-Transfer algorithm.
+
+    Finds the same allocation as alternating_scaling, i.e. seats given by
+    the divisor method to the votes divided by a constituency multiplier and
+    a party multiplier, meeting both the constituency and the party totals;
+    but exactly and in a bounded number of steps, failing only if no such
+    allocation exists.
+
+    The constituencies are kept apportioned throughout, starting with all
+    party multipliers at 1. A party that has too few seats takes a seat
+    from another party in a constituency where the two are tied, i.e. where
+    the latter's last seat has the same scaled quotient as the former's next
+    one. Transfers are made along paths of such ties ending with a party
+    that has too many seats. When there is no such path, the multipliers of
+    all the parties reached are lowered just enough to create a new tie.
+    Each step either reaches a new party or reduces the total excess.
+
+    Inputs:
+        - m_votes: A matrix of votes (rows: constituencies, columns:
+            parties)
+        - v_desired_row_sums: A vector of total seats in each constituency
+        - v_desired_col_sums: A vector of seats allocated to parties
+        - m_prior_allocations: A matrix of where parties have previously
+            gotten seats
+        - divisor_gen: A generator function generating divisors, e.g. d'Hondt
+        - threshold: A cutoff threshold for participation, between 0 and 100.
+    """
+    votes = np.array(m_votes, dtype=float)
+    priors = np.array(m_prior_allocations, dtype=int)
+    col_sums = np.array(v_desired_col_sums, dtype=int)
+    num_constituencies, num_parties = votes.shape
+    if sum(v_desired_row_sums) != col_sums.sum():
+        raise ValueError("Constituency and party totals do not match")
+
+    seats, _, _, failed = divisor_boundaries(
+        votes, v_desired_row_sums, priors, divisor_gen)
+    if failed.any():
+        raise ValueError("No valid recipient of a constituency seat")
+    divisors = divisor_array(divisor_gen, int(seats.max(initial=0)) + 1)
+    multipliers = np.ones(num_parties)
+
+    while True:
+        excess = seats.sum(axis=0) - col_sums
+        if not excess.any():
+            return seats.tolist(), None
+
+        # Scaled quotient of each list for its next seat, and for its last
+        #  seat above its prior allocation (inf if it has none):
+        with np.errstate(divide="ignore"):
+            next_q = votes/divisors[seats]/multipliers
+            last_q = np.where(seats > priors,
+                              votes/divisors[np.maximum(seats-1, 0)], inf)
+            last_q /= multipliers
+        # In a constituency, all next quotients are at most all last ones;
+        #  a party may take a seat from another where the two are equal.
+        highest_next = next_q.max(axis=1, keepdims=True)
+        lowest_last = last_q.min(axis=1, keepdims=True)
+        tied = highest_next >= lowest_last*(1-TIE_TOLERANCE)
+        can_gain = tied & (next_q >= lowest_last*(1-TIE_TOLERANCE))
+        can_lose = tied & (last_q <= highest_next*(1+TIE_TOLERANCE))
+
+        path, reached = find_transfer_path(excess, can_gain, can_lose)
+        if path is not None:
+            for const, gainer, loser in path:
+                seats[const, gainer] += 1
+                seats[const, loser] -= 1
+            continue
+
+        # No transfer possible: lower the multipliers of the parties reached
+        #  until one of them ties with a party not reached.
+        factor = (np.where(reached, next_q, 0).max(axis=1)
+                  / np.where(reached, inf, last_q).min(axis=1)).max()
+        if factor == 0:
+            raise ValueError("No allocation meets the party totals")
+        multipliers[reached] *= factor
+
+
+def find_transfer_path(excess, can_gain, can_lose):
+    """
+    Find a path of transfers from a party with too few seats to one with too
+    many, each taking a seat from the next party in a constituency where
+    the former can gain and the latter can lose.
+    Outputs:
+        - the path as a list of (constituency, gaining party, losing party),
+          or None if there is none
+        - boolean vector marking the parties reached
+    """
+    num_parties = len(excess)
+    reached = excess < 0
+    came_from = [None]*num_parties
+    queue = deque(np.flatnonzero(reached))
+    while queue:
+        party = queue.popleft()
+        for const in np.flatnonzero(can_gain[:, party]):
+            for other in np.flatnonzero(can_lose[const]):
+                if reached[other]:
+                    continue
+                reached[other] = True
+                came_from[other] = (const, party)
+                if excess[other] > 0:
+                    path = []
+                    while came_from[other] is not None:
+                        const, party = came_from[other]
+                        path.append((const, party, other))
+                        other = party
+                    return path, reached
+                queue.append(other)
+    return None, reached
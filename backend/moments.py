@@ -0,0 +1,187 @@
+#coding:utf-8
+"""
+Running moments of simulation measures.
+
+Instead of sums of powers of the values, which lose precision when the
+values are large or the count high, and can even give negative variances,
+the mean and the sums of the 2nd, 3rd and 4th powers of the deviations from
+the mean are kept and updated with the formulas of Welford and Pébay:
+
+    P. Pébay, "Formulas for robust, one-pass parallel computation of
+    covariances and arbitrary-order statistical moments", Sandia Report
+    SAND2008-6212, 2008.
+
+The same formulas combine the moments of two sets of values, so moments
+collected in batches or in separate processes can be merged.
+"""
+import numpy as np
+
+EPS = np.finfo(float).eps
+
+def combine(na, mean_a, m2a, m3a, m4a, nb, mean_b, m2b, m3b, m4b):
+    """
+    Count, mean and central moment sums of the union of two sets of values,
+    given those of each set. Works on numbers and on arrays alike; 'na' and
+    'nb' may not both be 0.
+    """
+    n = na + nb
+    delta = mean_b - mean_a
+    delta_n = delta/n
+    delta_n2 = delta_n*delta_n
+    term = delta*delta_n*na*nb
+    mean = mean_a + nb*delta_n
+    m4 = (m4a + m4b + term*delta_n2*(na*na - na*nb + nb*nb)
+          + 6*delta_n2*(na*na*m2b + nb*nb*m2a)
+          + 4*delta_n*(na*m3b - nb*m3a))
+    m3 = m3a + m3b + term*delta_n*(na - nb) + 3*delta_n*(na*m2b - nb*m2a)
+    m2 = m2a + m2b + term
+    return n, mean, m2, m3, m4
+
+
+class MomentAccumulator:
+    """
+    Count, mean, central moment sums, minimum and maximum of the values of a
+    number of named measures, each with values of shape 'shape' (e.g. a
+    table with an entry per constituency and party), stored in flat arrays.
+    """
+    def __init__(self, names, shape=()):
+        self.names = list(names)
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape, dtype=int))
+        self.offsets = {name: i*self.size for i, name in enumerate(self.names)}
+        self.strides = [int(np.prod(self.shape[i+1:], dtype=int))
+                        for i in range(len(self.shape))]
+        length = len(self.names)*self.size
+        self.cnt = np.zeros(length, dtype=int)
+        self.mean = np.zeros(length)
+        self.m2 = np.zeros(length)
+        self.m3 = np.zeros(length)
+        self.m4 = np.zeros(length)
+        self.min = np.zeros(length)
+        self.max = np.zeros(length)
+
+    def cells(self, name):
+        """Slice of the flat arrays holding the entries of 'name'."""
+        offset = self.offsets[name]
+        return slice(offset, offset+self.size)
+
+    def update(self, name, value, index=()):
+        """Add a single value to entry 'index' of measure 'name'."""
+        i = self.offsets[name] + sum(k*s for k, s in zip(index, self.strides))
+        na = int(self.cnt[i])
+        n, mean, m2, m3, m4 = combine(
+            na, float(self.mean[i]), float(self.m2[i]), float(self.m3[i]),
+            float(self.m4[i]), 1, value, 0, 0, 0)
+        self.cnt[i] = n
+        self.mean[i] = mean
+        self.m2[i] = m2
+        self.m3[i] = m3
+        self.m4[i] = m4
+        if na == 0:
+            self.min[i] = self.max[i] = value
+        elif value > self.max[i]:
+            self.max[i] = value
+        elif value < self.min[i]:
+            self.min[i] = value
+
+    def update_table(self, name, values):
+        """Add one value to each entry of measure 'name'."""
+        values = np.asarray(values, dtype=float).ravel()
+        cells = self.cells(name)
+        first = self.cnt[cells] == 0
+        n, mean, m2, m3, m4 = combine(
+            self.cnt[cells], self.mean[cells], self.m2[cells],
+            self.m3[cells], self.m4[cells], 1, values, 0, 0, 0)
+        self.cnt[cells] = n
+        self.mean[cells] = mean
+        self.m2[cells] = m2
+        self.m3[cells] = m3
+        self.m4[cells] = m4
+        self.max[cells] = np.where(first, values,
+                                   np.maximum(self.max[cells], values))
+        self.min[cells] = np.where(first, values,
+                                   np.minimum(self.min[cells], values))
+
+    def update_batch(self, name, values):
+        """
+        Add a stack of values, one value of shape 'shape' per row, to measure
+        'name'.
+        """
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return
+        values = values.reshape(len(values), self.size)
+        # Deviations are taken from the first row, which makes them exactly
+        #  0 for entries with the same value in every row, as in update().
+        shift = values[0]
+        dev = values - shift
+        mean_dev = dev.mean(axis=0)
+        mean = shift + mean_dev
+        dev -= mean_dev
+        dev2 = dev*dev
+        self.add(self.cells(name), len(values), mean, dev2.sum(axis=0),
+                 (dev2*dev).sum(axis=0), (dev2*dev2).sum(axis=0),
+                 values.min(axis=0), values.max(axis=0))
+
+    def merge(self, other):
+        """Merge the moments collected by another accumulator into this one."""
+        self.add(slice(None), other.cnt, other.mean, other.m2, other.m3,
+                 other.m4, other.min, other.max)
+
+    def add(self, cells, cnt, mean, m2, m3, m4, v_min, v_max):
+        na = self.cnt[cells].copy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            merged = combine(na, self.mean[cells], self.m2[cells],
+                             self.m3[cells], self.m4[cells],
+                             cnt, mean, m2, m3, m4)
+        ours = [self.cnt, self.mean, self.m2, self.m3, self.m4]
+        theirs = np.broadcast_arrays(cnt, mean, m2, m3, m4)
+        for array, merged_values, values in zip(ours, merged, theirs):
+            array[cells] = np.where(cnt == 0, array[cells],
+                                    np.where(na == 0, values, merged_values))
+        self.max[cells] = np.where(cnt == 0, self.max[cells],
+                                   np.where(na == 0, v_max,
+                                            np.maximum(self.max[cells], v_max)))
+        self.min[cells] = np.where(cnt == 0, self.min[cells],
+                                   np.where(na == 0, v_min,
+                                            np.minimum(self.min[cells], v_min)))
+
+    def analyze(self, names=None):
+        """
+        Aggregates of each measure in 'names' (all by default): count,
+        extremes, power sums, average, variance, standard deviation, skewness
+        and kurtosis, as numbers or nested lists of shape 'shape'.
+        """
+        results = {}
+        for name in self.names if names is None else names:
+            cells = self.cells(name)
+            n = self.cnt[cells]
+            m = self.mean[cells]
+            # Deviations are only accurate to a few units in the last place
+            #  of the mean, so a sum of their squares below that comes from
+            #  values that are all the same.
+            d = self.m2[cells]
+            d = np.where(d > n*(4*EPS*m)**2, d, 0.0)
+            h = self.m3[cells]
+            c = self.m4[cells]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                var = np.where(n > 1, d/(n-1), 0.0)
+                skewness = np.where(d != 0, h*np.sqrt(n/d)/d, 0.0)
+                kurtosis = np.where(d != 0, c*n/d**2, 0.0)
+            aggregates = {
+                "cnt": n,
+                "max": self.max[cells],
+                "min": self.min[cells],
+                "sum": n*m,
+                "sm2": d + n*m*m,
+                "sm3": h + m*(3*d + n*m*m),
+                "sm4": c + m*(4*h + m*(6*d + n*m*m)),
+                "avg": m,
+                "var": var,
+                "std": np.sqrt(var),
+                "skw": skewness,
+                "kur": kurtosis,
+            }
+            results[name] = {aggr: values.reshape(self.shape).tolist()
+                             for aggr, values in aggregates.items()}
+        return results
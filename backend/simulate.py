@@ -1,17 +1,27 @@
 # from voting import Election, SIMULATION_VARIATES
 import logging
 import json
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from datetime import datetime, timedelta
 from math import sqrt, exp
-from copy import copy, deepcopy
+import numpy as np
 
-from table_util import m_subtract, scale_matrix, add_totals, find_xtd_shares
+from table_util import m_subtract, add_totals, find_xtd_shares
+from batch_util import add_totals_batch, find_xtd_shares_batch, seq_sum, \
+    rounds_to
 from excel_util import simulation_to_xlsx
 from rules import Rules
+from moments import MomentAccumulator
+import profiling
+from profiling import Profile, timed
 import dictionaries as dicts
-from dictionaries import MEASURES, LIST_MEASURES, VOTE_MEASURES, AGGREGATES
+from dictionaries import MEASURES, LIST_MEASURES, VOTE_MEASURES
 import voting
 from electionHandler import ElectionHandler
+from methods.alternating_scaling import ScalingState
 
 logging.basicConfig(filename='logs/simulate.log', filemode='w', format='%(name)s - %(levelname)s - %(message)s')
 
@@ -41,48 +51,226 @@ def dev(results, ref):
             d += abs(results[c][p] - ref[c][p])
     return d
 
-def votes_to_change(election):
+def dev_batch(results, ref):
+    """Seat deviations of a stack of results from reference results."""
+    return np.abs(np.asarray(results) - ref).sum(axis=(1, 2))
+
+def fit_ideal_seats(m_votes, total_seats, v_row_sums, m_col_sums, rows=True,
+                    cols=True, digits=5, max_sweeps=1000, start=None):
+    """
+    Ideal seats for a stack of vote tables (shape (K, C, P)): the votes scaled
+    to the total number of seats, and then by iterative proportional fitting,
+    scaling each row to its sum in 'v_row_sums' (if 'rows') and each column
+    to its sum in 'm_col_sums' (shape (K, P); if 'cols') in turn, until the
+    relative changes in a sweep add up to 0 rounded to 'digits' decimal
+    places, or for at most 'max_sweeps' sweeps. 'start' is a pair of row and
+    column factors to scale the votes by first, e.g. those of a similar
+    vote table.
+    Outputs:
+        - array of ideal seats
+        - arrays of the row and column factors each table was scaled by
+          after the scaling to the total number of seats
+    """
+    m_votes = np.asarray(m_votes, dtype=float)
+    K, C, P = m_votes.shape
+    scalar = float(total_seats)/seq_sum(seq_sum(m_votes))
+    seats = m_votes*scalar[:, None, None]
+    row_factors = np.ones((K, C))
+    col_factors = np.ones((K, P))
+    if start is not None:
+        row_factors *= start[0]
+        col_factors *= start[1]
+        seats *= row_factors[:, :, None]*col_factors[:, None, :]
+    if P == 1 or C == 1:
+        return seats, row_factors, col_factors
+
+    # The tables still being scaled; all of them to begin with, in place.
+    #  Sums are taken from left to right (np.cumsum adds in order, unlike
+    #  np.sum), as the builtin sum() in the scalar loop this replaces did,
+    #  and so are the relative changes.
+    active = np.arange(K)
+    table, rf, cf = seats, row_factors, col_factors
+    col_sums = np.broadcast_to(m_col_sums, (K, P))
+    for sweep in range(max_sweeps):
+        n = len(active)
+        changes = np.zeros((n, 1 + C + P))
+        if rows:
+            s = table.cumsum(axis=2)[:, :, -1]
+            mult = np.divide(v_row_sums, s, out=np.ones((n, C)),
+                             where=s != 0)
+            np.abs(1-mult, out=changes[:, 1:1+C])
+            table *= mult[:, :, None]
+            rf *= mult
+        if cols:
+            s = table.cumsum(axis=1)[:, -1, :]
+            mult = np.divide(col_sums, s, out=np.ones((n, P)), where=s != 0)
+            np.abs(1-mult, out=changes[:, 1+C:])
+            table *= mult[:, None, :]
+            cf *= mult
+        done = rounds_to(changes.cumsum(axis=1)[:, -1], 0.0, digits)
+        if done.all():
+            break
+        if done.any():
+            seats[active] = table
+            row_factors[active] = rf
+            col_factors[active] = cf
+            left = ~done
+            active = active[left]
+            table, rf, cf = table[left], rf[left], cf[left]
+            col_sums = col_sums[left]
+    if len(active) < K:
+        seats[active] = table
+        row_factors[active] = rf
+        col_factors[active] = cf
+
+    return seats, row_factors, col_factors
+
+def votes_key(votes):
+    """A hashable key of a vote table, or of a stack of vote tables."""
+    if isinstance(votes, np.ndarray):
+        return (votes.shape, votes.dtype.str, votes.tobytes())
+    return tuple(tuple(row) for row in votes)
+
+def split_count(count, parts):
+    """Split 'count' into at most 'parts' nearly equal positive parts."""
+    parts = max(1, min(count, parts))
+    return [count//parts + (1 if i < count % parts else 0)
+            for i in range(parts)]
+
+def simulate_part(sim_rules, e_rules, vote_table, count, part):
+    """
+    Run 'count' simulations in a worker process, drawing votes from a random
+    stream of its own for 'part', and return the aggregates collected.
+    """
+    seeds = np.random.SeedSequence(sim_rules["seed"],
+                                   spawn_key=(sim_rules["stream"], part))
+    rules = SimulationRules()
+    rules.update(sim_rules)
+    rules["simulation_count"] = count
+    rules["num_workers"] = 1
+    rules["seed"] = int.from_bytes(seeds.generate_state(4).tobytes(), "little")
+    rules["stream"] = 0
+    simulation = Simulation(rules, e_rules, vote_table)
+    simulation.run_simulations()
+    return (simulation.moments, simulation.list_moments, simulation.profile,
+            simulation.scaling, simulation.iterations_with_no_solution)
+
+class VoteProbe(voting.Election):
+    """
+    The election of a reference election's votes with more votes for a
+    single list, for finding how many more it takes to change the results.
+    Only the constituency the votes are added in is apportioned again, and
+    only what goes into the results is computed.
+    """
+    def __init__(self, reference):
+        super(VoteProbe, self).__init__(
+            reference.rules, [list(row) for row in reference.m_votes])
+        self.reference = reference
+        self.v_desired_row_sums = reference.v_desired_row_sums
+        self.total_seats = reference.total_seats
+        self.gen = self.rules.get_generator("adj_alloc_divider")
+        # Probes are all alike, so alternating scaling starts from where it
+        #  converged on the last one.
+        self.scaling = ScalingState()
+        self.const = None
+
+    def changes_results(self, const, party, added):
+        """
+        Whether 'added' more votes for 'party' in constituency 'const'
+        change the results of the reference election.
+        """
+        ref = self.reference
+        self.m_votes[const][party] = ref.m_votes[const][party] + added
+        self.v_votes[party] = ref.v_votes[party] + added
+        self.const = const
+        try:
+            self.run_primary_apportionment()
+            # Adjustment seats only come on top of the constituency seats, so
+            #  a list with more of those than it had seats in all is enough.
+            if any(a > b for a, b in zip(self.m_const_seats_alloc[const],
+                                         ref.results[const])):
+                return True
+            self.run_threshold_elimination()
+            self.run_determine_adjustment_seats()
+            self.run_adjustment_method()
+            return dev(self.results, ref.results) != 0
+        finally:
+            self.m_votes[const][party] = ref.m_votes[const][party]
+            self.v_votes[party] = ref.v_votes[party]
+
+    def apportion_constituency(self, i):
+        if i != self.const:
+            return (list(self.reference.m_const_seats_alloc[i]),
+                    self.reference.last[i])
+        return super(VoteProbe, self).apportion_constituency(i)
+
+def find_votes_to_change(probe, const, party, max_votes):
+    """
+    Find the fewest additional votes for 'party' in constituency 'const'
+    that change the results of the reference election of 'probe', by
+    exponential search and bisection (taking more votes than that to change
+    them too), or None if not even 'max_votes' more do.
+    """
+    a = 0
+    b = max(int(0.1*probe.reference.m_votes[const][party]), 1)
+    while not probe.changes_results(const, party, b):
+        if b >= max_votes:
+            return None
+        a = b
+        b = max(int(sqrt(2)*b), b+1)
+    while b-a > 1:
+        x = int((b-a)*sqrt(0.5) + a)
+        if probe.changes_results(const, party, x):
+            b = x
+        else:
+            a = x
+    return b
+
+def votes_to_change_part(e_rules, votes, lists, max_votes):
+    """
+    Find the votes to change the results of the election of 'votes' by
+    'e_rules' for each of 'lists' (pairs of constituency and party) in a
+    worker process.
+    """
+    rules = voting.ElectionRules()
+    rules.update(e_rules)
+    election = voting.Election(rules, votes)
+    election.run()
+    probe = VoteProbe(election)
+    return [find_votes_to_change(probe, c, p, max_votes) for c, p in lists]
+
+def votes_to_change(election, num_workers=1, max_votes=None):
     """
     Find how many additional votes each individual list must receive
-    for the results of the given election to change.
+    for the results of the given election to change: None for lists
+    without votes, and if not even 'max_votes' more do (by default the
+    total votes times the number of seats). The lists are split between
+    'num_workers' processes.
     """
-    ref_results = election.results
     ref_votes = election.m_votes
-    votes_to_change = []
-    votes = deepcopy(ref_votes)
-    for c in range(len(ref_results)):
-        votes_to_change.append([])
-        for p in range(len(ref_results[c])):
-            if ref_votes[c][p] == 0:
-                votes_to_change[c].append(None)
-                continue
-            a = 0
-            b = int(0.1*votes[c][p])
-            d = 0
-            while d == 0:
-                votes[c][p] = ref_votes[c][p]+b
-                election = voting.Election(election.rules, votes)
-                results = election.run()
-                d = dev(results, ref_results)
-                if d == 0:
-                    a = copy(b)
-                    b = int(sqrt(2)*b)
-            m = b-a
-            x = 0
-            while m > 1:
-                x = int(m*sqrt(0.5) + a)
-                votes[c][p] = ref_votes[c][p]+x
-                election = voting.Election(election.rules, votes)
-                results = election.run()
-                d = dev(results, ref_results)
-                if d == 0:
-                    a = copy(x)
-                else:
-                    b = copy(x)
-                m = b-a
-            votes_to_change[c].append(b)
-            votes[c][p] = ref_votes[c][p]
-
+    if max_votes is None:
+        max_votes = max(sum(election.v_votes)*election.total_seats, 1)
+    lists = [(c, p) for c in range(len(ref_votes))
+             for p in range(len(ref_votes[c])) if ref_votes[c][p] != 0]
+
+    if num_workers > 1 and len(lists) > 1:
+        counts = split_count(len(lists), 4*num_workers)
+        ends = np.cumsum(counts)
+        parts = [lists[end-count:end] for count, end in zip(counts, ends)]
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(num_workers, mp_context=context) as executor:
+            found = [b for part in executor.map(
+                         votes_to_change_part, repeat(dict(election.rules)),
+                         repeat(ref_votes), parts, repeat(max_votes))
+                     for b in part]
+    else:
+        probe = VoteProbe(election)
+        found = [find_votes_to_change(probe, c, p, max_votes)
+                 for c, p in lists]
+
+    votes_to_change = [[None]*len(row) for row in ref_votes]
+    for (c, p), b in zip(lists, found):
+        votes_to_change[c][p] = b
     return votes_to_change
 
 
@@ -101,6 +289,30 @@ class SimulationRules(Rules):
         self["distribution_parameter"] = 100
         self["row_constraints"] = True
         self["col_constraints"] = True
+        # Number of vote tables drawn and evaluated together with array
+        #  operations; 1 evaluates one election at a time.
+        self["batch_size"] = 1
+        # Number of processes to split the simulations between.
+        self["num_workers"] = 1
+        # Seed and stream id of the random generator drawing the votes; with
+        #  no seed, one is drawn from the random module.
+        self["seed"] = None
+        self["stream"] = 0
+        # Whether to time the stages of elections and simulations (see
+        #  profiling.py); Simulation.timing switches it while running.
+        self["timing"] = False
+        # Whether alternating scaling starts from the multipliers it
+        #  converged to in the previous round. This takes fewer sweeps only
+        #  when the vote tables drawn are close, i.e. for a large
+        #  distribution parameter; the sweeps are counted either way.
+        self["warm_start"] = False
+        # Iterative proportional fitting of the ideal seats stops when the
+        #  relative changes in a sweep add up to 0 rounded to
+        #  'ideal_seats_digits' decimal places, or after
+        #  'ideal_seats_max_sweeps' sweeps. With 'warm_start', it starts from
+        #  the factors of the previous round.
+        self["ideal_seats_digits"] = 5
+        self["ideal_seats_max_sweeps"] = 1000
 
 
 class Simulation:
@@ -108,6 +320,15 @@ class Simulation:
     def __init__(self, sim_rules, e_rules, vote_table):
         self.e_handler = ElectionHandler(vote_table, e_rules)
         self.e_rules = [el.rules for el in self.e_handler.elections]
+        self.rules_keys = [rules.canonical_key() for rules in self.e_rules]
+        self.comparison_rules = []
+        for rules in self.e_rules:
+            self.comparison_rules.append({
+                option: (comparison, comparison.canonical_key())
+                for option, comparison
+                in rules.generate_comparison_rules("all").items()
+            })
+        self.comparisons = {}
         self.num_rulesets = len(self.e_rules)
         self.vote_table = self.e_handler.vote_table
         self.constituencies = self.vote_table["constituencies"]
@@ -118,141 +339,71 @@ class Simulation:
         self.xtd_votes = add_totals(self.base_votes)
         self.xtd_vote_shares = find_xtd_shares(self.xtd_votes)
         self.sim_rules = sim_rules
+        # Alternating scaling state for each distinct set of rules:
+        self.scaling = {}
+        # Row and column factors of the last ideal seats of each ruleset:
+        self.ideal_seat_factors = {}
+        for election, key in zip(self.e_handler.elections, self.rules_keys):
+            election.scaling = self.scaling_state(key)
         self.num_total_simulations = self.sim_rules["simulation_count"]
         self.variate = self.sim_rules["gen_method"]
         self.stbl_param = self.sim_rules["distribution_parameter"]
         self.iteration = 0
         self.terminate = False
         self.iteration_time = timedelta(0)
+        self.timing = self.sim_rules["timing"]
+        self.profile = Profile()
 
-        self.data = []
-        self.list_data = []
+        self.moments = []
+        self.list_moments = []
         for ruleset in range(self.num_rulesets):
-            self.data.append({})
-            for measure in MEASURES.keys():
-                self.data[ruleset][measure] = {
-                    aggr: 0
-                    for aggr in AGGREGATES.keys()
-                }
             num_constituencies = len(self.e_rules[ruleset]["constituencies"])
-            self.list_data.append({})
-            for measure in LIST_MEASURES.keys():
-                self.list_data[ruleset][measure] = {}
-                for aggr in AGGREGATES.keys():
-                    self.list_data[ruleset][measure][aggr] = []
-                    for c in range(num_constituencies+1):
-                        self.list_data[ruleset][measure][aggr].append([0]*(self.num_parties+1))
-
-        self.data.append({})
-        self.data[-1]["time"] = {}
-        for aggr in AGGREGATES.keys():
-            self.data[-1]["time"][aggr] = 0
-        self.list_data.append({})
-        for measure in VOTE_MEASURES.keys():
-            self.list_data[-1][measure] = {}
-            for aggr in AGGREGATES.keys():
-                self.list_data[-1][measure][aggr] = []
-                for c in range(self.num_constituencies+1):
-                    self.list_data[-1][measure][aggr].append([0]*(self.num_parties+1))
+            self.moments.append(MomentAccumulator(MEASURES.keys()))
+            self.list_moments.append(MomentAccumulator(LIST_MEASURES.keys(),
+                (num_constituencies+1, self.num_parties+1)))
+        self.moments.append(MomentAccumulator(["time"]))
+        self.list_moments.append(MomentAccumulator(VOTE_MEASURES.keys(),
+            (self.num_constituencies+1, self.num_parties+1)))
+        self.data = [moments.analyze() for moments in self.moments]
+        self.list_data = [moments.analyze() for moments in self.list_moments]
 
         self.run_initial_elections()
 
     def aggregate_list(self, ruleset, measure, const, party, value):
-        self.list_data[ruleset][measure]["cnt"][const][party] += 1
-        self.list_data[ruleset][measure]["sum"][const][party] += value
-        self.list_data[ruleset][measure]["sm2"][const][party] += value**2
-        self.list_data[ruleset][measure]["sm3"][const][party] += value**3
-        self.list_data[ruleset][measure]["sm4"][const][party] += value**4
-        if (self.list_data[ruleset][measure]["cnt"][const][party] > 1):
-            if (value > self.list_data[ruleset][measure]["max"][const][party]):
-                self.list_data[ruleset][measure]["max"][const][party] = value
-            if (value < self.list_data[ruleset][measure]["min"][const][party]):
-                self.list_data[ruleset][measure]["min"][const][party] = value
-        else:
-            self.list_data[ruleset][measure]["max"][const][party] = value
-            self.list_data[ruleset][measure]["min"][const][party] = value
+        self.list_moments[ruleset].update(measure, value, (const, party))
+
+    def aggregate_table(self, ruleset, measure, values):
+        """Aggregate a table of values of a list measure, entry by entry."""
+        self.list_moments[ruleset].update_table(measure, values)
+
+    def aggregate_list_batch(self, ruleset, measure, values):
+        """Aggregate a stack of tables of values of a list measure."""
+        self.list_moments[ruleset].update_batch(measure, values)
 
     def analyze_list(self, ruleset, measure, const, party):
-        n = float(self.list_data[ruleset][measure]["cnt"][const][party])
-        s = float(self.list_data[ruleset][measure]["sum"][const][party])
-        t = float(self.list_data[ruleset][measure]["sm2"][const][party])
-        q = float(self.list_data[ruleset][measure]["sm3"][const][party])
-        r = float(self.list_data[ruleset][measure]["sm4"][const][party])
-        m = s/n if n>0 else 0 #average
-        d =                   t - m*s   # = \sum_{i=1}^{n}(x_i-avg)^2
-        h =          q -   m*(t + 2*d)  # = \sum_{i=1}^{n}(x_i-avg)^3
-        c = r - m*(4*q - 3*m*(t +   d)) # = \sum_{i=1}^{n}(x_i-avg)^4
-        if d < 0:
-            if d < -0.0000001:
-                logging.warning(f'Negative d encountered: {d}. '
-                    f'Measure: {measure}, const: {const}, party: {party}')
-            if d < -0.01:
-                message = "Variance very negative. What's going on here?"
-                logging.error(message)
-                raise ValueError(message)
-            d = 0
-        var = d / (n-1) if n>1 else 0
-        std = sqrt(var)
-        skewness = h*sqrt(n/d)/d if d!=0 else 0
-        kurtosis = c*n/d**2      if d!=0 else 0
-        self.list_data[ruleset][measure]["avg"][const][party] = m
-        self.list_data[ruleset][measure]["var"][const][party] = var
-        self.list_data[ruleset][measure]["std"][const][party] = std
-        self.list_data[ruleset][measure]["skw"][const][party] = skewness
-        self.list_data[ruleset][measure]["kur"][const][party] = kurtosis
+        aggregates = self.list_moments[ruleset].analyze([measure])[measure]
+        for aggr, values in aggregates.items():
+            self.list_data[ruleset][measure][aggr][const][party] = \
+                values[const][party]
 
     def aggregate_measure(self, ruleset, measure, value):
-        self.data[ruleset][measure]["cnt"] += 1
-        self.data[ruleset][measure]["sum"] += value
-        self.data[ruleset][measure]["sm2"] += value**2
-        self.data[ruleset][measure]["sm3"] += value**3
-        self.data[ruleset][measure]["sm4"] += value**4
-        if (self.data[ruleset][measure]["cnt"] > 1):
-            if (value > self.data[ruleset][measure]["max"]):
-                self.data[ruleset][measure]["max"] = value
-            if (value < self.data[ruleset][measure]["min"]):
-                self.data[ruleset][measure]["min"] = value
-        else:
-            self.data[ruleset][measure]["max"] = value
-            self.data[ruleset][measure]["min"] = value
+        self.moments[ruleset].update(measure, value)
+
+    def aggregate_measure_batch(self, ruleset, measure, values):
+        self.moments[ruleset].update_batch(measure, values)
 
     def analyze_measure(self, ruleset, measure):
-        n = float(self.data[ruleset][measure]["cnt"])
-        s = float(self.data[ruleset][measure]["sum"])
-        t = float(self.data[ruleset][measure]["sm2"])
-        q = float(self.data[ruleset][measure]["sm3"])
-        r = float(self.data[ruleset][measure]["sm4"])
-        m = s/n if n>0 else 0 #average
-        d =                   t - m*s   # = \sum_{i=1}^{n}(x_i-avg)^2
-        h =          q -   m*(t + 2*d)  # = \sum_{i=1}^{n}(x_i-avg)^3
-        c = r - m*(4*q - 3*m*(t +   d)) # = \sum_{i=1}^{n}(x_i-avg)^4
-        if d < 0:
-            if d < -0.0000001:
-                logging.warning(f'Negative d encountered: {d}. '
-                    f'Measure: {measure}, const: {const}, party: {party}')
-            if d < -0.01:
-                message = "Variance very negative. What's going on here?"
-                logging.error(message)
-                raise ValueError(message)
-            d = 0
-        var = d / (n-1) if n>1 else 0
-        std = sqrt(var)
-        skewness = h*sqrt(n/d)/d if d!=0 else 0
-        kurtosis = c*n/d**2      if d!=0 else 0
-        self.data[ruleset][measure]["avg"] = m
-        self.data[ruleset][measure]["var"] = var
-        self.data[ruleset][measure]["std"] = std
-        self.data[ruleset][measure]["skw"] = skewness
-        self.data[ruleset][measure]["kur"] = kurtosis
+        self.data[ruleset][measure].update(
+            self.moments[ruleset].analyze([measure])[measure])
 
     def run_initial_elections(self):
         self.base_allocations = []
-        for election in self.e_handler.elections:
+        for ruleset, election in enumerate(self.e_handler.elections):
             xtd_total_seats = add_totals(election.results)
             xtd_const_seats = add_totals(election.m_const_seats_alloc)
             xtd_adj_seats = m_subtract(xtd_total_seats, xtd_const_seats)
             xtd_seat_shares = find_xtd_shares(xtd_total_seats)
-            ideal_seats = self.calculate_ideal_seats(election)
+            ideal_seats = self.calculate_ideal_seats(ruleset, election)
             xtd_ideal_seats = add_totals(ideal_seats)
             self.base_allocations.append({
                 "xtd_const_seats": xtd_const_seats,
@@ -263,15 +414,28 @@ class Simulation:
                 "step_info": election.adj_seats_info,
             })
 
+    def vote_generator(self):
+        """
+        Set up the generating method to generate votes similar to the given
+        votes, seeded as the simulation rules say. With a seed given, the
+        random module (which some adjustment methods break ties with) is
+        seeded too, so that the whole simulation can be reproduced.
+        """
+        seed = self.sim_rules["seed"]
+        stream = self.sim_rules["stream"]
+        if seed is None:
+            seed = random.getrandbits(128)
+        else:
+            random.seed(f"{seed}/{stream}")
+        gen = dicts.GENERATING_METHODS[self.variate]
+        return gen(self.base_votes, self.stbl_param, seed, stream)
+
     def gen_votes(self):
         """
         Generate votes similar to given votes using the given
         generating method.
         """
-        gen = dicts.GENERATING_METHODS[self.variate]
-        while True:
-            votes = gen(self.base_votes, self.stbl_param)
-            yield votes
+        return iter(self.vote_generator())
 
     def test_generated(self):
         """Analysis of generated votes."""
@@ -291,47 +455,91 @@ class Simulation:
     def collect_votes(self, votes):
         xtd_votes  = add_totals(votes)
         xtd_shares = find_xtd_shares(xtd_votes)
-        for c in range(self.num_constituencies+1):
-            for p in range(self.num_parties+1):
-                self.aggregate_list(-1, "sim_votes", c, p, xtd_votes[c][p])
-                self.aggregate_list(-1, "sim_shares", c, p, xtd_shares[c][p])
+        self.aggregate_table(-1, "sim_votes", xtd_votes)
+        self.aggregate_table(-1, "sim_shares", xtd_shares)
 
     def collect_measures(self, votes):
-        self.e_handler.set_votes(votes)
+        with timed("elections"):
+            self.e_handler.set_votes(votes)
+        self.start_round(self.e_handler.elections)
         self.collect_votes(votes)
         for ruleset in range(self.num_rulesets):
             election = self.e_handler.elections[ruleset]
-            self.collect_list_measures(ruleset, election)
-            self.collect_general_measures(ruleset, election)
+            with timed("ideal seats"):
+                ideal_seats = self.calculate_ideal_seats(ruleset, election)
+            with timed("list measures"):
+                self.collect_list_measures(ruleset, election, ideal_seats)
+            self.collect_general_measures(ruleset, election, ideal_seats)
 
-    def collect_list_measures(self, ruleset, election):
+    def collect_list_measures(self, ruleset, election, ideal_seats):
         const_seats_alloc = add_totals(election.m_const_seats_alloc)
         total_seats_alloc = add_totals(election.results)
-        ideal_seats = add_totals(self.calculate_ideal_seats(election))
-        for c in range(1+election.num_constituencies):
-            for p in range(1+self.num_parties):
-                cs  = const_seats_alloc[c][p]
-                ts  = total_seats_alloc[c][p]
-                adj = ts - cs
-                sh  = float(ts)/total_seats_alloc[c][-1]
-                ids = ideal_seats[c][p]
-                self.aggregate_list(ruleset, "const_seats", c, p, cs)
-                self.aggregate_list(ruleset, "total_seats", c, p, ts)
-                self.aggregate_list(ruleset, "adj_seats",   c, p, adj)
-                self.aggregate_list(ruleset, "seat_shares", c, p, sh)
-                self.aggregate_list(ruleset, "ideal_seats", c, p, ids)
-
-    def collect_general_measures(self, ruleset, election):
+        ideal_seats = add_totals(ideal_seats)
+        adj_seats_alloc = m_subtract(total_seats_alloc, const_seats_alloc)
+        seat_shares = [[float(ts)/row[-1] for ts in row]
+                       for row in total_seats_alloc]
+        self.aggregate_table(ruleset, "const_seats", const_seats_alloc)
+        self.aggregate_table(ruleset, "total_seats", total_seats_alloc)
+        self.aggregate_table(ruleset, "adj_seats",   adj_seats_alloc)
+        self.aggregate_table(ruleset, "seat_shares", seat_shares)
+        self.aggregate_table(ruleset, "ideal_seats", ideal_seats)
+
+    def collect_general_measures(self, ruleset, election, ideal_seats):
         """Various tests to determine the quality of the given method."""
         self.aggregate_measure(ruleset, "adj_dev", election.adj_dev)
-        opt_results = self.entropy(ruleset, election)
-        self.deviation_measures(ruleset, election, opt_results)
-        self.other_measures(ruleset, election)
+        with timed("entropy"):
+            opt_results = self.entropy(ruleset, election)
+        with timed("deviation measures"):
+            self.deviation_measures(ruleset, election, opt_results)
+        with timed("ideal seat measures"):
+            self.other_measures(ruleset, election, ideal_seats)
+
+    def start_round(self, elections):
+        """
+        Forget the comparison elections of the previous round, and make the
+        elections of this round available for comparison.
+        """
+        self.comparisons = {
+            (key, votes_key(election.m_votes)): election
+            for key, election in zip(self.rules_keys, elections)
+        }
+
+    def comparison_election(self, ruleset, option, votes):
+        """
+        The election by the comparison rules 'option' of 'ruleset' (see
+        ElectionRules.generate_comparison_rules) on 'votes'. Each distinct
+        election is run only once per round, however many rulesets are
+        compared with it.
+        """
+        rules, rules_key = self.comparison_rules[ruleset][option]
+        key = (rules_key, votes_key(votes))
+        election = self.comparisons.get(key)
+        if election is None:
+            if isinstance(votes, np.ndarray):
+                with timed("batch: comparison: " + option):
+                    election = voting.BatchElection(rules, votes)
+                    election.scaling = self.scaling_state(rules_key)
+                    election.run(check_solvability=False)
+            else:
+                with timed("comparison: " + option):
+                    election = voting.Election(rules, votes)
+                    election.scaling = self.scaling_state(rules_key)
+                    election.run()
+            self.comparisons[key] = election
+        return election
+
+    def scaling_state(self, rules_key):
+        """The alternating scaling state of the rules with key 'rules_key'."""
+        state = self.scaling.get(rules_key)
+        if state is None:
+            state = self.scaling[rules_key] = ScalingState(
+                self.sim_rules["warm_start"])
+        return state
 
     def entropy(self, ruleset, election):
-        opt_rules = election.rules.generate_opt_ruleset()
-        opt_election = voting.Election(opt_rules, election.m_votes)
-        opt_results = opt_election.run()
+        opt_election = self.comparison_election(ruleset, "opt",
+                                                election.m_votes)
+        opt_results = opt_election.results
         entropy = election.entropy()
         self.aggregate_measure(ruleset, "entropy", entropy)
         entropy_ratio = exp(entropy - opt_election.entropy())
@@ -346,8 +554,7 @@ class Simulation:
         v_results = [sum(x) for x in zip(*election.results)]
         self.deviation(ruleset, "one_const", [election.v_votes], [v_results])
 
-    def other_measures(self, ruleset, election):
-        ideal_seats = self.calculate_ideal_seats(election)
+    def other_measures(self, ruleset, election, ideal_seats):
         self.sum_abs(ruleset, election, ideal_seats)
         self.sum_pos(ruleset, election, ideal_seats)
         self.sum_sq(ruleset, election, ideal_seats)
@@ -355,8 +562,7 @@ class Simulation:
 
     def deviation(self, ruleset, option, votes, reference_results, results=None):
         if results == None:
-            rules = self.e_rules[ruleset].generate_comparison_rules(option)
-            results = voting.Election(rules, votes).run()
+            results = self.comparison_election(ruleset, option, votes).results
         deviation = dev(reference_results, results)
         self.aggregate_measure(ruleset, "dev_"+option, deviation)
         if option != "one_const":
@@ -365,40 +571,47 @@ class Simulation:
             deviation = dev([ref_totals], [comp_totals])
             self.aggregate_measure(ruleset, f"dev_{option}_totals", deviation)
 
-    def calculate_ideal_seats(self, election):
-        scalar = float(election.total_seats) / sum(sum(x) for x in election.m_votes)
-        ideal_seats = scale_matrix(election.m_votes, scalar)
+    def calculate_ideal_seats(self, ruleset, election):
         assert election.solvable
-        rein = 0
-        error = 1
-        if self.num_parties > 1 and election.num_constituencies > 1:
-            while round(error, 5) != 0.0:
-                error = 0
-                if self.sim_rules["row_constraints"]:
-                    for c in range(election.num_constituencies):
-                        s = sum(ideal_seats[c])
-                        if s != 0:
-                            mult = float(election.v_desired_row_sums[c])/s
-                            error += abs(1-mult)
-                            mult += rein*(1-mult)
-                            for p in range(self.num_parties):
-                                ideal_seats[c][p] *= mult
-                if self.sim_rules["col_constraints"]:
-                    for p in range(self.num_parties):
-                        s = sum([c[p] for c in ideal_seats])
-                        if s != 0:
-                            mult = float(election.v_desired_col_sums[p])/s
-                            error += abs(1-mult)
-                            mult += rein*(1-mult)
-                            for c in range(election.num_constituencies):
-                                ideal_seats[c][p] *= mult
+        ideal_seats = self.fit_ideal_seats(
+            ruleset, [election.m_votes], election.total_seats,
+            election.v_desired_row_sums, election.v_desired_col_sums)
+        return ideal_seats[0].tolist()
 
-        try:
-            assert [sum(x) for x in zip(*ideal_seats)] == election.v_desired_col_sums
-            assert [sum(x) for x in ideal_seats] == election.v_desired_row_sums
-        except AssertionError:
-            pass
+    def calculate_ideal_seats_batch(self, ruleset, election, ok):
+        """
+        Batch version of calculate_ideal_seats, for the elections marked in
+        'ok' of a BatchElection.
+        """
+        ideal_seats = np.zeros(election.m_votes.shape)
+        active = np.flatnonzero(ok)
+        if len(active) > 0:
+            ideal_seats[active] = self.fit_ideal_seats(
+                ruleset, election.m_votes[active], election.total_seats,
+                election.v_desired_row_sums,
+                election.v_desired_col_sums[active])
+        return ideal_seats
 
+    def fit_ideal_seats(self, ruleset, m_votes, total_seats, v_row_sums,
+                        m_col_sums):
+        """
+        fit_ideal_seats by the simulation rules, starting from the factors
+        of the last vote table of the ruleset with 'warm_start', and keeping
+        those of the last one here.
+        """
+        start = None
+        if self.sim_rules["warm_start"]:
+            start = self.ideal_seat_factors.get(ruleset)
+        ideal_seats, row_factors, col_factors = fit_ideal_seats(
+            m_votes, total_seats, v_row_sums, m_col_sums,
+            rows=self.sim_rules["row_constraints"],
+            cols=self.sim_rules["col_constraints"],
+            digits=self.sim_rules["ideal_seats_digits"],
+            max_sweeps=self.sim_rules["ideal_seats_max_sweeps"],
+            start=start)
+        factors = (row_factors[-1], col_factors[-1])
+        if all(np.isfinite(f).all() and (f > 0).all() for f in factors):
+            self.ideal_seat_factors[ruleset] = factors
         return ideal_seats
 
     #Loosemore-Hanby
@@ -440,24 +653,155 @@ class Simulation:
         ])
         self.aggregate_measure(ruleset, "sum_pos", dh_sum)
 
+    def collect_batch_votes(self, votes):
+        xtd_votes = add_totals_batch(votes)
+        self.aggregate_list_batch(-1, "sim_votes", xtd_votes)
+        self.aggregate_list_batch(-1, "sim_shares",
+                                  find_xtd_shares_batch(xtd_votes))
+
+    def collect_batch_measures(self, votes):
+        """
+        Batch version of collect_measures, for a stack of vote tables.
+
+        Where collect_measures raises ValueError part of the way through, the
+        vote table still contributes to the measures aggregated up to that
+        point; so it does here. Returns a boolean vector marking the vote
+        tables that made it all the way through.
+        """
+        elections = []
+        ok = np.ones(len(votes), dtype=bool)
+        for election in self.e_handler.elections:
+            rules = election.rules
+            if rules["seat_spec_option"] == "one_const":
+                batch = voting.BatchElection(rules,
+                                             votes.sum(axis=1, keepdims=True))
+            else:
+                batch = voting.BatchElection(rules, votes)
+            batch.scaling = election.scaling
+            with timed("batch: elections"):
+                batch.run()
+            ok &= ~batch.failed
+            elections.append(batch)
+        self.start_round(elections)
+        for batch in elections:
+            ok &= batch.solvable
+
+        self.collect_batch_votes(votes[ok])
+        for ruleset in range(self.num_rulesets):
+            election = elections[ruleset]
+            with timed("batch: ideal seats"):
+                ideal_seats = self.calculate_ideal_seats_batch(ruleset,
+                                                               election, ok)
+            with timed("batch: list measures"):
+                self.collect_batch_list_measures(ruleset, election,
+                                                 ideal_seats, ok)
+            with timed("batch: general measures"):
+                ok = self.collect_batch_general_measures(ruleset, election,
+                                                         ideal_seats, ok)
+        return ok
+
+    def collect_batch_list_measures(self, ruleset, election, ideal_seats, ok):
+        const_seats_alloc = add_totals_batch(election.m_const_seats_alloc[ok])
+        total_seats_alloc = add_totals_batch(election.results[ok])
+        self.aggregate_list_batch(ruleset, "const_seats", const_seats_alloc)
+        self.aggregate_list_batch(ruleset, "total_seats", total_seats_alloc)
+        self.aggregate_list_batch(ruleset, "adj_seats",
+                                  total_seats_alloc - const_seats_alloc)
+        self.aggregate_list_batch(ruleset, "seat_shares",
+            total_seats_alloc/total_seats_alloc[:, :, -1:])
+        self.aggregate_list_batch(ruleset, "ideal_seats",
+                                  add_totals_batch(ideal_seats[ok]))
+
+    def collect_batch_general_measures(self, ruleset, election, ideal_seats,
+                                       ok):
+        self.aggregate_measure_batch(ruleset, "adj_dev", election.adj_dev[ok])
+
+        opt_election = self.comparison_election(ruleset, "opt",
+                                                election.m_votes)
+        opt_results = opt_election.results
+        ok = ok & ~opt_election.failed
+        entropy, failed = election.entropy()
+        ok &= ~failed
+        self.aggregate_measure_batch(ruleset, "entropy", entropy[ok])
+        opt_entropy, failed = opt_election.entropy()
+        ok &= ~failed
+        entropy_ratio = np.array([exp(x) for x in (entropy - opt_entropy)[ok]])
+        self.aggregate_measure_batch(ruleset, "entropy_ratio", entropy_ratio)
+
+        ok = self.deviation_batch(ruleset, "opt", None, election.results, ok,
+                                  opt_results)
+        for option in ["law", "ind_const", "all_adj"]:
+            ok = self.deviation_batch(ruleset, option, election.m_votes,
+                                      election.results, ok)
+        ok = self.deviation_batch(ruleset, "one_const",
+                                  election.v_votes[:, None, :],
+                                  election.results.sum(axis=1)[:, None, :], ok)
+
+        return self.other_measures_batch(ruleset, election, ideal_seats, ok)
+
+    def deviation_batch(self, ruleset, option, votes, reference_results, ok,
+                        results=None):
+        if results is None:
+            comparison = self.comparison_election(ruleset, option, votes)
+            results = comparison.results
+            ok = ok & ~comparison.failed
+        self.aggregate_measure_batch(ruleset, "dev_"+option,
+                                     dev_batch(reference_results, results)[ok])
+        if option != "one_const":
+            ref_totals = reference_results.sum(axis=1)[:, None, :]
+            comp_totals = results.sum(axis=1)[:, None, :]
+            self.aggregate_measure_batch(ruleset, f"dev_{option}_totals",
+                                         dev_batch(ref_totals, comp_totals)[ok])
+        return ok
+
+    def other_measures_batch(self, ruleset, election, ideal_seats, ok):
+        """sum_abs, sum_pos, sum_sq and min_seat_value for a batch."""
+        # The scalar measures sum over parties in the outer loop:
+        ideal_seats = ideal_seats[ok].transpose(0, 2, 1)
+        results = election.results[ok].transpose(0, 2, 1)
+        n, P, C = results.shape
+        ideal_seats = ideal_seats.reshape(n, P*C)
+        results = results.reshape(n, P*C)
+        diff = ideal_seats - results
+        nonzero = ideal_seats != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lh = seq_sum(np.abs(diff))
+            dh_sum = seq_sum(np.where(nonzero,
+                                      np.maximum(0, diff)/ideal_seats, 0))
+            stl = seq_sum(np.where(nonzero, diff**2/ideal_seats, 0))
+            dh_min = np.where(results != 0, ideal_seats/results, np.inf)
+        self.aggregate_measure_batch(ruleset, "sum_abs", lh)
+        self.aggregate_measure_batch(ruleset, "sum_pos", dh_sum)
+        self.aggregate_measure_batch(ruleset, "sum_sq", stl)
+        # min() of an empty sequence raises ValueError in min_seat_value:
+        no_seats = (results == 0).all(axis=1)
+        self.aggregate_measure_batch(ruleset, "min_seat_value",
+                                     dh_min.min(axis=1)[~no_seats])
+        ok = ok.copy()
+        ok[np.flatnonzero(ok)[no_seats]] = False
+        return ok
+
     def analysis(self):
         """Calculate averages and variances of various quality measures."""
-        for ruleset in range(self.num_rulesets):
-            for measure in MEASURES.keys():
-                self.analyze_measure(ruleset, measure)
-            num_constituencies = len(self.e_rules[ruleset]["constituencies"])
-            for c in range(1+num_constituencies):
-                for p in range(1+self.num_parties):
-                    for measure in LIST_MEASURES.keys():
-                        self.analyze_list(ruleset, measure, c, p)
-        self.analyze_measure(-1, "time")
-        for c in range(1+self.num_constituencies):
-            for p in range(1+self.num_parties):
-                for measure in VOTE_MEASURES.keys():
-                    self.analyze_list(-1, measure, c, p)
+        for data, moments in zip(self.data + self.list_data,
+                                 self.moments + self.list_moments):
+            for measure, aggregates in moments.analyze().items():
+                data[measure].update(aggregates)
 
     def simulate(self):
         """Simulate many elections."""
+        if self.sim_rules["num_workers"] > 1 and self.num_total_simulations > 0:
+            self.run_in_processes()
+        else:
+            self.run_simulations()
+        self.analysis()
+        self.test_generated()
+
+    def run_simulations(self):
+        """Simulate elections in this process and aggregate the measures."""
+        if self.sim_rules["batch_size"] > 1:
+            self.run_batches()
+            return
         gen = self.gen_votes()
         if self.num_total_simulations == 0:
             self.collect_measures(self.base_votes)
@@ -466,8 +810,10 @@ class Simulation:
             round_start = datetime.now()
             if self.terminate:
                 break
+            self.time_stages()
             self.iteration = i + 1
-            votes = next(gen)
+            with timed("vote generation"):
+                votes = next(gen)
             try:
                 self.collect_measures(votes)
             except ValueError:
@@ -476,8 +822,83 @@ class Simulation:
             round_end = datetime.now()
             self.iteration_time = round_end - round_start
             self.aggregate_measure(-1, "time", self.iteration_time.total_seconds())
-        self.analysis()
-        self.test_generated()
+        profiling.use(None)
+
+    def run_batches(self):
+        """
+        Simulate elections, evaluating 'batch_size' generated vote tables at
+        a time with array operations. Gives the same elections as simulating
+        them one at a time for the same random state.
+        """
+        gen = self.vote_generator()
+        if self.num_total_simulations == 0:
+            self.collect_measures(self.base_votes)
+        self.iterations_with_no_solution = 0
+        batch_size = self.sim_rules["batch_size"]
+        done = 0
+        while done < self.num_total_simulations and not self.terminate:
+            batch_start = datetime.now()
+            K = min(batch_size, self.num_total_simulations - done)
+            self.time_stages()
+            with timed("batch: vote generation"):
+                votes = gen.draw(K)
+            ok = self.collect_batch_measures(votes)
+            done += K
+            self.iteration = done
+            self.iterations_with_no_solution += K - int(ok.sum())
+            batch_end = datetime.now()
+            self.iteration_time = (batch_end - batch_start)/K
+            for k in range(int(ok.sum())):
+                self.aggregate_measure(-1, "time",
+                                       self.iteration_time.total_seconds())
+        profiling.use(None)
+
+    def time_stages(self):
+        """Time the stages of the next round if timing is switched on."""
+        profiling.use(self.profile if self.timing else None)
+
+    def run_in_processes(self):
+        """
+        Split the simulations between 'num_workers' processes, each drawing
+        votes from its own random stream, and merge the aggregates they
+        collect. Parts are merged in a fixed order, so the results only
+        depend on the seed.
+        """
+        num_workers = self.sim_rules["num_workers"]
+        counts = split_count(self.num_total_simulations, 4*num_workers)
+        sim_rules = dict(self.sim_rules)
+        if sim_rules["seed"] is None:
+            sim_rules["seed"] = random.getrandbits(128)
+        e_rules = [dict(rules) for rules in self.e_handler.election_rules_list]
+        self.iterations_with_no_solution = 0
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(num_workers, mp_context=context) as executor:
+            parts = executor.map(simulate_part, repeat(sim_rules),
+                                 repeat(e_rules), repeat(self.vote_table),
+                                 counts, range(len(counts)))
+            for count, (moments, list_moments, profile, scaling, no_solution) \
+                    in zip(counts, parts):
+                self.merge(moments, list_moments)
+                self.profile.merge(profile)
+                for key, state in scaling.items():
+                    self.scaling_state(key).merge(state)
+                self.iterations_with_no_solution += no_solution
+                self.iteration += count
+                time = self.moments[-1].analyze(["time"])["time"]
+                if time["cnt"] > 0:
+                    self.iteration_time = timedelta(seconds=time["avg"])
+                if self.terminate:
+                    executor.shutdown(cancel_futures=True)
+                    break
+
+    def merge(self, moments, list_moments):
+        """
+        Merge the moments collected by another Simulation of the same
+        elections into this one.
+        """
+        for ours, theirs in zip(self.moments + self.list_moments,
+                                moments + list_moments):
+            ours.merge(theirs)
 
 
     def get_results_dict(self):
@@ -503,7 +924,15 @@ class Simulation:
                 for ruleset in range(self.num_rulesets)
             ],
             "vote_data": self.list_data[-1],
-            "time_data": self.data[-1]["time"]
+            "time_data": self.data[-1]["time"],
+            "stage_times": self.profile.as_dict(),
+            # Sweeps taken by alternating scaling for the optimal reference
+            #  of each ruleset:
+            "scaling_sweeps": [
+                self.scaling_state(self.comparison_rules[ruleset]["opt"][1])
+                    .as_dict()
+                for ruleset in range(self.num_rulesets)
+            ],
         }
 
     def to_xlsx(self, filename):
@@ -1,7 +1,6 @@
+from functools import lru_cache
 
-
-import division_rules
-from methods.alternating_scaling import alternating_scaling
+import numpy as np
 
 def solution_exists(votes, row_constraints, col_constraints, prior_allocations):
     assert sum(row_constraints) == sum(col_constraints)
@@ -16,20 +15,93 @@ def solution_exists(votes, row_constraints, col_constraints, prior_allocations):
     assert all(len(row) == num_parties for row in prior_allocations), (
         "The allocation matrix does not match the party list.")
 
-    epsilon = 0.0000001
-    adjusted_votes = [[v if v>0 else epsilon for v in row] for row in votes]
-    try:
-        result, _ = alternating_scaling(
-            m_votes=adjusted_votes,
-            v_desired_row_sums=row_constraints,
-            v_desired_col_sums=col_constraints,
-            m_prior_allocations=prior_allocations,
-            divisor_gen=division_rules.dhondt_gen,
-            threshold=0)
-    except RuntimeError:
+    support = tuple(tuple(v > 0 for v in row) for row in votes)
+    row_slack = tuple(r - sum(row)
+                      for r, row in zip(row_constraints, prior_allocations))
+    col_slack = tuple(k - sum(col)
+                      for k, col in zip(col_constraints, zip(*prior_allocations)))
+    return transportation_feasible(support, row_slack, col_slack)
+
+@lru_cache(maxsize=4096)
+def transportation_feasible(support, row_supply, col_demand):
+    """
+    Determine whether there is a matrix of nonnegative integers with row sums
+    'row_supply' and column sums 'col_demand' that is zero outside 'support'.
+
+    This is the question solution_exists asks, with the prior allocations
+    subtracted from the constraints: the seats still to be allocated in each
+    constituency and to each party, which may only go where there are votes.
+    It is decided by finding a maximum flow from the constituencies to the
+    parties along the supported entries, with augmenting paths. Results are
+    cached, since the same supports and remaining seats come up again and
+    again in simulations.
+    """
+    if min(row_supply + col_demand, default=0) < 0:
         return False
-    for c in range(num_constituencies):
-        for p in range(num_parties):
-            if result[c][p]>prior_allocations[c][p] and votes[c][p]==0:
-                return False
-    return True
+    if sum(row_supply) != sum(col_demand):
+        return False
+    num_rows = len(row_supply)
+    num_cols = len(col_demand)
+    row_left = list(row_supply)
+    col_left = list(col_demand)
+    flow = [[0]*num_cols for c in range(num_rows)]
+    while True:
+        # Breadth first search for a path from a row with seats left over to
+        #  a column still short of seats; columns are reached from rows along
+        #  the support, and rows from columns along entries with flow.
+        row_parent = [None]*num_rows
+        col_parent = [None]*num_cols
+        queue = [c for c in range(num_rows) if row_left[c] > 0]
+        for c in queue:
+            row_parent[c] = -1
+        end = None
+        for c in queue:
+            for p in range(num_cols):
+                if col_parent[p] is None and support[c][p]:
+                    col_parent[p] = c
+                    if col_left[p] > 0:
+                        end = p
+                        break
+                    for d in range(num_rows):
+                        if row_parent[d] is None and flow[d][p] > 0:
+                            row_parent[d] = p
+                            queue.append(d)
+            if end is not None:
+                break
+        if end is None:
+            return not any(col_left)
+
+        path = []
+        p = end
+        while True:
+            c = col_parent[p]
+            path.append((c, p))
+            if row_parent[c] == -1:
+                break
+            p = row_parent[c]
+        amount = min(row_left[c], col_left[end],
+                     min((flow[d][row_parent[d]] for d, _ in path[:-1]),
+                         default=row_left[c]))
+        row_left[c] -= amount
+        col_left[end] -= amount
+        for i, (d, p) in enumerate(path):
+            flow[d][p] += amount
+            if i+1 < len(path):
+                flow[d][row_parent[d]] -= amount
+
+def solution_exists_batch(votes, row_constraints, col_constraints,
+                          prior_allocations):
+    """
+    Batch version of solution_exists, for a stack of K vote tables.
+    Returns a boolean vector telling which tables admit a solution.
+    """
+    supports = votes > 0
+    row_slacks = row_constraints - prior_allocations.sum(axis=2)
+    col_slacks = col_constraints - prior_allocations.sum(axis=1)
+    return np.array([
+        transportation_feasible(tuple(map(tuple, support.tolist())),
+                                tuple(row_slack.tolist()),
+                                tuple(col_slack.tolist()))
+        for support, row_slack, col_slack
+        in zip(supports, row_slacks, col_slacks)
+    ], dtype=bool)
@@ -2,6 +2,8 @@
 from math import log
 from copy import deepcopy
 
+from division_rules import divisor_table
+
 
 def v_subtract(u, v):
     n = len(u)
@@ -54,11 +56,10 @@ def entropy(votes, allocations, divisor_gen):
     assert(type(allocations) == list)
     assert(all(type(a) == list for a in allocations))
 
+    divisors = divisor_table(divisor_gen, max([0]+[max(a+[0]) for a in allocations]))
     e = 0
     for c in range(len(votes)):
         for p in range(len(votes[c])):
-            gen = divisor_gen()
             for k in range(allocations[c][p]):
-                dk = next(gen)
-                e += log(votes[c][p]/dk)
+                e += log(votes[c][p]/divisors[k])
     return e
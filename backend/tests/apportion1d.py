@@ -2,6 +2,7 @@ import unittest
 
 import division_rules
 import apportion
+import batch_util
 
 class TestElection(unittest.TestCase):
 
@@ -76,6 +77,32 @@ class TestElection(unittest.TestCase):
             self.assertEqual(next(seat), {'idx': 0, 'active_votes':  35})
             self.assertEqual(next(seat), {'idx': 1, 'active_votes':  29})
 
+    def test_quota_large(self):
+        #Arrange
+        votes  = [41500, 33280, 18020, 7500, 0, 12, 7500]
+        priors = [   20,   300,     0,    0, 0,  0,    0]
+
+        #Act
+        results, seat_gen, last_in, next_in = apportion.apportion1d_general(
+            v_votes=votes,
+            num_total_seats=1000,
+            prior_allocations=priors,
+            rule=division_rules.droop,
+            type_of_rule="Quota"
+        )
+        seat = seat_gen()
+        expected = list(priors)
+        for i in range(1000 - sum(priors)):
+            last_seat = next(seat)
+            expected[last_seat["idx"]] += 1
+
+        #Assert
+        self.assertEqual(votes, [41500, 33280, 18020, 7500, 0, 12, 7500])
+        self.assertEqual(priors, [20, 300, 0, 0, 0, 0, 0])
+        self.assertEqual(expected, results)
+        self.assertEqual(last_seat, last_in)
+        self.assertEqual(next(seat), next_in)
+
     def test_seat_generator_div(self):
         #Arrange
         votes = [135,129,36]
@@ -136,3 +163,119 @@ class TestElection(unittest.TestCase):
             self.assertEqual(next(seat), {'idx': 0, 'active_votes': 33.75})
             self.assertEqual(next(seat), {'idx': 1, 'active_votes': 32.25})
             self.assertEqual(next(seat), {'idx': 0, 'active_votes': 27})
+
+    def test_ties_go_to_lowest_index(self):
+        #Arrange
+        votes = [100, 200, 200, 100]
+
+        #Act
+        results, div = apportion.apportion1d(
+            v_votes=votes,
+            num_total_seats=3,
+            prior_allocations=[0,0,0,0],
+            divisor_gen=division_rules.dhondt_gen,
+        )
+        _, seat_gen, last_in, next_in = apportion.apportion1d_general(
+            v_votes=votes,
+            num_total_seats=3,
+            prior_allocations=[],
+            rule=division_rules.dhondt_gen,
+            type_of_rule="Division"
+        )
+
+        #Assert
+        self.assertEqual(results, [1,1,1,0])
+        self.assertEqual(div[2], 100)
+        self.assertEqual(last_in, {'idx': 0, 'active_votes': 100})
+        self.assertEqual(next_in, {'idx': 1, 'active_votes': 100})
+
+    def test_jump_and_step(self):
+        #Arrange
+        votes  = [41500, 33280, 18020, 7500, 0, 12, 7500]
+        priors = [   20,    30,     0,    0, 0,  0,    0]
+        seat_gen = apportion.seat_generator_div(
+            votes=votes,
+            prior_allocations=priors,
+            divisor_gen=division_rules.sainte_lague_gen,
+        )()
+        expected = list(priors)
+        for seat in range(500 - sum(priors)):
+            last_in = next(seat_gen)
+            expected[last_in["idx"]] += 1
+        next_in = next(seat_gen)
+
+        #Act
+        results, (divisors, _, min_used) = apportion.apportion1d(
+            v_votes=votes,
+            num_total_seats=500,
+            prior_allocations=priors,
+            divisor_gen=division_rules.sainte_lague_gen,
+        )
+        general = apportion.apportion1d_general(
+            v_votes=votes,
+            num_total_seats=500,
+            prior_allocations=priors,
+            rule=division_rules.sainte_lague_gen,
+            type_of_rule="Division"
+        )
+
+        #Assert
+        self.assertEqual(expected, results)
+        self.assertEqual(last_in["active_votes"], min_used)
+        self.assertEqual(next_in["active_votes"],
+                         max(v/d for v, d in zip(votes, divisors)))
+        self.assertEqual((expected, last_in, next_in),
+                         (general[0], general[2], general[3]))
+
+    def test_max_left(self):
+        #Arrange
+        votes = [300, 200, 100]
+
+        #Act
+        results, _ = apportion.apportion1d(
+            v_votes=votes,
+            num_total_seats=4,
+            prior_allocations=[0,0,0],
+            divisor_gen=division_rules.dhondt_gen,
+            v_max_left=[1,2,1],
+        )
+
+        #Assert
+        self.assertEqual(results, [1,2,1])
+        with self.assertRaises(ValueError):
+            apportion.apportion1d(
+                v_votes=votes,
+                num_total_seats=5,
+                prior_allocations=[0,0,0],
+                divisor_gen=division_rules.dhondt_gen,
+                v_max_left=[1,2,1],
+            )
+
+    def test_divisor_boundaries(self):
+        #Arrange
+        votes  = [[100, 200, 200, 100], [135, 129,  36,   0]]
+        priors = [[  0,   0,   0,   0], [  2,   1,   0,   0]]
+        seats  = [3, 6]
+
+        #Act
+        results, min_used, max_unused, failed = batch_util.divisor_boundaries(
+            v_votes=votes,
+            num_total_seats=seats,
+            prior_allocations=priors,
+            divisor_gen=division_rules.dhondt_gen,
+        )
+
+        #Assert
+        for row in range(2):
+            expected, (divisors, _, expected_min) = apportion.apportion1d(
+                v_votes=votes[row],
+                num_total_seats=seats[row],
+                prior_allocations=priors[row],
+                divisor_gen=division_rules.dhondt_gen,
+            )
+            self.assertEqual(expected, list(results[row]))
+            self.assertEqual(expected_min, min_used[row])
+            self.assertEqual(max(v/d for v, d in zip(votes[row], divisors)),
+                             max_unused[row])
+        self.assertEqual([[1,1,1,0], [3,3,0,0]], results.tolist())
+        self.assertFalse(failed.any())
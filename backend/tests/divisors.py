@@ -3,7 +3,8 @@ import unittest
 
 from apportion import apportion1d
 from division_rules import dhondt_gen, sainte_lague_gen, \
-    nordic_sainte_lague_gen, imperiali_gen, danish_gen, huntington_hill_gen
+    nordic_sainte_lague_gen, imperiali_gen, danish_gen, huntington_hill_gen, \
+    divisor_table
 
 class TestDivisors(unittest.TestCase):
 
@@ -85,3 +86,20 @@ class TestApportionment1d(unittest.TestCase):
         prior_allocations = [1, 1]
         res = apportion1d(votes, num_seats, prior_allocations, sainte_lague_gen)
         self.assertEqual(res[0], [3, 2])
+
+class TestDivisorTable(unittest.TestCase):
+
+    def test_table_matches_generator(self):
+        for divisor_gen in [dhondt_gen, sainte_lague_gen,
+                            nordic_sainte_lague_gen, imperiali_gen,
+                            danish_gen, huntington_hill_gen]:
+            gen = divisor_gen()
+            table = divisor_table(divisor_gen, 50)
+            self.assertGreaterEqual(len(table), 50)
+            for k in range(50):
+                self.assertEqual(table[k], next(gen))
+
+    def test_table_is_cached_and_grows(self):
+        table = divisor_table(dhondt_gen, 5)
+        self.assertIs(divisor_table(dhondt_gen, 3), table)
+        self.assertEqual(divisor_table(dhondt_gen, 500)[499], 500)
@@ -1,7 +1,12 @@
 import unittest
+import random
 
-from voting import ElectionRules, Election
+import numpy as np
+
+from voting import ElectionRules, Election, BatchElection
+from electionHandler import ElectionHandler
 from table_util import add_totals
+from distributions.beta_distribution import beta_distribution
 
 class TestElection(unittest.TestCase):
 
@@ -34,3 +39,64 @@ class TestElection(unittest.TestCase):
         election = Election(rules, votes)
         with self.assertRaises(ValueError):
             election.run()
+
+    def test_batch_election(self):
+        base_votes = [[1500, 1400,  600, 300],
+                      [ 900, 1700,  400, 100],
+                      [2000,  800, 1000, 600]]
+        random.seed(1)
+        votes = [beta_distribution(base_votes, 20) for k in range(40)]
+        votes.append([[1, 0, 0, 0], [0, 100, 0, 0], [0, 0, 0, 0]])
+        for method in ["icelandic-law", "alternating-scaling", "switching"]:
+            for divider in ["dhondt", "sainte-lague", "droop"]:
+                rules = ElectionRules()
+                rules["parties"] = ["A", "B", "C", "D"]
+                rules["adjustment_method"] = method
+                rules["adj_determine_divider"] = divider
+                rules["constituencies"] = [
+                    {"name": "I",   "num_const_seats": 3, "num_adj_seats": 1},
+                    {"name": "II",  "num_const_seats": 2, "num_adj_seats": 2},
+                    {"name": "III", "num_const_seats": 4, "num_adj_seats": 1}
+                ]
+                batch = BatchElection(rules, np.array(votes))
+                batch.run()
+                for k in range(len(votes)):
+                    election = Election(rules, votes[k])
+                    try:
+                        results = election.run()
+                    except ValueError:
+                        self.assertTrue(batch.failed[k])
+                        continue
+                    self.assertFalse(batch.failed[k])
+                    self.assertEqual(batch.results[k].tolist(), results)
+                    self.assertEqual(batch.adj_dev[k], election.adj_dev)
+                    self.assertEqual(batch.solvable[k], election.solvable)
+
+    def test_handler_revote(self):
+        vote_table = {
+            "name": "Re-vote test",
+            "parties": ["A", "B", "C"],
+            "votes": [[1500, 1400, 600],
+                      [ 900, 1700, 400]],
+            "constituencies": [
+                {"name": "I",  "num_const_seats": 4, "num_adj_seats": 1},
+                {"name": "II", "num_const_seats": 3, "num_adj_seats": 2},
+            ],
+        }
+        systems = []
+        for option in ["refer", "one_const", "all_adj"]:
+            rules = ElectionRules()
+            rules["seat_spec_option"] = option
+            systems.append(rules)
+        handler = ElectionHandler(vote_table, systems)
+        elections = list(handler.elections)
+        new_votes = [[700, 1800, 500],
+                     [1200, 300, 900]]
+        handler.set_votes(new_votes)
+        vote_table["votes"] = new_votes
+        fresh = ElectionHandler(vote_table, systems)
+        for election, reused, expected in zip(handler.elections, elections,
+                                              fresh.elections):
+            self.assertIs(election, reused)
+            self.assertEqual(election.m_votes, expected.m_votes)
+            self.assertEqual(election.results, expected.results)
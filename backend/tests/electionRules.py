@@ -32,6 +32,15 @@ class TestElectionRules(TestCase):
             {"name": "II", "num_const_seats": 3, "num_adj_seats": 2}
         ])
 
+    def test_generate_opt_ruleset_method(self):
+        key = self.rules.canonical_key()
+        self.rules["opt_method"] = "tie-and-transfer"
+        opt = self.rules.generate_opt_ruleset()
+        self.assertEqual(opt["adjustment_method"], "tie-and-transfer")
+        self.assertEqual(self.rules.canonical_key(), key)
+        with self.assertRaises(ValueError):
+            self.rules["opt_method"] = "norwegian-law"
+
     def test_generate_law_ruleset(self):
         law = self.rules.generate_law_ruleset()
         self.assertEqual(law["adjustment_method"], "icelandic-law")
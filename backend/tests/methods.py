@@ -6,9 +6,14 @@ import division_rules
 from electionRules import ElectionRules
 from voting import Election
 from methods.alternating_scaling import *
+from methods.nearest_neighbor import nearest_neighbor
 from methods.norwegian_law import norwegian_apportionment
+from methods.opt_entropy import opt_entropy
 from methods.norwegian_icelandic import norw_ice_apportionment
 from methods.pure_vote_ratios import pure_vote_ratios_apportionment
+from methods.relative_superiority import superiority_apportionment, REASONS
+from methods.switching import switch_seats
+from methods.tie_and_transfer import tie_and_transfer
 
 
 class AdjustmentMethodsTestMeta(type):
@@ -108,6 +113,23 @@ class TestAdjustmentMethods(TestCase):
         #Assert
         self.assertEqual(expected, results)
 
+    def test_alternating_scaling_warm_start(self):
+        #Arrange
+        self.rules["adjustment_method"] = "alternating-scaling"
+        scaling = ScalingState()
+        cold = Election(self.rules, self.votes)
+        cold.scaling = scaling
+        cold.run()
+        sweeps = scaling.sweeps
+        #Act
+        warm = Election(self.rules, self.votes)
+        warm.scaling = scaling
+        warm.run()
+        #Assert
+        self.assertEqual(warm.results, cold.results)
+        self.assertEqual(scaling.runs, 2)
+        self.assertEqual(scaling.sweeps, sweeps + 1)
+
     def test_alternating_scaling(self):
         self.rules["adjustment_method"] = "alternating-scaling"
         election = Election(self.rules, self.votes)
@@ -161,6 +183,82 @@ class TestAdjustmentMethods(TestCase):
                                    [2,3,4,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
+    def test_tie_and_transfer(self):
+        self.rules["adjustment_method"] = "tie-and-transfer"
+        election = Election(self.rules, self.votes)
+        results = election.run()
+        self.assertEqual(results, [[0,4,2,0,0,0,0,0,0,0,0,1,0,1,0],
+                                   [1,4,2,0,0,0,0,0,0,0,0,1,0,2,0],
+                                   [1,4,4,0,0,0,0,0,0,0,0,1,0,0,0],
+                                   [1,3,5,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
+    def test_tie_and_transfer_6c(self):
+        self.rules_6c["adjustment_method"] = "tie-and-transfer"
+        election = Election(self.rules_6c, self.votes)
+        results = election.run()
+        self.assertEqual(results, [[0,3,3,0,0,0,0,0,0,0,0,1,0,1,0],
+                                   [1,4,2,0,0,0,0,0,0,0,0,1,0,2,0],
+                                   [0,4,4,0,0,0,0,0,0,0,0,1,0,1,0],
+                                   [2,3,4,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
+    def test_opt_entropy(self):
+        self.rules["adjustment_method"] = "opt-entropy"
+        election = Election(self.rules, self.votes)
+        results = election.run()
+        self.assertEqual(results, [[0,4,2,0,0,0,0,0,0,0,0,1,0,1,0],
+                                   [1,4,2,0,0,0,0,0,0,0,0,1,0,2,0],
+                                   [1,4,4,0,0,0,0,0,0,0,0,1,0,0,0],
+                                   [1,3,5,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
+    def test_opt_entropy_small(self):
+        with self.assertRaises(ValueError):
+            results, _ = opt_entropy(
+                m_votes=[[1500,    0],
+                         [   0, 5000]],
+                v_desired_row_sums=        [2,
+                                            2],
+                v_desired_col_sums=  [1,3],
+                m_prior_allocations=[[1,0],
+                                     [0,1]],
+                divisor_gen=division_rules.dhondt_gen,
+                threshold=5
+            )
+    def test_tie_and_transfer_small(self):
+        with self.assertRaises(ValueError):
+            results, _ = tie_and_transfer(
+                m_votes=[[1500,    0],
+                         [   0, 5000]],
+                v_desired_row_sums=        [2,
+                                            2],
+                v_desired_col_sums=  [1,3],
+                m_prior_allocations=[[1,0],
+                                     [0,1]],
+                divisor_gen=division_rules.dhondt_gen,
+                threshold=5
+            )
+    def test_tie_and_transfer_where_alternating_scaling_diverges(self):
+        #Arrange
+        arguments = {
+            "m_votes":             [[14134, 1000],
+                                    [ 8954,    2]],
+            "v_desired_row_sums":  [2, 5],
+            "v_desired_col_sums":  [5, 2],
+            "m_prior_allocations": [[1, 0],
+                                    [1, 1]],
+            "divisor_gen": division_rules.huntington_hill_gen,
+            "threshold": 0,
+        }
+        #Act
+        results, _ = tie_and_transfer(**arguments)
+        #Assert
+        self.assertEqual(results, [[1, 1],
+                                   [4, 1]])
+        with self.assertRaises(RuntimeError):
+            alternating_scaling(**arguments)
+
     def test_icelandic_law(self):
         self.rules["adjustment_method"] = "icelandic-law"
         election = Election(self.rules, self.votes)
@@ -181,6 +279,16 @@ class TestAdjustmentMethods(TestCase):
                                    [1,3,5,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [2,1,3,0,0,0,0,0,0,0,0,2,0,2,1]])
+    def test_icelandic_shares(self):
+        self.rules["adjustment_method"] = "ice-shares"
+        election = Election(self.rules, self.votes)
+        results = election.run()
+        self.assertEqual(results, [[0,4,2,0,0,0,0,0,0,0,0,1,0,1,0],
+                                   [1,4,2,0,0,0,0,0,0,0,0,1,0,2,0],
+                                   [1,4,4,0,0,0,0,0,0,0,0,1,0,0,0],
+                                   [2,3,4,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [1,2,4,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
     def test_icelandic_law_lague(self):
         #Arrange
         self.rules["parties"] = ["A", "B", "C", "D", "E", "F", "G"]
@@ -294,6 +402,15 @@ class TestAdjustmentMethods(TestCase):
         self.assertEqual([2,"Norðaustur",     "D","A",1.155], steps[1][5:])
         self.assertEqual([3,"Reykjavík suður","D","A",1.249], steps[2][5:])
         self.assertEqual([4,"Suður",          "V","A",1.315], steps[3][5:])
+    def test_switch_seats(self):
+        votes = [[100, 90, 0], [60, 50, 40], [30, 10, 20]]
+        adj_seats = [[1, 0, 0], [2, 0, 0], [1, 0, 0]]
+        switches = switch_seats(votes, [[0]*3]*3, adj_seats, [2, 1, 1],
+                                division_rules.dhondt_gen, 4)
+        self.assertEqual(adj_seats, [[1, 0, 0], [0, 1, 1], [1, 0, 0]])
+        # The second switch ties at 1.5 with (2, 0, 2):
+        self.assertEqual([(s["constituency"], s["from"], s["to"], s["sensitivity"])
+                          for s in switches], [(1, 0, 1, 0.6), (1, 0, 2, 1.5)])
     def test_switching_6c(self):
         self.rules_6c["adjustment_method"] = "switching"
         election = Election(self.rules_6c, self.votes)
@@ -308,7 +425,12 @@ class TestAdjustmentMethods(TestCase):
         self.rules["adjustment_method"] = "monge"
         election = Election(self.rules, self.votes)
         results = election.run()
-        self.assertEqual(0, 0)
+        self.assertEqual(results, [[0,4,2,0,0,0,0,0,0,0,0,1,0,1,0],
+                                   [1,4,2,0,0,0,0,0,0,0,0,1,0,2,0],
+                                   [1,4,4,0,0,0,0,0,0,0,0,1,0,0,0],
+                                   [1,3,5,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
+                                   [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
     def test_nearest_neighbor(self):
         self.rules["adjustment_method"] = "nearest-neighbor"
         election = Election(self.rules, self.votes)
@@ -329,6 +451,26 @@ class TestAdjustmentMethods(TestCase):
                                    [1,4,5,0,0,0,0,0,0,0,0,2,0,1,0],
                                    [1,2,4,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [2,1,2,0,0,0,0,0,0,0,0,2,0,3,1]])
+    def test_nearest_neighbor_keeps_last(self):
+        #Arrange
+        votes = [[300, 200],
+                 [100, 400]]
+        last  = [300, 400]
+
+        #Act
+        results, (sequence, _) = nearest_neighbor(
+            m_votes=votes,
+            v_desired_row_sums=[2, 2],
+            v_desired_col_sums=[2, 2],
+            m_prior_allocations=[[1, 0], [0, 1]],
+            divisor_gen=division_rules.dhondt_gen,
+            last=last
+        )
+
+        #Assert
+        self.assertEqual([[1, 1], [1, 1]], results)
+        self.assertEqual([1.5, 4.0], [seat["min"] for seat in sequence])
+        self.assertEqual([300, 400], last)
     def test_norwegian_icelandic(self):
         self.rules["adjustment_method"] = "norwegian-icelandic"
         election = Election(self.rules, self.votes)
@@ -403,6 +545,66 @@ class TestAdjustmentMethods(TestCase):
                                    [2,3,4,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [2,2,3,0,0,0,0,0,0,0,0,2,0,1,1],
                                    [1,2,3,0,0,0,0,0,0,0,0,2,0,2,1]])
+
+    def test_relative_superiority_violating(self):
+        #Arrange
+        votes    = [[3, 0],
+                    [8, 0]]
+        expected = [[1, 0],
+                    [1, 0]]
+
+        for simple in [False, True]:
+            #Act
+            results, (sequence, _) = superiority_apportionment(
+                m_votes=votes,
+                v_desired_row_sums=[1, 1],
+                v_desired_col_sums=[0, 2],
+                m_prior_allocations=[[0, 0], [0, 0]],
+                divisor_gen=division_rules.dhondt_gen,
+                simple=simple
+            )
+
+            #Assert
+            # A needs no seats and B has no votes, so both seats go to A,
+            #  which is below zero slack for the second one.
+            self.assertEqual(expected, results)
+            self.assertEqual([(1, 0), (0, 0)],
+                [(seat["constituency"], seat["party"]) for seat in sequence])
+            self.assertEqual([REASONS["violating"]]*2,
+                             [seat["reason"] for seat in sequence])
+            self.assertEqual([None, None],
+                [seat.get("superiority") for seat in sequence])
+
+    def test_relative_superiority_refresh(self):
+        #Arrange
+        votes    = [[2,  8],
+                    [10, 6]]
+        expected = [[0, 1],
+                    [1, 1]]
+
+        for simple in [False, True]:
+            #Act
+            results, (sequence, _) = superiority_apportionment(
+                m_votes=votes,
+                v_desired_row_sums=[1, 2],
+                v_desired_col_sums=[1, 2],
+                m_prior_allocations=[[0, 0], [0, 0]],
+                divisor_gen=division_rules.dhondt_gen,
+                simple=simple
+            )
+
+            #Assert
+            # Without 'simple', the continuation of the second constituency
+            #  gives B more seats than it needs after its seat in the first.
+            self.assertEqual(expected, results)
+            self.assertEqual([(0, 1), (1, 0), (1, 1)],
+                [(seat["constituency"], seat["party"]) for seat in sequence])
+            self.assertEqual([REASONS["available"], REASONS["necessary"],
+                              REASONS["necessary"]],
+                             [seat["reason"] for seat in sequence])
+            self.assertEqual([4.0, None, None],
+                [seat.get("superiority") for seat in sequence])
+
     def test_norwegian_law(self):
         self.rules["adjustment_method"] = "norwegian-law"
         self.rules["primary_divider"] = "nordic"
@@ -460,6 +662,28 @@ class TestAdjustmentMethods(TestCase):
         #Assert
         self.assertEqual(expected, results)
 
+    def test_norwegian_ties_and_saturation(self):
+        #Arrange
+        votes    = [[10, 10],
+                    [10, 10]]
+        expected = [[1, 0],
+                    [0, 1]]
+
+        #Act
+        results, (sequence, _) = norwegian_apportionment(
+            m_votes=votes,
+            orig_votes=votes,
+            v_const_seats=[0, 0],
+            v_desired_row_sums=[1, 1],
+            v_desired_col_sums=[1, 1],
+            m_prior_allocations=[[0, 0], [0, 0]],
+            divisor_gen=division_rules.dhondt_gen,
+        )
+
+        #Assert
+        self.assertEqual(expected, results)
+        self.assertEqual([0.5, 0.5], [seat["max"] for seat in sequence])
+
     def test_norw_ice_small(self):
         #Arrange
         row_sums =        [1,
@@ -512,6 +736,29 @@ class TestAdjustmentMethods(TestCase):
         #Assert
         self.assertEqual(expected, results)
 
+    def test_pure_votes_sequence(self):
+        #Arrange
+        votes    = [[1, 3],
+                    [2, 2]]
+        expected = [[0, 2],
+                    [1, 0]]
+
+        #Act
+        results, (sequence, _) = pure_vote_ratios_apportionment(
+            m_votes=votes,
+            orig_votes=votes,
+            v_desired_row_sums=[2, 1],
+            v_desired_col_sums=[1, 2],
+            m_prior_allocations=[[0, 0], [0, 0]],
+            divisor_gen=division_rules.dhondt_gen,
+        )
+
+        #Assert
+        self.assertEqual(expected, results)
+        self.assertEqual([(0, 1, 0.75), (1, 0, 0.5), (0, 1, 0.375)],
+                         [(seat["constituency"], seat["party"],
+                           seat["max_list_share"]) for seat in sequence])
+
 
 class DividerRulesTestMeta(type):
     def __new__(cls, name, bases, attrs):
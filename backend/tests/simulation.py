@@ -1,12 +1,13 @@
 # coding:utf-8
 from unittest import TestCase
-from random import uniform
+from random import uniform, seed
 
 import logging
 import simulate
 from dictionaries import MEASURES, LIST_MEASURES, AGGREGATES
 import voting
 import util
+from distributions.beta_distribution import BetaGenerator
 
 
 class SimulationTest(TestCase):
@@ -29,8 +30,14 @@ class SimulationTest(TestCase):
         self.s_rules["simulation_count"] = 100
 
     def test_generate_votes(self):
-        pass
-        # Generate a few vote sets
+        # Generate a few vote sets, in a block and one at a time
+        block = BetaGenerator(self.votes, 100, seed=1).draw(5)
+        gen = iter(BetaGenerator(self.votes, 100, seed=1))
+        one_by_one = [next(gen) for k in range(5)]
+        self.assertEqual(block.shape, (5, 3, 2))
+        self.assertEqual(block.tolist(), one_by_one)
+        other_stream = BetaGenerator(self.votes, 100, seed=1, stream=1)
+        self.assertNotEqual(other_stream.draw(5).tolist(), one_by_one)
 
     def test_generate_votes_average(self):
         n = 1000
@@ -155,6 +162,232 @@ class SimulationTest(TestCase):
             self.assertEqual(measures[m]['cnt'], 100)
         self.assertEqual(result['time_data']['cnt'], 100)
 
+    def test_simulate_in_batches(self):
+        #Arrange
+        all_adj = voting.ElectionRules()
+        all_adj["seat_spec_option"] = "all_adj"
+        all_adj["adjustment_method"] = "alternating-scaling"
+        e_systems = [self.e_rules, all_adj]
+        sims = []
+        for batch_size in [1, 30]:
+            s_rules = simulate.SimulationRules()
+            s_rules["simulation_count"] = 100
+            s_rules["batch_size"] = batch_size
+            sim = simulate.Simulation(s_rules, e_systems, self.vote_table)
+            #Act
+            seed(3)
+            sim.simulate()
+            sims.append(sim)
+        #Assert
+        scalar, batched = sims
+        self.assertEqual(scalar.iterations_with_no_solution,
+                         batched.iterations_with_no_solution)
+        for r in range(scalar.num_rulesets):
+            for m in MEASURES.keys():
+                for aggr in ["cnt", "min", "max"]:
+                    self.assertEqual(scalar.data[r][m][aggr],
+                                     batched.data[r][m][aggr])
+                for aggr in ["avg", "skw", "kur"]:
+                    self.assertAlmostEqual(scalar.data[r][m][aggr],
+                                           batched.data[r][m][aggr])
+            for m in LIST_MEASURES.keys():
+                for aggr in ["cnt", "min", "max"]:
+                    self.assertEqual(scalar.list_data[r][m][aggr],
+                                     batched.list_data[r][m][aggr])
+                for aggr in ["avg", "var", "skw", "kur"]:
+                    for c, row in enumerate(scalar.list_data[r][m][aggr]):
+                        for p, value in enumerate(row):
+                            self.assertAlmostEqual(
+                                value, batched.list_data[r][m][aggr][c][p])
+        for aggr in ["cnt", "min", "max"]:
+            self.assertEqual(scalar.list_data[-1]["sim_votes"][aggr],
+                             batched.list_data[-1]["sim_votes"][aggr])
+
+    def test_merge(self):
+        #Arrange
+        self.s_rules["simulation_count"] = 50
+        self.s_rules["seed"] = 5
+        whole = simulate.Simulation(self.s_rules, [self.e_rules],
+                                    self.vote_table)
+        parts = [simulate.Simulation(self.s_rules, [self.e_rules],
+                                     self.vote_table) for k in range(2)]
+        for stream, part in enumerate(parts):
+            self.s_rules["stream"] = stream
+            whole.run_simulations()
+            part.run_simulations()
+        #Act
+        parts[0].merge(parts[1].moments, parts[1].list_moments)
+        #Assert
+        merged = parts[0]
+        whole.analysis()
+        merged.analysis()
+        for m in MEASURES.keys():
+            for aggr in ["cnt", "min", "max"]:
+                self.assertEqual(whole.data[0][m][aggr],
+                                 merged.data[0][m][aggr])
+            for aggr in ["avg", "var", "skw", "kur"]:
+                self.assertAlmostEqual(whole.data[0][m][aggr],
+                                       merged.data[0][m][aggr])
+        for m in ["const_seats", "adj_seats", "total_seats"]:
+            for aggr in ["cnt", "min", "max"]:
+                self.assertEqual(whole.list_data[0][m][aggr],
+                                 merged.list_data[0][m][aggr])
+        for aggr in ["cnt", "min", "max"]:
+            self.assertEqual(whole.list_data[-1]["sim_votes"][aggr],
+                             merged.list_data[-1]["sim_votes"][aggr])
+
+    def test_simulate_in_processes(self):
+        #Arrange
+        self.s_rules["num_workers"] = 2
+        sim = simulate.Simulation(self.s_rules, [self.e_rules], self.vote_table)
+        #Act
+        sim.simulate()
+        #Assert
+        self.assertEqual(sim.iteration, 100)
+        result = sim.get_results_dict()
+        vote_data = result['vote_data']['sim_votes']
+        for const in range(sim.num_constituencies):
+            for party in range(sim.num_parties):
+                self.assertEqual(vote_data['cnt'][const][party], 100)
+        ok = 100 - sim.iterations_with_no_solution
+        measures = result['data'][0]['measures']
+        for m in MEASURES.keys():
+            self.assertEqual(measures[m]['cnt'], ok)
+        self.assertEqual(result['time_data']['cnt'], ok)
+
+    def test_seeded_simulations(self):
+        #Arrange
+        self.s_rules["simulation_count"] = 20
+        self.s_rules["seed"] = 11
+        sims = []
+        for stream in [0, 0, 1]:
+            s_rules = simulate.SimulationRules()
+            s_rules.update(self.s_rules)
+            s_rules["stream"] = stream
+            sims.append(simulate.Simulation(s_rules, [self.e_rules],
+                                            self.vote_table))
+        #Act
+        for sim in sims:
+            sim.simulate()
+        #Assert
+        votes = [sim.list_data[-1]["sim_votes"] for sim in sims]
+        self.assertEqual(votes[0], votes[1])
+        self.assertNotEqual(votes[0]["sum"], votes[2]["sum"])
+
+    def test_stage_timing(self):
+        #Arrange
+        self.s_rules["simulation_count"] = 10
+        timed_rules = simulate.SimulationRules()
+        timed_rules.update(self.s_rules)
+        timed_rules["timing"] = True
+        sims = [simulate.Simulation(rules, [self.e_rules], self.vote_table)
+                for rules in [self.s_rules, timed_rules]]
+        #Act
+        for sim in sims:
+            sim.simulate()
+        #Assert
+        untimed, timed = [sim.get_results_dict()["stage_times"] for sim in sims]
+        self.assertEqual(untimed, {})
+        self.assertEqual(timed["elections"]["cnt"], 10)
+        self.assertEqual(timed["vote generation"]["cnt"], 10)
+        for stage in timed.values():
+            self.assertGreaterEqual(stage["sum"], 0)
+
+    def test_warm_start(self):
+        #Arrange
+        self.s_rules["simulation_count"] = 20
+        self.s_rules["seed"] = 3
+        self.s_rules["distribution_parameter"] = 10000
+        warm_rules = simulate.SimulationRules()
+        warm_rules.update(self.s_rules)
+        warm_rules["warm_start"] = True
+        sims = [simulate.Simulation(rules, [self.e_rules], self.vote_table)
+                for rules in [self.s_rules, warm_rules]]
+        #Act
+        for sim in sims:
+            sim.simulate()
+        #Assert
+        cold, warm = [sim.get_results_dict() for sim in sims]
+        self.assertEqual(cold["data"][0]["list_measures"]["total_seats"],
+                         warm["data"][0]["list_measures"]["total_seats"])
+        cold_sweeps, warm_sweeps = cold["scaling_sweeps"], warm["scaling_sweeps"]
+        self.assertEqual(cold_sweeps[0]["runs"], 20)
+        self.assertEqual(warm_sweeps[0]["runs"], 20)
+        self.assertLess(warm_sweeps[0]["sweeps"], cold_sweeps[0]["sweeps"])
+
+    def test_fit_ideal_seats(self):
+        #Arrange
+        votes = [[[100, 200, 50], [300, 100, 250]],
+                 [[10, 20, 30], [30, 20, 10]]]
+        row_sums = [4, 6]
+        col_sums = [[3, 3, 4], [3, 4, 3]]
+        #Act
+        seats, row_factors, col_factors = simulate.fit_ideal_seats(
+            votes, 10, row_sums, col_sums)
+        one_sweep, _, _ = simulate.fit_ideal_seats(
+            votes, 10, row_sums, col_sums, max_sweeps=1)
+        warm, _, _ = simulate.fit_ideal_seats(
+            votes, 10, row_sums, col_sums,
+            start=(row_factors[0], col_factors[0]))
+        #Assert
+        for k in range(2):
+            for s, t in zip(seats[k].sum(axis=1), row_sums):
+                self.assertAlmostEqual(s, t, places=4)
+            for s, t in zip(seats[k].sum(axis=0), col_sums[k]):
+                self.assertAlmostEqual(s, t, places=4)
+            self.assertAlmostEqual(warm[0][k].sum(), row_sums[k], places=4)
+        self.assertNotAlmostEqual(one_sweep[0][0].sum(), 4, places=4)
+
+    def test_votes_to_change(self):
+        #Arrange
+        self.e_rules["parties"] = ["A", "B", "C"]
+        self.e_rules["constituencies"] = self.vote_table["constituencies"]
+        votes = [[500, 300, 5], [200, 400, 0], [350, 450, 20]]
+        election = voting.Election(self.e_rules, votes)
+        results = election.run()
+        def changed(c, p, added):
+            more = [list(row) for row in votes]
+            more[c][p] += added
+            return voting.Election(self.e_rules, more).run() != results
+        #Act
+        found = simulate.votes_to_change(election)
+        #Assert
+        self.assertIsNone(found[1][2])
+        for c in range(3):
+            for p in range(3):
+                if votes[c][p] != 0:
+                    self.assertTrue(changed(c, p, found[c][p]))
+                    self.assertFalse(changed(c, p, found[c][p]-1))
+
+    def test_votes_to_change_limit(self):
+        #Arrange
+        self.e_rules["parties"] = ["A"]
+        self.e_rules["constituencies"] = self.vote_table["constituencies"]
+        election = voting.Election(self.e_rules, [[500], [200], [350]])
+        election.run()
+        #Act
+        found = simulate.votes_to_change(election, max_votes=10000)
+        #Assert
+        self.assertEqual(found, [[None], [None], [None]])
+
+    def test_comparison_elections_are_shared(self):
+        #Arrange
+        renamed = voting.ElectionRules()
+        renamed["name"] = "Another name"
+        optimal = voting.ElectionRules()
+        optimal["adjustment_method"] = "alternating-scaling"
+        e_systems = [self.e_rules, renamed, optimal]
+        sim = simulate.Simulation(self.s_rules, e_systems, self.vote_table)
+        #Act
+        sim.collect_measures(self.votes)
+        #Assert
+        votes = sim.e_handler.elections[0].m_votes
+        for option in ["opt", "law", "ind_const", "all_adj"]:
+            self.assertIs(sim.comparison_election(0, option, votes),
+                          sim.comparison_election(1, option, votes))
+        self.assertIs(sim.comparison_election(0, "opt", votes),
+                      sim.e_handler.elections[2])
+
     def test_simulate_with_custom_seat_specs(self):
         #Arrange
         self.s_rules["simulation_count"] = 100
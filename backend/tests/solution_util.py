@@ -40,3 +40,30 @@ class TestExistanceCheck(TestCase):
 
         #Assert
         self.assertTrue(exists)
+
+    def test_solution_exists_with_prior_allocations(self):
+        #Arrange
+        votes = [[  0, 252, 452,   0,   0],
+                 [  0,   0, 825,   0, 480],
+                 [  0, 718, 627, 626,   0],
+                 [752,   0, 284, 787,   0]]
+        prior = [[0,1,0,0,0],
+                 [0,0,0,0,0],
+                 [0,0,2,2,0],
+                 [1,0,0,2,0]]
+        row_sums =      [3,
+                         3,
+                         7,
+                         5]
+        col_sums = [1,3,4,7,3]
+
+        #Act
+        exists = solution_util.solution_exists(votes, row_sums, col_sums, prior)
+        col_sums[1] -= 1
+        col_sums[4] += 1
+        exists_not = solution_util.solution_exists(votes, row_sums, col_sums,
+                                                   prior)
+
+        #Assert
+        self.assertTrue(exists)
+        self.assertFalse(exists_not)
@@ -7,6 +7,7 @@ import logging
 import simulate
 import voting
 from table_util import add_totals
+from moments import MomentAccumulator
 
 
 class StatisticsTest(TestCase):
@@ -176,3 +177,42 @@ class StatisticsTest(TestCase):
                     result[aggr],
                     f"Failed for k: {k}, aggr: {aggr}"
                 )
+
+    def test_moments_of_large_values(self):
+        #Arrange
+        offset = 1e9
+        sequence = [offset + x for x in [1, 2, 6, 1, 5, 6]]
+        accumulators = [MomentAccumulator(["x"]) for k in range(3)]
+        #Act
+        for x in sequence:
+            accumulators[0].update("x", x)
+        accumulators[1].update_batch("x", sequence)
+        accumulators[2].update_batch("x", sequence[:2])
+        half = MomentAccumulator(["x"])
+        half.update_batch("x", sequence[2:])
+        accumulators[2].merge(half)
+        #Assert
+        for accumulator in accumulators:
+            result = accumulator.analyze()["x"]
+            self.assertEqual(result["cnt"], 6)
+            self.assertEqual(result["min"], offset + 1)
+            self.assertEqual(result["max"], offset + 6)
+            self.assertAlmostEqual(result["avg"], offset + 3.5)
+            self.assertAlmostEqual(result["var"], 5.9)
+            self.assertAlmostEqual(result["skw"], 0)
+
+    def test_moments_of_constant_values(self):
+        #Arrange
+        sequence = [2/3]*50
+        accumulators = [MomentAccumulator(["x"]) for k in range(2)]
+        #Act
+        for x in sequence:
+            accumulators[0].update("x", x)
+        accumulators[1].update_batch("x", sequence)
+        #Assert
+        for accumulator in accumulators:
+            result = accumulator.analyze()["x"]
+            self.assertEqual(result["avg"], 2/3)
+            self.assertEqual(result["var"], 0)
+            self.assertEqual(result["skw"], 0)
+            self.assertEqual(result["kur"], 0)
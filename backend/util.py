@@ -250,6 +250,14 @@ def pretty_print_election(election):
     xtd_results = add_totals(election.results)
     print_table(xtd_results, header, const_names, rules["output"])
 
+def print_votes_to_change(election, votes_to_change):
+    """Print the votes each list needs to change the results of an election."""
+    rules = election.rules
+    header = ["Constituency"]
+    header.extend(rules["parties"])
+    const_names = [c["name"] for c in rules["constituencies"]]
+    print_table(votes_to_change, header, const_names, rules["output"])
+
 def sim_election_rules(rs, test_method):
     """Get preset election rules for simulation from file."""
     config = configparser.ConfigParser()
@@ -3,13 +3,18 @@
 This module contains the core voting system logic.
 """
 from tabulate import tabulate
+import numpy as np
 
 from table_util import entropy, add_totals
-from solution_util import solution_exists
+from solution_util import solution_exists, solution_exists_batch
 from apportion import apportion1d_general, \
     threshold_elimination_totals, threshold_elimination_constituencies
+from batch_util import apportion1d_general_batch, entropy_batch, \
+    threshold_elimination_batch, threshold_elimination_constituencies_batch
 from electionRules import ElectionRules
 from dictionaries import ADJUSTMENT_METHODS, DIVIDER_RULES, QUOTA_RULES
+from dictionaries import BATCH_ADJUSTMENT_METHODS
+from profiling import timed
 
 class Election:
     """A single election."""
@@ -18,6 +23,8 @@ class Election:
         self.num_parties = len(rules["parties"])
         self.rules = rules
         self.name = name
+        # State of alternating scaling to warm start from (see ScalingState).
+        self.scaling = None
         self.set_votes(votes)
 
     def entropy(self):
@@ -50,9 +57,12 @@ class Election:
         # Determine total seats in play:
         self.total_seats = sum(self.v_desired_row_sums)
 
-        self.run_primary_apportionment()
-        self.run_threshold_elimination()
-        self.run_determine_adjustment_seats()
+        with timed("primary apportionment"):
+            self.run_primary_apportionment()
+        with timed("threshold elimination"):
+            self.run_threshold_elimination()
+        with timed("adjustment seats determination"):
+            self.run_determine_adjustment_seats()
         self.run_adjustment_apportionment()
         return self.results
 
@@ -61,28 +71,14 @@ class Election:
         if self.rules["debug"]:
             print(" + Primary apportionment")
 
-        constituencies = self.rules["constituencies"]
         parties = self.rules["parties"]
 
         m_allocations = []
         self.last = []
         for i in range(self.num_constituencies):
-            num_seats = constituencies[i]["num_const_seats"]
-            if num_seats != 0:
-                alloc, _, last_in, _ = apportion1d_general(
-                    v_votes=self.m_votes[i],
-                    num_total_seats=num_seats,
-                    prior_allocations=[],
-                    rule=self.rules.get_generator("primary_divider"),
-                    type_of_rule=self.rules.get_type("primary_divider"),
-                    threshold=self.rules["constituency_threshold"]
-                )
-                assert last_in #last_in is not None because num_seats > 0
-                self.last.append(last_in["active_votes"])
-            else:
-                alloc = [0]*self.num_parties
-                self.last.append(0)
+            alloc, last = self.apportion_constituency(i)
             m_allocations.append(alloc)
+            self.last.append(last)
             # self.order.append(seats)
 
         # Useful:
@@ -93,6 +89,27 @@ class Election:
         self.m_const_seats_alloc = m_allocations
         self.v_const_seats_alloc = v_allocations
 
+    def apportion_constituency(self, i):
+        """
+        Apportion the constituency seats of constituency 'i'.
+        Outputs:
+            - the constituency seats of each party
+            - the active votes of the last seat (0 if there are no seats)
+        """
+        num_seats = self.rules["constituencies"][i]["num_const_seats"]
+        if num_seats == 0:
+            return [0]*self.num_parties, 0
+        alloc, _, last_in, _ = apportion1d_general(
+            v_votes=self.m_votes[i],
+            num_total_seats=num_seats,
+            prior_allocations=[],
+            rule=self.rules.get_generator("primary_divider"),
+            type_of_rule=self.rules.get_type("primary_divider"),
+            threshold=self.rules["constituency_threshold"]
+        )
+        assert last_in #last_in is not None because num_seats > 0
+        return alloc, last_in["active_votes"]
+
     def run_threshold_elimination(self):
         """Eliminate parties that do not reach the adjustment threshold."""
         if self.rules["debug"]:
@@ -124,33 +141,16 @@ class Election:
         """Conduct adjustment seat apportionment."""
         if self.rules["debug"]:
             print(" + Apportion adjustment seats")
-        method = ADJUSTMENT_METHODS[self.rules["adjustment_method"]]
         self.gen = self.rules.get_generator("adj_alloc_divider")
-        consts = self.rules["constituencies"]
 
-        self.solvable = solution_exists(
-            votes=self.m_votes_eliminated,
-            row_constraints=self.v_desired_row_sums,
-            col_constraints=self.v_desired_col_sums,
-            prior_allocations=self.m_const_seats_alloc)
+        with timed("solution_exists"):
+            self.solvable = solution_exists(
+                votes=self.m_votes_eliminated,
+                row_constraints=self.v_desired_row_sums,
+                col_constraints=self.v_desired_col_sums,
+                prior_allocations=self.m_const_seats_alloc)
 
-        #Some methods return a solution violating the constraints if necessary
-        try:
-            self.results, self.adj_seats_info = method(
-                m_votes=self.m_votes_eliminated,
-                v_desired_row_sums=self.v_desired_row_sums,
-                v_desired_col_sums=self.v_desired_col_sums,
-                m_prior_allocations=self.m_const_seats_alloc,
-                divisor_gen=self.gen,
-                adj_seat_gen=self.adj_seat_gen,
-                threshold=self.rules["adjustment_threshold"],
-                orig_votes=self.m_votes,
-                v_const_seats=[con["num_const_seats"] for con in consts],
-                last=self.last #for nearest_neighbor and relative_inferiority
-            )
-        except (ZeroDivisionError, RuntimeError):
-            self.results = self.m_const_seats_alloc
-            self.adj_seats_info = None
+        self.run_adjustment_method()
 
         v_results = [sum(x) for x in zip(*self.results)]
         devs = [abs(a-b) for a, b in zip(self.v_desired_col_sums, v_results)]
@@ -166,6 +166,198 @@ class Election:
         if self.rules["show_entropy"]:
             print("\nEntropy: %s" % self.entropy())
 
+    def run_adjustment_method(self):
+        """Apportion the adjustment seats by the adjustment method."""
+        method = ADJUSTMENT_METHODS[self.rules["adjustment_method"]]
+        consts = self.rules["constituencies"]
+        #Some methods return a solution violating the constraints if necessary
+        with timed("adjustment method: " + self.rules["adjustment_method"]):
+            try:
+                self.results, self.adj_seats_info = method(
+                    m_votes=self.m_votes_eliminated,
+                    v_desired_row_sums=self.v_desired_row_sums,
+                    v_desired_col_sums=self.v_desired_col_sums,
+                    m_prior_allocations=self.m_const_seats_alloc,
+                    divisor_gen=self.gen,
+                    adj_seat_gen=self.adj_seat_gen,
+                    threshold=self.rules["adjustment_threshold"],
+                    orig_votes=self.m_votes,
+                    v_const_seats=[con["num_const_seats"] for con in consts],
+                    last=self.last, #for nearest_neighbor and relative_inferiority
+                    scaling=self.scaling
+                )
+            except (ZeroDivisionError, RuntimeError):
+                self.results = self.m_const_seats_alloc
+                self.adj_seats_info = None
+
+
+class BatchElection:
+    """
+    A batch of elections under the same rules, one for each of the K vote
+    tables stacked in 'votes', computed with array operations.
+
+    The results are those Election gives for each vote table on its own.
+    Instead of raising ValueError, run() marks the vote tables for which
+    Election.run would raise it in 'failed'. Step-by-step information is
+    not collected.
+    """
+    def __init__(self, rules, votes):
+        self.num_constituencies = len(rules["constituencies"])
+        self.num_parties = len(rules["parties"])
+        self.rules = rules
+        self.m_votes = np.asarray(votes)
+        assert self.m_votes.shape[1:] == (self.num_constituencies,
+                                          self.num_parties)
+        self.num_elections = len(self.m_votes)
+        self.v_votes = self.m_votes.sum(axis=1)
+        self.scaling = None
+
+    def entropy(self):
+        """Entropies of the elections, and where entropy() fails."""
+        return entropy_batch(self.m_votes, self.results, self.gen)
+
+    def run(self, check_solvability=True):
+        """
+        Run the elections. Checking whether each election admits a solution
+        is relatively costly, and may be skipped if 'solvable' is not needed.
+        """
+        self.failed = np.zeros(self.num_elections, dtype=bool)
+        self.v_desired_row_sums = [
+            const["num_const_seats"] + const["num_adj_seats"]
+            for const in self.rules["constituencies"]
+        ]
+        self.total_seats = sum(self.v_desired_row_sums)
+
+        with timed("batch: primary apportionment"):
+            self.run_primary_apportionment()
+        with timed("batch: threshold elimination"):
+            self.run_threshold_elimination()
+        with timed("batch: adjustment seats determination"):
+            self.run_determine_adjustment_seats()
+        self.run_adjustment_apportionment(check_solvability)
+        return self.results
+
+    def run_primary_apportionment(self):
+        """Conduct primary apportionment"""
+        K = self.num_elections
+        m_allocations = np.zeros(self.m_votes.shape, dtype=int)
+        self.last = np.zeros((K, self.num_constituencies))
+        for i, const in enumerate(self.rules["constituencies"]):
+            num_seats = const["num_const_seats"]
+            if num_seats != 0:
+                m_allocations[:, i], _, self.last[:, i] = \
+                    apportion1d_general_batch(
+                        v_votes=self.m_votes[:, i],
+                        num_total_seats=num_seats,
+                        prior_allocations=None,
+                        rule=self.rules.get_generator("primary_divider"),
+                        type_of_rule=self.rules.get_type("primary_divider"),
+                        threshold=self.rules["constituency_threshold"]
+                    )
+
+        self.m_const_seats_alloc = m_allocations
+        self.v_const_seats_alloc = m_allocations.sum(axis=1)
+
+    def run_threshold_elimination(self):
+        """Eliminate parties that do not reach the adjustment threshold."""
+        self.m_votes_eliminated = threshold_elimination_constituencies_batch(
+            votes=self.m_votes,
+            threshold=self.rules["adjustment_threshold"]
+        )
+        self.v_votes_eliminated = threshold_elimination_batch(
+            v_votes=self.v_votes,
+            threshold=self.rules["adjustment_threshold"]
+        )
+
+    def run_determine_adjustment_seats(self):
+        """Calculate the number of adjustment seats each party gets."""
+        self.v_desired_col_sums, self.adj_seat_gen, _ = \
+            apportion1d_general_batch(
+                v_votes=self.v_votes,
+                num_total_seats=self.total_seats,
+                prior_allocations=self.v_const_seats_alloc,
+                rule=self.rules.get_generator("adj_determine_divider"),
+                type_of_rule=self.rules.get_type("adj_determine_divider"),
+                threshold=self.rules["adjustment_threshold"]
+            )
+        return self.v_desired_col_sums
+
+    def run_adjustment_apportionment(self, check_solvability=True):
+        """Conduct adjustment seat apportionment."""
+        self.gen = self.rules.get_generator("adj_alloc_divider")
+        consts = self.rules["constituencies"]
+
+        if check_solvability:
+            with timed("batch: solution_exists"):
+                self.solvable = solution_exists_batch(
+                    votes=self.m_votes_eliminated,
+                    row_constraints=self.v_desired_row_sums,
+                    col_constraints=self.v_desired_col_sums,
+                    prior_allocations=self.m_const_seats_alloc)
+
+        method = self.rules["adjustment_method"]
+        with timed("batch: adjustment method: " + method):
+            if method in BATCH_ADJUSTMENT_METHODS:
+                results, failed, fell_back = BATCH_ADJUSTMENT_METHODS[method](
+                    m_votes=self.m_votes_eliminated,
+                    v_desired_row_sums=self.v_desired_row_sums,
+                    v_desired_col_sums=self.v_desired_col_sums,
+                    m_prior_allocations=self.m_const_seats_alloc,
+                    divisor_gen=self.gen,
+                    adj_seat_gen=self.adj_seat_gen,
+                    threshold=self.rules["adjustment_threshold"],
+                    orig_votes=self.m_votes,
+                    v_const_seats=[con["num_const_seats"] for con in consts],
+                    last=self.last,
+                    scaling=self.scaling
+                )
+            else:
+                results, failed, fell_back = self.run_adjustment_method(
+                    ADJUSTMENT_METHODS[method])
+
+        #Some methods return a solution violating the constraints if necessary
+        self.failed |= failed
+        self.results = np.where(fell_back[:, None, None],
+                                self.m_const_seats_alloc, results)
+        v_results = self.results.sum(axis=1)
+        self.adj_dev = np.abs(self.v_desired_col_sums - v_results).sum(axis=1)
+
+    def run_adjustment_method(self, method):
+        """Run an adjustment method without a batch version on each election."""
+        K = self.num_elections
+        results = self.m_const_seats_alloc.copy()
+        failed = np.zeros(K, dtype=bool)
+        fell_back = np.zeros(K, dtype=bool)
+        consts = self.rules["constituencies"]
+        for k in range(K):
+            _, adj_seat_gen, _, _ = apportion1d_general(
+                v_votes=self.v_votes[k].tolist(),
+                num_total_seats=self.total_seats,
+                prior_allocations=self.v_const_seats_alloc[k].tolist(),
+                rule=self.rules.get_generator("adj_determine_divider"),
+                type_of_rule=self.rules.get_type("adj_determine_divider"),
+                threshold=self.rules["adjustment_threshold"]
+            )
+            try:
+                results[k], _ = method(
+                    m_votes=self.m_votes_eliminated[k].tolist(),
+                    v_desired_row_sums=self.v_desired_row_sums,
+                    v_desired_col_sums=self.v_desired_col_sums[k].tolist(),
+                    m_prior_allocations=self.m_const_seats_alloc[k].tolist(),
+                    divisor_gen=self.gen,
+                    adj_seat_gen=adj_seat_gen,
+                    threshold=self.rules["adjustment_threshold"],
+                    orig_votes=self.m_votes[k].tolist(),
+                    v_const_seats=[con["num_const_seats"] for con in consts],
+                    last=self.last[k].tolist(),
+                    scaling=self.scaling
+                )
+            except (ZeroDivisionError, RuntimeError):
+                fell_back[k] = True
+            except ValueError:
+                failed[k] = True
+        return results, failed, fell_back
+
 
 def run_script_election(rules):
     rs = ElectionRules()
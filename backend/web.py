@@ -94,6 +94,19 @@ def get_election_results():
 
     return jsonify([election.get_results_dict() for election in result])
 
+@app.route('/api/election/votes_to_change/', methods=["POST"])
+def get_votes_to_change():
+    try:
+        elections = handle_election().elections
+        num_workers = int(request.get_json(force=True).get("num_workers", 1))
+    except (KeyError, TypeError, ValueError) as e:
+        message = e.args[0]
+        print(message)
+        return jsonify({"error": message})
+
+    return jsonify([sim.votes_to_change(election, num_workers)
+                    for election in elections])
+
 @app.route('/api/election/getxlsx/', methods=['POST'])
 def get_election_excel():
     global DOWNLOADS
@@ -335,9 +348,12 @@ def check_simulation():
     simulation, thread, expiry = SIMULATIONS[data["sid"]]
     #if thread.done:
     #    del(SIMULATIONS[data["sid"]])
+    if "timing" in data:
+        simulation.timing = bool(data["timing"])
 
     return jsonify({
             "done": thread.done,
+            "timing": simulation.timing,
             "iteration": simulation.iteration,
             "iteration_time": simulation.iteration_time.seconds + (simulation.iteration_time.microseconds/1000000.0),
             "target": simulation.sim_rules["simulation_count"],